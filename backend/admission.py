@@ -0,0 +1,161 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+# Clients send either an absolute deadline (epoch seconds) or a relative
+# timeout in milliseconds; both are turned into a monotonic deadline.
+DEADLINE_HEADER = "x-request-deadline"
+TIMEOUT_HEADER = "x-request-timeout-ms"
+
+DEFAULT_CLASSES = {
+    # name: (max concurrent, max queued, max queue wait in ms)
+    "heavy": (8, 32, 2000),
+    "list": (16, 64, 2000),
+}
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded wait queue for one endpoint class.
+
+    Requests beyond ``max_concurrent`` wait in a queue of at most
+    ``max_queue`` entries; once the queue is full, or the wait exceeds
+    ``queue_timeout`` or the request deadline, the request is rejected with
+    a 503 before it touches Mongo.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.dropped_expired = 0
+
+    def reject(self, detail: str):
+        raise HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(max(1, round(self.queue_timeout)))},
+        )
+
+    async def acquire(self, deadline: Optional[float] = None):
+        now = time.monotonic()
+        if deadline is not None and deadline <= now:
+            self.dropped_expired += 1
+            self.reject("Prazo da requisição expirado")
+
+        if self.active < self.max_concurrent:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            self.reject("Servidor sobrecarregado, tente novamente")
+
+        timeout = self.queue_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - now)
+
+        # release() hands its slot directly to the oldest waiter, so active
+        # is not decremented/incremented in between and nobody can barge in.
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            self.reject("Servidor sobrecarregado, tente novamente")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_ms": int(self.queue_timeout * 1000),
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "dropped_expired": self.dropped_expired,
+        }
+
+
+def _limiter_from_env(name: str, defaults: tuple) -> AdmissionLimiter:
+    prefix = f"ADMISSION_{name.upper()}_"
+    concurrency, queue, timeout_ms = defaults
+    return AdmissionLimiter(
+        name,
+        int(os.environ.get(prefix + "CONCURRENCY", concurrency)),
+        int(os.environ.get(prefix + "QUEUE", queue)),
+        int(os.environ.get(prefix + "QUEUE_TIMEOUT_MS", timeout_ms)) / 1000,
+    )
+
+
+limiters: Dict[str, AdmissionLimiter] = {
+    name: _limiter_from_env(name, defaults) for name, defaults in DEFAULT_CLASSES.items()
+}
+
+
+def request_deadline(request: Request) -> Optional[float]:
+    """Monotonic deadline propagated by the client, if any."""
+    try:
+        if DEADLINE_HEADER in request.headers:
+            remaining = float(request.headers[DEADLINE_HEADER]) - time.time()
+            return time.monotonic() + remaining
+        if TIMEOUT_HEADER in request.headers:
+            return time.monotonic() + float(request.headers[TIMEOUT_HEADER]) / 1000
+    except ValueError:
+        pass
+    return None
+
+
+def admission(endpoint_class: str):
+    """Dependency that holds a slot of ``endpoint_class`` for the request."""
+    limiter = limiters[endpoint_class]
+
+    async def dependency(request: Request):
+        deadline = request_deadline(request)
+        await limiter.acquire(deadline)
+        try:
+            # The client may have given up while we were queued.
+            if (deadline is not None and deadline <= time.monotonic()) or await request.is_disconnected():
+                limiter.dropped_expired += 1
+                limiter.reject("Prazo da requisição expirado")
+            yield
+        finally:
+            limiter.release()
+
+    return dependency
+
+
+def admission_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
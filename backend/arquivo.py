@@ -0,0 +1,170 @@
+"""Monthly archive partitions for finished treinos.
+
+Completed treinos whose ``data`` is older than the horizon are moved in
+batches from ``treinos`` into ``treinos_arquivo_YYYY_MM``. The catalog
+collection ``treinos_particoes`` records every partition and how many
+treinos it holds, so readers can tell which partitions a date range
+touches and the dashboard can count archived treinos without scanning
+them.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable, List, Optional
+
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+import reservas
+from jobs import WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = "treinos_arquivo_"
+CATALOGO = "treinos_particoes"
+LEASE = "treinos_arquivamento"
+LEASE_DURACAO = timedelta(minutes=10)
+
+
+def particao_de(data: str) -> str:
+    """Monthly partition of a date ("2024-05-17" -> "2024_05")."""
+    return data[:7].replace("-", "_")
+
+
+def colecao_particao(db, particao: str):
+    return db[PREFIXO + particao]
+
+
+def estado_copiado(doc: dict) -> dict:
+    """Filter matching ``doc`` only while it is unchanged: same fields, same values."""
+    return {**doc, "$expr": {"$eq": [{"$size": {"$objectToArray": "$$ROOT"}}, len(doc)]}}
+
+
+async def obter_lease(db, duracao: timedelta = LEASE_DURACAO) -> bool:
+    """Take or renew this worker's lease on archiving ``db``."""
+    momento = datetime.now(timezone.utc)
+    try:
+        await db[LEASE].update_one(
+            {"_id": "arquivamento", "$or": [{"ate": {"$lt": momento}}, {"worker": WORKER_ID}]},
+            {"$set": {"worker": WORKER_ID, "ate": momento + duracao}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def arquivar(db, horizonte_dias: int, lote: int = 500, hoje: Optional[date] = None) -> int:
+    """Move completed treinos older than the horizon into their monthly partition.
+
+    Safe to re-run: each batch is copied (replacing copies an interrupted
+    run left behind) before it is deleted from the hot collection, and a
+    treino is only deleted while it still matches its copy. A treino edited
+    or deleted in between keeps its hot version and loses the copy, so it
+    is archived again later if still eligible. One worker per database
+    archives at a time, under a lease in ``treinos_arquivamento``.
+    """
+    limite = ((hoje or date.today()) - timedelta(days=horizonte_dias)).isoformat()
+    filtro = {"concluido": True, "data": {"$ne": None, "$lt": limite}}
+    try:
+        return await _arquivar_lotes(db, filtro, lote)
+    finally:
+        await db[LEASE].update_one({"_id": "arquivamento", "worker": WORKER_ID},
+                                   {"$set": {"ate": datetime.now(timezone.utc)}})
+
+
+async def _arquivar_lotes(db, filtro: dict, lote: int) -> int:
+    movidos = 0
+    while True:
+        if not await obter_lease(db):
+            return movidos
+        documentos = await db.treinos.find(filtro).sort("data", ASCENDING).limit(lote).to_list(lote)
+        if not documentos:
+            return movidos
+
+        por_particao = {}
+        for doc in documentos:
+            por_particao.setdefault(particao_de(doc['data']), []).append(doc)
+
+        for particao, docs in por_particao.items():
+            destino = colecao_particao(db, particao)
+            result = await destino.bulk_write([ReplaceOne({"_id": doc['_id']}, doc, upsert=True) for doc in docs],
+                                              ordered=False)
+            await destino.create_index([("data", ASCENDING)])
+            # Per-aluno lookups: cascades and progress summaries (see progresso.py)
+            await destino.create_index([("aluno_id_aluno", ASCENDING), ("concluido", ASCENDING), ("data", ASCENDING)])
+            await db[CATALOGO].update_one(
+                {"_id": particao},
+                {"$inc": {"total": result.upserted_count}, "$set": {"colecao": destino.name}},
+                upsert=True
+            )
+
+        removidos = await asyncio.gather(*(db.treinos.delete_one(estado_copiado(doc)) for doc in documentos))
+        arquivados = [doc['_id'] for doc, r in zip(documentos, removidos) if r.deleted_count]
+        divergentes = [doc for doc, r in zip(documentos, removidos) if not r.deleted_count]
+        for doc in divergentes:
+            particao = particao_de(doc['data'])
+            if (await colecao_particao(db, particao).delete_one({"_id": doc['_id']})).deleted_count:
+                await db[CATALOGO].update_one({"_id": particao}, {"$inc": {"total": -1}})
+        # Past days can no longer be booked, their slot intervals are dead weight
+        await reservas.liberar_muitos(db.reservas, [str(i) for i in arquivados])
+        movidos += len(arquivados)
+
+
+async def particoes(db, data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> List[str]:
+    """Partitions whose month intersects [data_inicio, data_fim]."""
+    filtro = {}
+    if data_inicio:
+        filtro.setdefault("_id", {})["$gte"] = particao_de(data_inicio)
+    if data_fim:
+        filtro.setdefault("_id", {})["$lte"] = particao_de(data_fim)
+    return [doc['_id'] async for doc in db[CATALOGO].find(filtro, {"_id": 1}).sort("_id", ASCENDING)]
+
+
+async def total_arquivado(db) -> int:
+    resultado = await db[CATALOGO].aggregate([{"$group": {"_id": None, "total": {"$sum": "$total"}}}]).to_list(1)
+    return resultado[0]['total'] if resultado else 0
+
+
+async def buscar(db, filtro: dict, data_inicio: Optional[str], data_fim: Optional[str], limite: int) -> list:
+    """Run ``filtro`` on every partition the range reaches, concurrently."""
+    nomes = await particoes(db, data_inicio, data_fim)
+    if not nomes:
+        return []
+    resultados = await asyncio.gather(*(
+        colecao_particao(db, nome).find(filtro).to_list(limite) for nome in nomes
+    ))
+    return [doc for docs in resultados for doc in docs]
+
+
+async def distintos(db, campo: str, filtro: dict) -> set:
+    """Distinct values of ``campo`` among matching archived treinos."""
+    valores = await asyncio.gather(
+        *(colecao_particao(db, nome).distinct(campo, filtro) for nome in await particoes(db))
+    )
+    return {v for vs in valores for v in vs}
+
+
+async def deletar(db, filtro: dict) -> int:
+    """Delete matching archived treinos and keep the catalog counts in step."""
+    removidos = 0
+    for nome in await particoes(db):
+        result = await colecao_particao(db, nome).delete_many(filtro)
+        if result.deleted_count:
+            await db[CATALOGO].update_one({"_id": nome}, {"$inc": {"total": -result.deleted_count}})
+            removidos += result.deleted_count
+    return removidos
+
+
+async def executar_periodicamente(bancos: Callable[[], Iterable], horizonte_dias: int, intervalo_horas: float,
+                                  lote: int):
+    """Archive every database returned by ``bancos`` (one per tenant) each interval."""
+    while True:
+        for db in bancos():
+            try:
+                movidos = await arquivar(db, horizonte_dias, lote)
+                if movidos:
+                    logger.info(f"Arquivamento ({db.name}): {movidos} treinos movidos para partições mensais")
+            except Exception:
+                logger.exception(f"Falha no arquivamento de treinos ({db.name})")
+        await asyncio.sleep(intervalo_horas * 3600)
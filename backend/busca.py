@@ -0,0 +1,121 @@
+"""Accent- and case-insensitive search over alunos and instrutores.
+
+Both storage engines keep the same precomputed keys next to every aluno
+and instrutor: ``busca_nome``, ``busca_email`` and ``busca_tokens``
+(see ``campos_busca``). Queries are anchored prefixes on those keys, so
+each candidate lookup is a bounded index range scan; ``ranquear`` merges
+the candidates the same way on every engine.
+"""
+import os
+import re
+import asyncio
+import unicodedata
+from typing import Callable, Iterable, Optional
+
+from pymongo import ASCENDING, TEXT, UpdateOne
+
+BUSCA_LIMITE_PADRAO = 20
+BUSCA_LIMITE_MAXIMO = 50
+# The text index is optional: prefix search on busca_tokens already covers
+# the UI, $text only adds whole-word matching for long multi-word queries.
+BUSCA_TEXTO = os.environ.get('BUSCA_TEXT_INDEX', 'false').lower() == 'true'
+BUSCA_PROJECAO = {"busca_nome": 0, "busca_email": 0, "busca_tokens": 0}
+
+
+def normalizar_busca(texto: Optional[str]) -> str:
+    """Lowercase, accent-folded form of a string ("José" -> "jose")."""
+    if not texto:
+        return ""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    sem_acento = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(sem_acento.casefold().split())
+
+
+def campos_busca(nome: Optional[str], email: Optional[str]) -> dict:
+    """Search keys stored alongside alunos and instrutores."""
+    busca_nome = normalizar_busca(nome)
+    busca_email = normalizar_busca(email)
+    tokens = set(re.split(r"[^a-z0-9]+", busca_nome))
+    if busca_email:
+        tokens.add(busca_email.split("@")[0])
+    return {
+        "busca_nome": busca_nome,
+        "busca_email": busca_email,
+        "busca_tokens": sorted(t for t in tokens if t),
+    }
+
+
+def tokens_consulta(termo: str) -> list:
+    return [t for t in re.split(r"[^a-z0-9@.]+", termo) if t]
+
+
+def limitar(limite: int) -> int:
+    return max(1, min(limite, BUSCA_LIMITE_MAXIMO))
+
+
+def ranquear(termo: str, por_nome: Iterable[dict], por_email: Iterable[dict], por_token: Iterable[dict],
+             limite: int, id_de: Callable[[dict], object]) -> list:
+    """Merge candidates as exact name > name prefix > email prefix > token prefix."""
+    ranking = {}
+    for rank, docs in ((1, por_nome), (2, por_email), (3, por_token)):
+        for doc in docs:
+            if rank == 1 and normalizar_busca(doc.get('nome')) == termo:
+                rank_doc = 0
+            else:
+                rank_doc = rank
+            atual = ranking.get(id_de(doc))
+            if atual is None or rank_doc < atual[0]:
+                ranking[id_de(doc)] = (rank_doc, doc)
+
+    ordenados = sorted(ranking.values(), key=lambda item: (item[0], normalizar_busca(item[1].get('nome'))))
+    return [doc for _, doc in ordenados[:limite]]
+
+
+async def buscar_documentos(colecao, q: str, limite: int) -> list:
+    """Ranked prefix search over the indexed busca_* keys of a Mongo collection."""
+    termo = normalizar_busca(q)
+    if not termo:
+        return []
+    limite = limitar(limite)
+    tokens = tokens_consulta(termo)
+    prefixo = {"$regex": f"^{re.escape(termo)}"}
+
+    consultas = [
+        colecao.find({"busca_nome": prefixo}, BUSCA_PROJECAO).sort("busca_nome", ASCENDING).limit(limite),
+        colecao.find({"busca_email": prefixo}, BUSCA_PROJECAO).sort("busca_email", ASCENDING).limit(limite),
+    ]
+    if BUSCA_TEXTO and len(tokens) > 1:
+        consultas.append(
+            colecao.find({"$text": {"$search": termo}}, {**BUSCA_PROJECAO, "score": {"$meta": "textScore"}})
+            .sort([("score", {"$meta": "textScore"})]).limit(limite)
+        )
+    else:
+        consultas.append(
+            colecao.find(
+                {"$and": [{"busca_tokens": re.compile(f"^{re.escape(t)}")} for t in tokens]},
+                BUSCA_PROJECAO
+            ).limit(limite)
+        )
+
+    por_nome, por_email, por_token = await asyncio.gather(*(c.to_list(limite) for c in consultas))
+    return ranquear(termo, por_nome, por_email, por_token, limite, lambda doc: doc['_id'])
+
+
+async def criar_indices_busca(colecao):
+    await colecao.create_index([("busca_nome", ASCENDING)])
+    await colecao.create_index([("busca_email", ASCENDING)])
+    await colecao.create_index([("busca_tokens", ASCENDING)])
+    if BUSCA_TEXTO:
+        await colecao.create_index([("busca_nome", TEXT), ("busca_email", TEXT)], default_language="portuguese")
+
+
+async def preencher_campos_busca(colecao, lote: int = 1000):
+    """Backfill busca_* keys on documents created before search existed."""
+    operacoes = []
+    async for doc in colecao.find({"busca_nome": {"$exists": False}}, {"nome": 1, "email": 1}):
+        operacoes.append(UpdateOne({"_id": doc['_id']}, {"$set": campos_busca(doc.get('nome'), doc.get('email'))}))
+        if len(operacoes) >= lote:
+            await colecao.bulk_write(operacoes, ordered=False)
+            operacoes = []
+    if operacoes:
+        await colecao.bulk_write(operacoes, ordered=False)
@@ -0,0 +1,285 @@
+"""Buffered ingestion of aluno check-ins.
+
+Besides arrivals (``tipo`` "checkin"), the same stream takes the
+completion of single exercises of a treino (``tipo`` "exercicio", with
+``treino_id`` and ``exercicio``); only arrivals count in the aggregates.
+
+Accepted check-ins are kept in a bounded in-process buffer and written
+with unordered ``insert_many`` into the ``checkins`` time-series
+collection, either when ``lote`` entries are waiting or every
+``intervalo`` seconds. When the buffer is full, callers wait up to
+``espera_maxima`` for a flush to make room and are then rejected with a
+503, so a burst slows producers down instead of growing memory.
+
+Every flush also maintains two aggregates incrementally: the aluno's
+``ultimo_checkin`` (``$max``) and the per-day count in
+``frequencia_diaria`` (``$inc``). If that update fails the affected days
+and alunos are recomputed from the check-ins (``recalcular_agregados``),
+and the reconciliation job recomputes everything. Entries remember their
+database, so one buffer serves every tenant. The writer is pluggable:
+``gravar_mongo`` by default, the SQLite engine passes its own (see
+repositorio_sqlite.py).
+
+A batch whose write fails is put back in front of the buffer and retried
+on the next flush, up to ``tentativas`` times. Check-ins carry their
+``_id`` from the start, so a retry after a partial write is rejected for
+the copies already stored (time-series collections do not enforce a
+unique ``_id``, where such a retry may store them twice).
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+COLECAO = "checkins"
+FREQUENCIA = "frequencia_diaria"
+CHEGADA = "checkin"
+EXERCICIO = "exercicio"
+TIPOS = (CHEGADA, EXERCICIO)
+
+
+async def criar_colecao(db):
+    try:
+        await db.create_collection(
+            COLECAO,
+            timeseries={"timeField": "momento", "metaField": "aluno_id_aluno", "granularity": "minutes"}
+        )
+    except CollectionInvalid:
+        return
+    except Exception as e:
+        # Servers without time-series support fall back to a regular collection
+        logger.warning(f"Coleção time-series de check-ins indisponível, usando coleção comum: {e}")
+    await db[COLECAO].create_index([("aluno_id_aluno", ASCENDING), ("momento", ASCENDING)])
+
+
+async def gravar_mongo(db, documentos: List[dict]) -> Tuple[int, int]:
+    """Insert a batch and update the aggregates; (written, rejected)."""
+    try:
+        await db[COLECAO].insert_many(documentos, ordered=False)
+        gravados, falhas = documentos, 0
+    except BulkWriteError as e:
+        falhos = {erro['index'] for erro in e.details.get('writeErrors', [])}
+        gravados = [doc for i, doc in enumerate(documentos) if i not in falhos]
+        falhas = len(falhos)
+        logger.warning(f"Check-ins rejeitados pelo banco ({db.name}): {falhas}")
+
+    chegadas = [doc for doc in gravados if doc.get('tipo', CHEGADA) == CHEGADA]
+    if chegadas:
+        await _atualizar_agregados(db, chegadas)
+    return len(gravados), falhas
+
+
+async def _atualizar_agregados(db, documentos: List[dict]):
+    ultimo = {}
+    for doc in documentos:
+        aluno = doc['aluno_id_aluno']
+        ultimo[aluno] = max(ultimo.get(aluno, doc['momento']), doc['momento'])
+    por_dia = Counter(doc['momento'].date().isoformat() for doc in documentos)
+
+    try:
+        await asyncio.gather(
+            db.alunos.bulk_write([
+                UpdateOne({"_id": aluno}, {"$max": {"ultimo_checkin": momento}})
+                for aluno, momento in ultimo.items()
+            ], ordered=False),
+            db[FREQUENCIA].bulk_write([
+                UpdateOne({"_id": dia}, {"$inc": {"checkins": total}}, upsert=True)
+                for dia, total in por_dia.items()
+            ], ordered=False),
+        )
+    except PyMongoError:
+        logger.exception(f"Falha ao atualizar agregados de check-ins ({db.name}), recalculando")
+        try:
+            # Some of the $inc may have applied: recount the days instead of retrying them
+            await recalcular_agregados(db, por_dia, ultimo)
+        except PyMongoError:
+            logger.exception(f"Agregados de check-ins divergentes ({db.name}); rode a reconciliação")
+
+
+async def recalcular_agregados(db, dias: Optional[Iterable[str]] = None,
+                               alunos: Optional[Iterable[ObjectId]] = None) -> Tuple[int, int]:
+    """Recompute the aggregates from the check-ins; (days, alunos) updated.
+
+    Limited to ``dias`` ("YYYY-MM-DD") and ``alunos`` when given, otherwise
+    every day and aluno with check-ins. A flush counting the same day at
+    the same time can be lost, so the full run belongs in a quiet moment.
+    """
+    # None skips that aggregate, {} covers every arrival
+    filtro_dias, filtro_alunos = {}, {}
+    if dias is not None:
+        inicios = [datetime.fromisoformat(dia).replace(tzinfo=timezone.utc) for dia in dias]
+        filtro_dias = {"$or": [
+            {"momento": {"$gte": inicio, "$lt": inicio + timedelta(days=1)}} for inicio in inicios
+        ]} if inicios else None
+    if alunos is not None:
+        alunos = list(alunos)
+        filtro_alunos = {"aluno_id_aluno": {"$in": alunos}} if alunos else None
+
+    contagens, ultimos = [], []
+    if filtro_dias is not None:
+        contagens = await db[COLECAO].aggregate([
+            {"$match": {**filtro_dias, "tipo": {"$ne": EXERCICIO}}},
+            {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$momento"}}, "checkins": {"$sum": 1}}},
+        ]).to_list(None)
+        if contagens:
+            await db[FREQUENCIA].bulk_write([
+                UpdateOne({"_id": c['_id']}, {"$set": {"checkins": c['checkins']}}, upsert=True) for c in contagens
+            ], ordered=False)
+    if filtro_alunos is not None:
+        ultimos = await db[COLECAO].aggregate([
+            {"$match": {**filtro_alunos, "tipo": {"$ne": EXERCICIO}}},
+            {"$group": {"_id": "$aluno_id_aluno", "momento": {"$max": "$momento"}}},
+        ]).to_list(None)
+        if ultimos:
+            await db.alunos.bulk_write([
+                UpdateOne({"_id": u['_id']}, {"$max": {"ultimo_checkin": u['momento']}}) for u in ultimos
+            ], ordered=False)
+    return len(contagens), len(ultimos)
+
+
+Gravador = Callable[[object, List[dict]], Awaitable[Tuple[int, int]]]
+
+
+class CheckinBuffer:
+    def __init__(self, capacidade: int = 10000, lote: int = 500, intervalo: float = 1.0, espera_maxima: float = 2.0,
+                 gravar: Optional[Gravador] = None, tentativas: int = 5):
+        self.gravar = gravar or gravar_mongo
+        self.tentativas = tentativas
+        self.capacidade = capacidade
+        self.lote = lote
+        self.intervalo = intervalo
+        self.espera_maxima = espera_maxima
+        self._itens: List[tuple] = []
+        self._espaco = asyncio.Condition()
+        self._flush_lock = asyncio.Lock()
+        self._flush_pendente: Optional[asyncio.Task] = None
+        self.aceitos = 0
+        self.gravados = 0
+        self.rejeitados = 0
+        self.falhas = 0
+        self.retentativas = 0
+        self.flushes = 0
+
+    async def adicionar(self, db, documentos: List[dict]):
+        """Queue ``documentos`` for ``db`` (a concrete database, not a proxy)."""
+        if len(documentos) > self.capacidade:
+            raise HTTPException(status_code=413, detail="Lote de check-ins maior que a capacidade do buffer")
+
+        async with self._espaco:
+            if len(self._itens) + len(documentos) > self.capacidade:
+                self._disparar_flush()
+                try:
+                    await asyncio.wait_for(
+                        self._espaco.wait_for(lambda: len(self._itens) + len(documentos) <= self.capacidade),
+                        self.espera_maxima
+                    )
+                except asyncio.TimeoutError:
+                    self.rejeitados += len(documentos)
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Ingestão de check-ins sobrecarregada",
+                        headers={"Retry-After": str(max(1, round(self.espera_maxima)))},
+                    )
+            self._itens.extend((db, doc, 0) for doc in documentos)
+            self.aceitos += len(documentos)
+
+        if len(self._itens) >= self.lote:
+            self._disparar_flush()
+
+    def _disparar_flush(self):
+        if self._flush_pendente is None or self._flush_pendente.done():
+            self._flush_pendente = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._itens:
+                lote, self._itens = self._itens[:self.lote], self._itens[self.lote:]
+                async with self._espaco:
+                    self._espaco.notify_all()
+
+                por_banco = {}
+                for db, doc, tentativa in lote:
+                    por_banco.setdefault(db.name, (db, []))[1].append((doc, tentativa))
+
+                devolvidos = []
+                for db, itens in por_banco.values():
+                    devolvidos += await self._gravar(db, itens)
+                self.flushes += 1
+                if devolvidos:
+                    # Back in front, in order; retried on the next flush rather than in a tight loop
+                    self._itens[:0] = devolvidos
+                    break
+
+    async def _gravar(self, db, itens: List[tuple]) -> List[tuple]:
+        """Write one database's share of a batch; the entries to retry."""
+        try:
+            gravados, falhas = await self.gravar(db, [doc for doc, _ in itens])
+        except Exception:
+            devolvidos = [(db, doc, tentativa + 1) for doc, tentativa in itens if tentativa + 1 < self.tentativas]
+            self.falhas += len(itens) - len(devolvidos)
+            self.retentativas += len(devolvidos)
+            logger.exception(f"Falha ao gravar check-ins ({db.name}), {len(devolvidos)} voltam ao buffer")
+            return devolvidos
+        self.gravados += gravados
+        self.falhas += falhas
+        return []
+
+    async def executar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                # Shielded: cancelling this loop on shutdown must not drop a batch mid-write
+                await asyncio.shield(self.flush())
+            except Exception:
+                logger.exception("Falha no flush de check-ins")
+
+    async def fechar(self):
+        """Flush whatever is still buffered; called on shutdown.
+
+        Waits for a flush already running (its lock) or already triggered
+        by a full buffer, then writes what is left.
+        """
+        if self._flush_pendente is not None:
+            await asyncio.gather(self._flush_pendente, return_exceptions=True)
+        await self.flush()
+        if self._itens:
+            logger.error(f"{len(self._itens)} check-ins não gravados no encerramento")
+
+    def stats(self) -> dict:
+        return {
+            "pendentes": len(self._itens),
+            "capacidade": self.capacidade,
+            "lote": self.lote,
+            "intervalo_s": self.intervalo,
+            "aceitos": self.aceitos,
+            "gravados": self.gravados,
+            "rejeitados": self.rejeitados,
+            "falhas": self.falhas,
+            "retentativas": self.retentativas,
+            "flushes": self.flushes,
+        }
+
+
+def documento(aluno_id: str, momento: Optional[datetime], origem: Optional[str], tipo: str = CHEGADA,
+              treino_id: Optional[str] = None, exercicio: Optional[str] = None) -> dict:
+    momento = momento or datetime.now(timezone.utc)
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    doc = {
+        "_id": ObjectId(),
+        "aluno_id_aluno": ObjectId(aluno_id),
+        "momento": momento.astimezone(timezone.utc),
+        "origem": origem,
+        "tipo": tipo,
+    }
+    if tipo == EXERCICIO:
+        doc.update(treino_id=ObjectId(treino_id), exercicio=exercicio)
+    return doc
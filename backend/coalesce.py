@@ -0,0 +1,86 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from fastapi import Request
+
+
+class SingleFlight:
+    """Share one in-flight computation between identical concurrent reads.
+
+    The first caller for a key starts the computation as its own task and
+    every caller arriving while it runs awaits the same task, so a burst of
+    N identical requests costs one round of queries. With ``ttl`` > 0 the
+    result is also reused for that many seconds after it completes.
+
+    Keys include a generation number that ``invalidate()`` bumps; writes
+    call it so a read that starts after a write never joins (or reuses)
+    a computation that may predate it.
+    """
+
+    def __init__(self, ttl: float = 0.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self._recent: Dict[Tuple, Tuple[float, Any]] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.ttl_hits = 0
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        full_key = (self.generation, key)
+
+        if self.ttl > 0:
+            cached = self._recent.get(full_key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.ttl_hits += 1
+                return cached[1]
+
+        task = self._inflight.get(full_key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[full_key] = task
+            task.add_done_callback(lambda t: self._finished(full_key, t))
+
+        # shield: a caller that disconnects must not cancel the shared task.
+        return await asyncio.shield(task)
+
+    def _finished(self, full_key: Tuple, task: asyncio.Task):
+        self._inflight.pop(full_key, None)
+        if self.ttl <= 0 or task.cancelled() or task.exception() is not None:
+            return
+        if full_key[0] != self.generation:
+            return
+        if len(self._recent) >= self.max_entries:
+            now = time.monotonic()
+            self._recent = {k: v for k, v in self._recent.items() if v[0] > now and k[0] == self.generation}
+            if len(self._recent) >= self.max_entries:
+                return
+        self._recent[full_key] = (time.monotonic() + self.ttl, task.result())
+
+    def invalidate(self):
+        self.generation += 1
+        self._recent.clear()
+
+    def stats(self) -> dict:
+        return {
+            "ttl_ms": int(self.ttl * 1000),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "ttl_hits": self.ttl_hits,
+            "in_flight": len(self._inflight),
+        }
+
+
+def request_key(request: Request, ignore: Tuple[str, ...] = ("format",)) -> Tuple:
+    """Route path plus query parameters in a canonical order.
+
+    Parameters that only change the encoding of the result (``format``)
+    are left out so row and columnar clients share the computation.
+    """
+    params = sorted(item for item in request.query_params.multi_items() if item[0] not in ignore)
+    return (request.url.path, tuple(params))
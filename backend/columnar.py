@@ -0,0 +1,97 @@
+import json
+import gzip
+from typing import Iterable, List, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.gymtrack.columnar+json"
+# Below this size compression costs more than it saves on the wire.
+COMPRESS_MIN_SIZE = 1024
+
+
+def wants_columnar(request: Request, format: Optional[str] = None) -> bool:
+    """Columnar is opt-in, through ?format=columnar or the Accept header."""
+    if format:
+        return format.lower() == "columnar"
+    return COLUMNAR_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def encode_columnar(rows: Iterable[dict], fields: Sequence[str],
+                    dictionary_fields: Sequence[str] = (), defaults: Optional[dict] = None) -> dict:
+    """Turn a list of row dicts into one array per field.
+
+    Fields listed in ``dictionary_fields`` are dictionary encoded: their
+    column holds integer indexes into ``dictionaries[field]`` (None stays
+    None), so a value such as an instructor name is sent once instead of
+    once per row.
+    """
+    defaults = defaults or {}
+    columns = {field: [] for field in fields}
+    dictionaries = {field: [] for field in dictionary_fields if field in columns}
+    positions = {field: {} for field in dictionaries}
+    count = 0
+
+    for row in rows:
+        count += 1
+        for field in fields:
+            value = row.get(field, defaults.get(field))
+            if field in positions and value is not None:
+                index = positions[field].get(value)
+                if index is None:
+                    index = positions[field][value] = len(dictionaries[field])
+                    dictionaries[field].append(value)
+                value = index
+            columns[field].append(value)
+
+    return {
+        "format": "columnar",
+        "count": count,
+        "fields": list(fields),
+        "columns": columns,
+        "dictionaries": dictionaries,
+    }
+
+
+def model_fields_and_defaults(model) -> tuple:
+    fields: List[str] = list(model.model_fields)
+    defaults = {
+        name: info.default
+        for name, info in model.model_fields.items()
+        if not info.is_required()
+    }
+    return fields, defaults
+
+
+def columnar_response(request: Request, rows: Iterable[dict], model,
+                      dictionary_fields: Sequence[str] = ()) -> Response:
+    """Encode ``rows`` with the fields of ``model`` and compress the body.
+
+    Rows go through ``model`` like the ``response_model`` of the row
+    format, so both formats validate the same way and encode each value
+    (dates in particular) identically. Brotli is preferred when the client
+    accepts it and the package is installed, otherwise gzip. Setting
+    Content-Encoding here makes the app-wide GZipMiddleware pass the body
+    through untouched.
+    """
+    fields, defaults = model_fields_and_defaults(model)
+    validated = (model.model_validate(row).model_dump(mode="json") for row in rows)
+    payload = encode_columnar(validated, fields, dictionary_fields, defaults)
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if len(body) >= COMPRESS_MIN_SIZE:
+        if brotli is not None and "br" in accept_encoding:
+            body = brotli.compress(body, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accept_encoding:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type=COLUMNAR_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,305 @@
+"""Idempotent retries of create and bulk requests.
+
+A client that may retry a POST sends an ``Idempotency-Key`` header, any
+unique string per logical operation (a UUID, say). The first request with
+a key runs normally and its response is stored for ``ttl``: on Mongo in
+the TTL-indexed ``idempotencia`` collection, on SQLite in a table purged
+as it is written (see repositorio.py), with an in-process LRU in front.
+A retry with the same key gets the stored response back, marked
+``Idempotent-Replayed: true``, without running the handler again.
+
+A retry arriving while the first request is still running waits for its
+result instead of running twice: in the same process on the first
+request's future, across workers by polling the stored reservation. A
+reservation whose worker died is taken over once its lease expires.
+
+Keys are scoped per tenant and admin, and are bound to the request they
+first came with: reusing one with another method, path, query or body is
+rejected with 422. Only outcomes a retry would repeat are stored (2xx and
+4xx other than 401/403/408/429); after a 5xx, or when the response is too
+large to keep, the reservation is released and the next retry runs again.
+"""
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+import jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from tenancy import tenant_atual
+
+IDEMPOTENCIA_HEADER = "idempotency-key"
+REPETIDA_HEADER = "Idempotent-Replayed"
+TAMANHO_MAX_CHAVE = 255
+# Outcomes that may change on a retry: refreshed token, overload cleared
+STATUS_NAO_ARMAZENADOS = {401, 403, 408, 429}
+# Recomputed on replay, or only meaningful for the original response
+HEADERS_NAO_ARMAZENADOS = {"content-length", "date", "server", "x-consistencia"}
+INTERVALO_ESPERA_S = 0.1
+# _reservar: another worker held the key past the wait
+ESGOTADA = "esgotada"
+
+
+def impressao(metodo: str, caminho: str, query: bytes, corpo: bytes) -> str:
+    """Fingerprint of the request a key was first used with."""
+    h = hashlib.sha256()
+    for parte in (metodo.encode(), caminho.encode(), query, corpo):
+        h.update(len(parte).to_bytes(8, "big"))
+        h.update(parte)
+    return h.hexdigest()
+
+
+class CacheRespostas:
+    """LRU of completed records, bounded by the total size of their bodies."""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def get(self, chave: tuple) -> Optional[dict]:
+        entry = self._entries.get(chave)
+        if entry is None:
+            return None
+        expira, registro = entry
+        if expira <= time.monotonic():
+            self._remover(chave)
+            return None
+        self._entries.move_to_end(chave)
+        return registro
+
+    def put(self, chave: tuple, registro: dict):
+        if len(registro['corpo']) > self.max_bytes:
+            return
+        self._remover(chave)
+        self._entries[chave] = (time.monotonic() + self.ttl, registro)
+        self.bytes += len(registro['corpo'])
+        while self.bytes > self.max_bytes:
+            self._remover(next(iter(self._entries)))
+
+    def _remover(self, chave: tuple):
+        entry = self._entries.pop(chave, None)
+        if entry is not None:
+            self.bytes -= len(entry[1]['corpo'])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RespostasIdempotentes:
+    """Runs each (tenant, key) once and replays its stored response.
+
+    ``armazenamento`` is the engine's ``RepositorioIdempotencia``.
+    """
+
+    def __init__(self, armazenamento, ttl: timedelta = timedelta(hours=24), lease: timedelta = timedelta(seconds=60),
+                 espera: float = 30.0, max_bytes_resposta: int = 256 * 1024, max_bytes_cache: int = 32 * 1024 * 1024):
+        self.armazenamento = armazenamento
+        self.ttl = ttl
+        self.lease = lease
+        self.espera = espera
+        self.max_bytes_resposta = max_bytes_resposta
+        self.cache = CacheRespostas(max_bytes_cache, ttl.total_seconds())
+        self._em_andamento: Dict[tuple, asyncio.Future] = {}
+        self.execucoes = 0
+        self.repeticoes = 0
+        self.repeticoes_cache = 0
+        self.esperas = 0
+        self.divergentes = 0
+        self.esgotadas = 0
+
+    async def processar(self, scope, receive, send, chave: str, impressao_requisicao: str, app):
+        local = (tenant_atual.get(), chave)
+        prazo = time.monotonic() + self.espera
+
+        while True:
+            registro = self.cache.get(local)
+            if registro is not None:
+                self.repeticoes_cache += 1
+                await self._responder(registro, impressao_requisicao, scope, receive, send)
+                return
+            anterior = self._em_andamento.get(local)
+            if anterior is None:
+                break
+            # The first request runs in this process: wait for it, then look again
+            self.esperas += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(anterior), prazo - time.monotonic())
+            except asyncio.TimeoutError:
+                await self._esgotada(scope, receive, send)
+                return
+
+        futuro = self._em_andamento[local] = asyncio.get_running_loop().create_future()
+        try:
+            registro = await self._reservar(chave, impressao_requisicao, prazo)
+            if registro is None:
+                self.execucoes += 1
+                registro = await self._executar(scope, receive, send, chave, impressao_requisicao, app)
+                if registro is not None:
+                    self.cache.put(local, registro)
+                return
+            if registro is ESGOTADA:
+                await self._esgotada(scope, receive, send)
+                return
+            if registro['impressao'] == impressao_requisicao:
+                self.repeticoes += 1
+                self.cache.put(local, registro)
+            await self._responder(registro, impressao_requisicao, scope, receive, send)
+        finally:
+            del self._em_andamento[local]
+            futuro.set_result(None)
+
+    async def _reservar(self, chave: str, impressao_requisicao: str, prazo: float):
+        """None once the key is ours, else the stored record, or ESGOTADA."""
+        while True:
+            registro = await self.armazenamento.reservar(chave, impressao_requisicao, self.lease, self.ttl)
+            if registro is None or registro['estado'] == "concluida" or registro['impressao'] != impressao_requisicao:
+                return registro
+            # Another worker is running it; reservar takes over if its lease expires
+            self.esperas += 1
+            if time.monotonic() + INTERVALO_ESPERA_S > prazo:
+                return ESGOTADA
+            await asyncio.sleep(INTERVALO_ESPERA_S)
+
+    async def _executar(self, scope, receive, send, chave: str, impressao_requisicao: str, app) -> Optional[dict]:
+        resposta = {"status": 500, "headers": [], "corpo": []}
+        tamanho = 0
+
+        async def send_capturando(message):
+            nonlocal tamanho
+            if message["type"] == "http.response.start":
+                resposta["status"] = message["status"]
+                resposta["headers"] = [
+                    [k.decode("latin-1"), v.decode("latin-1")] for k, v in message.get("headers", [])
+                    if k.decode("latin-1").lower() not in HEADERS_NAO_ARMAZENADOS
+                ]
+            elif message["type"] == "http.response.body":
+                tamanho += len(message.get("body", b""))
+                if tamanho <= self.max_bytes_resposta:
+                    resposta["corpo"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await app(scope, receive, send_capturando)
+        except BaseException:
+            await asyncio.shield(self.armazenamento.liberar(chave))
+            raise
+
+        status = resposta["status"]
+        if status >= 500 or status in STATUS_NAO_ARMAZENADOS or tamanho > self.max_bytes_resposta:
+            await self.armazenamento.liberar(chave)
+            return None
+        registro = {
+            "impressao": impressao_requisicao, "estado": "concluida",
+            "status": status, "headers": resposta["headers"], "corpo": b"".join(resposta["corpo"]),
+        }
+        await self.armazenamento.concluir(chave, registro, self.ttl)
+        return registro
+
+    async def _responder(self, registro: dict, impressao_requisicao: str, scope, receive, send):
+        if registro['impressao'] != impressao_requisicao:
+            self.divergentes += 1
+            await JSONResponse(
+                {"detail": "Idempotency-Key já usada com outra requisição"}, status_code=422
+            )(scope, receive, send)
+            return
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in registro['headers']]
+        headers += [
+            (b"content-length", str(len(registro['corpo'])).encode()),
+            (REPETIDA_HEADER.lower().encode(), b"true"),
+        ]
+        await send({"type": "http.response.start", "status": registro['status'], "headers": headers})
+        await send({"type": "http.response.body", "body": registro['corpo']})
+
+    async def _esgotada(self, scope, receive, send):
+        self.esgotadas += 1
+        await JSONResponse(
+            {"detail": "Requisição com esta Idempotency-Key ainda em andamento"}, status_code=409
+        )(scope, receive, send)
+
+    def stats(self) -> dict:
+        return {
+            "execucoes": self.execucoes,
+            "repeticoes": self.repeticoes,
+            "repeticoes_cache": self.repeticoes_cache,
+            "esperas": self.esperas,
+            "divergentes": self.divergentes,
+            "esgotadas": self.esgotadas,
+            "em_andamento": len(self._em_andamento),
+            "cache_entradas": len(self.cache),
+            "cache_bytes": self.cache.bytes,
+        }
+
+
+async def ler_corpo(receive) -> Tuple[bytes, object]:
+    """The whole request body, and a ``receive`` that hands it to the app again."""
+    partes = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        partes.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    corpo = b"".join(partes)
+    entregue = False
+
+    async def receive_de_novo():
+        nonlocal entregue
+        if not entregue:
+            entregue = True
+            return {"type": "http.request", "body": corpo, "more_body": False}
+        return await receive()
+
+    return corpo, receive_de_novo
+
+
+class IdempotenciaMiddleware:
+    """Applies ``RespostasIdempotentes`` to authenticated POSTs with an ``Idempotency-Key``.
+
+    Sits inside ``TenantMiddleware``. Requests without a valid token pass
+    through untouched, so ``verify_token`` answers them as usual and a
+    stored response is never handed to an unauthenticated caller.
+    """
+
+    def __init__(self, app, respostas: RespostasIdempotentes, secret: str, algorithm: str,
+                 ignorar: tuple = ("/api/auth/login",)):
+        self.app = app
+        self.respostas = respostas
+        self.secret = secret
+        self.algorithm = algorithm
+        self.ignorar = set(ignorar)
+
+    def admin(self, headers: Headers) -> Optional[str]:
+        autorizacao = headers.get("authorization", "")
+        if not autorizacao.lower().startswith("bearer "):
+            return None
+        try:
+            payload = jwt.decode(autorizacao[7:], self.secret, algorithms=[self.algorithm])
+        except jwt.InvalidTokenError:
+            return None
+        return payload.get("admin_id")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] in self.ignorar:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        chave = headers.get(IDEMPOTENCIA_HEADER)
+        admin = self.admin(headers) if chave is not None else None
+        if admin is None:
+            await self.app(scope, receive, send)
+            return
+        if not chave or len(chave) > TAMANHO_MAX_CHAVE or not chave.isprintable():
+            await JSONResponse({"detail": "Idempotency-Key inválida"}, status_code=400)(scope, receive, send)
+            return
+
+        corpo, receive = await ler_corpo(receive)
+        impressao_requisicao = impressao(scope["method"], scope["path"], scope.get("query_string", b""), corpo)
+        await self.respostas.processar(scope, receive, send, f"{admin}:{chave}", impressao_requisicao, self.app)
@@ -0,0 +1,229 @@
+"""Background jobs persisted in Mongo.
+
+Jobs live in the ``jobs`` collection of their tenant's database. A worker
+claims a pending job with an atomic ``find_one_and_update`` that sets a
+lease; the handler processes the job in batches and calls
+``JobContext.checkpoint`` after each one, which stores its progress,
+renews the lease and sleeps for ``pausa`` to throttle the load. If the
+process dies, the lease expires and any worker resumes the job from its
+last checkpoint, so handlers must make every batch idempotent. Each
+takeover counts as an attempt, so a job that keeps killing its worker
+ends up ``falhou`` after ``max_tentativas``.
+"""
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+COLECAO = "jobs"
+WORKER_ID = uuid.uuid4().hex
+
+
+class JobPerdido(Exception):
+    """The lease expired and another worker took the job over."""
+
+
+class JobContext:
+    def __init__(self, runner: "JobRunner", db, job: dict):
+        self.runner = runner
+        self.db = db
+        self.job = job
+        self.params = job.get('params', {})
+        self.estado = job.get('estado', {})
+        self.processados = job.get('processados', 0)
+        self.lote = runner.lote
+
+    async def checkpoint(self, processados: int = 0, **estado):
+        self.processados += processados
+        self.estado.update(estado)
+        result = await self.db[COLECAO].update_one(
+            {"_id": self.job['_id'], "worker": WORKER_ID},
+            {"$set": {
+                "estado": self.estado,
+                "processados": self.processados,
+                "lease_ate": agora() + self.runner.lease,
+                "atualizado_em": agora(),
+            }}
+        )
+        if result.matched_count == 0:
+            raise JobPerdido()
+        if self.runner.pausa:
+            await asyncio.sleep(self.runner.pausa)
+
+
+Handler = Callable[[JobContext], Awaitable[Optional[dict]]]
+
+
+def agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def serializar(job: dict) -> dict:
+    return {
+        "id_job": str(job['_id']),
+        "tipo": job['tipo'],
+        "status": job['status'],
+        "params": job.get('params', {}),
+        "processados": job.get('processados', 0),
+        "resultado": job.get('resultado'),
+        "erro": job.get('erro'),
+        "tentativas": job.get('tentativas', 0),
+        "criado_em": job.get('criado_em'),
+        "atualizado_em": job.get('atualizado_em'),
+        "concluido_em": job.get('concluido_em'),
+    }
+
+
+async def criar_indices(db):
+    await db[COLECAO].create_index([("status", ASCENDING), ("criado_em", ASCENDING)])
+
+
+class JobRunner:
+    def __init__(self, lote: int = 200, pausa: float = 0.1, intervalo: float = 5.0,
+                 lease: float = 60.0, max_tentativas: int = 3):
+        self.handlers: Dict[str, Handler] = {}
+        self.lote = lote
+        self.pausa = pausa
+        self.intervalo = intervalo
+        self.lease = timedelta(seconds=lease)
+        self.max_tentativas = max_tentativas
+        self._acordar = asyncio.Event()
+        self.executados = 0
+        self.falhas = 0
+
+    def handler(self, tipo: str):
+        def registrar(fn: Handler) -> Handler:
+            self.handlers[tipo] = fn
+            return fn
+        return registrar
+
+    async def enfileirar(self, db, tipo: str, params: dict) -> str:
+        if tipo not in self.handlers:
+            raise ValueError(f"Tipo de job desconhecido: {tipo}")
+        job = {
+            "tipo": tipo,
+            "params": params,
+            "status": "pendente",
+            "estado": {},
+            "processados": 0,
+            "tentativas": 0,
+            "criado_em": agora(),
+            "atualizado_em": agora(),
+        }
+        result = await db[COLECAO].insert_one(job)
+        self._acordar.set()
+        return str(result.inserted_id)
+
+    async def obter(self, db, id_job: str) -> Optional[dict]:
+        if not ObjectId.is_valid(id_job):
+            return None
+        return await db[COLECAO].find_one({"_id": ObjectId(id_job)})
+
+    async def listar(self, db, status: Optional[str] = None, limite: int = 50) -> list:
+        filtro = {"status": status} if status else {}
+        return await db[COLECAO].find(filtro).sort("criado_em", DESCENDING).limit(limite).to_list(limite)
+
+    async def reivindicar(self, db) -> Optional[dict]:
+        """Claim a job whose worker's lease expired, else the oldest pending one.
+
+        A worker that dies mid-job (OOM, crash) never records the failure, so
+        taking its job over counts as an attempt; a job that has used up
+        ``max_tentativas`` that way is marked ``falhou`` instead.
+        """
+        momento = agora()
+        abandonado = {"status": "executando", "lease_ate": {"$lt": momento}}
+        await db[COLECAO].update_many(
+            {**abandonado, "tentativas": {"$gte": self.max_tentativas - 1}},
+            {"$set": {"status": "falhou", "erro": "Worker interrompido durante a execução", "atualizado_em": momento},
+             "$inc": {"tentativas": 1}, "$unset": {"worker": "", "lease_ate": ""}}
+        )
+        reivindicar = {"status": "executando", "worker": WORKER_ID, "lease_ate": momento + self.lease,
+                       "atualizado_em": momento}
+        job = await db[COLECAO].find_one_and_update(
+            abandonado, {"$set": reivindicar, "$inc": {"tentativas": 1}},
+            sort=[("criado_em", ASCENDING)], return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            return job
+        return await db[COLECAO].find_one_and_update(
+            {"status": "pendente"}, {"$set": reivindicar},
+            sort=[("criado_em", ASCENDING)], return_document=ReturnDocument.AFTER,
+        )
+
+    async def executar(self, db, job: dict):
+        ctx = JobContext(self, db, job)
+        try:
+            resultado = await self.handlers[job['tipo']](ctx)
+        except JobPerdido:
+            logger.warning(f"Job {job['_id']} assumido por outro worker")
+            return
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back instead of waiting for the lease
+            await db[COLECAO].update_one(
+                {"_id": job['_id'], "worker": WORKER_ID},
+                {"$set": {"status": "pendente", "atualizado_em": agora()}, "$unset": {"worker": "", "lease_ate": ""}}
+            )
+            raise
+        except Exception as e:
+            self.falhas += 1
+            logger.exception(f"Falha no job {job['_id']} ({job['tipo']})")
+            tentativas = job.get('tentativas', 0) + 1
+            await db[COLECAO].update_one(
+                {"_id": job['_id'], "worker": WORKER_ID},
+                {"$set": {
+                    "status": "pendente" if tentativas < self.max_tentativas else "falhou",
+                    "tentativas": tentativas,
+                    "erro": str(e),
+                    "atualizado_em": agora(),
+                }, "$unset": {"worker": "", "lease_ate": ""}}
+            )
+            return
+
+        self.executados += 1
+        await db[COLECAO].update_one(
+            {"_id": job['_id'], "worker": WORKER_ID},
+            {"$set": {"status": "concluido", "resultado": resultado, "processados": ctx.processados,
+                      "concluido_em": agora(), "atualizado_em": agora()},
+             "$unset": {"lease_ate": ""}}
+        )
+
+    async def executar_pendentes(self, bancos: Callable[[], Iterable]) -> int:
+        executados = 0
+        for db in bancos():
+            while True:
+                job = await self.reivindicar(db)
+                if job is None:
+                    break
+                await self.executar(db, job)
+                executados += 1
+        return executados
+
+    async def executar_periodicamente(self, bancos: Callable[[], Iterable]):
+        while True:
+            self._acordar.clear()
+            try:
+                await self.executar_pendentes(bancos)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha no executor de jobs")
+            try:
+                await asyncio.wait_for(self._acordar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "worker": WORKER_ID,
+            "tipos": sorted(self.handlers),
+            "executados": self.executados,
+            "falhas": self.falhas,
+            "lote": self.lote,
+            "pausa_s": self.pausa,
+        }
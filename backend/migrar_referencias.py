@@ -0,0 +1,219 @@
+"""Online migration of instrutor/aluno references from hex strings to ObjectId.
+
+    python migrar_referencias.py relatorio --rotulo antes
+    python migrar_referencias.py migrar
+    python migrar_referencias.py relatorio --rotulo depois
+
+``migrar`` walks ``treinos``, the archive partitions and ``agendas_fixas``
+in ``_id`` order, converting string references in small batches while the
+API keeps running. Every update is conditioned on the old value, so a
+document the API rewrote in the meantime is left alone (the API already
+writes ObjectId). Progress is checkpointed in ``migracoes`` after each
+batch; an interrupted run resumes where it stopped. Deploy the API with
+``referencias.py`` everywhere before migrating, and set ``REFS_LEGADO=false``
+once every tenant database reports no string references left.
+
+``relatorio`` records the size of the reference indexes and the latency of
+a ``$lookup`` join on them, appending one JSON line per run to ``--saida``
+so the numbers before and after the migration can be compared. Its reads
+go to secondaries when there are any (``secondaryPreferred``, see
+replicas.py); ``migrar`` writes, so it stays on the primary.
+"""
+import os
+import json
+import time
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+import arquivo
+import replicas
+from referencias import CAMPOS
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+app = typer.Typer(help="Migração das referências de instrutor/aluno para ObjectId")
+
+CHECKPOINTS = "migracoes"
+MIGRACAO = "referencias_objectid"
+
+# Joins measured by ``relatorio``: (collection, reference field, joined collection)
+JUNCOES = [
+    ("treinos", "aluno_id_aluno", "alunos"),
+    ("treinos", "instrutor_id_instrutor", "instrutores"),
+    ("agendas_fixas", "instrutor_id_instrutor", "instrutores"),
+]
+
+
+async def colecoes_alvo(db) -> List[tuple]:
+    """(collection name, reference fields) of every collection holding references."""
+    alvos = [("treinos", CAMPOS["treinos"]), ("agendas_fixas", CAMPOS["agendas_fixas"])]
+    alvos += [(arquivo.PREFIXO + nome, CAMPOS["treinos"]) for nome in await arquivo.particoes(db)]
+    return alvos
+
+
+async def migrar_colecao(db, nome: str, campos: tuple, lote: int, pausa: float, reiniciar: bool) -> dict:
+    checkpoint_id = f"{MIGRACAO}:{nome}"
+    checkpoint = None if reiniciar else await db[CHECKPOINTS].find_one({"_id": checkpoint_id})
+    if checkpoint and checkpoint.get("concluido"):
+        return checkpoint
+
+    ultimo_id = checkpoint["ultimo_id"] if checkpoint else None
+    convertidos = checkpoint.get("convertidos", 0) if checkpoint else 0
+    invalidos = checkpoint.get("invalidos", 0) if checkpoint else 0
+    colecao = db[nome]
+    filtro_string = {"$or": [{campo: {"$type": "string"}} for campo in campos]}
+
+    while True:
+        filtro = dict(filtro_string)
+        if ultimo_id is not None:
+            filtro["_id"] = {"$gt": ultimo_id}
+        documentos = await colecao.find(filtro, {campo: 1 for campo in campos}).sort("_id", 1).limit(lote).to_list(lote)
+        if not documentos:
+            break
+
+        operacoes = []
+        for doc in documentos:
+            for campo in campos:
+                valor = doc.get(campo)
+                if not isinstance(valor, str):
+                    continue
+                if not ObjectId.is_valid(valor):
+                    invalidos += 1
+                    continue
+                # Conditioned on the old value: concurrent API writes win
+                operacoes.append(UpdateOne({"_id": doc["_id"], campo: valor}, {"$set": {campo: ObjectId(valor)}}))
+
+        if operacoes:
+            result = await colecao.bulk_write(operacoes, ordered=False)
+            convertidos += result.modified_count
+
+        ultimo_id = documentos[-1]["_id"]
+        await db[CHECKPOINTS].update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"ultimo_id": ultimo_id, "convertidos": convertidos, "invalidos": invalidos,
+                      "atualizado_em": datetime.now(timezone.utc), "concluido": False}},
+            upsert=True
+        )
+        if pausa:
+            await asyncio.sleep(pausa)
+
+    restantes = await colecao.count_documents(filtro_string)
+    resumo = {"convertidos": convertidos, "invalidos": invalidos, "restantes": restantes,
+              "concluido": restantes <= invalidos}
+    await db[CHECKPOINTS].update_one(
+        {"_id": checkpoint_id},
+        {"$set": {**resumo, "atualizado_em": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    return resumo
+
+
+async def executar_migracao(mongo_url: str, banco: str, lote: int, pausa: float, reiniciar: bool):
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[banco]
+    try:
+        for nome, campos in await colecoes_alvo(db):
+            resumo = await migrar_colecao(db, nome, campos, lote, pausa, reiniciar)
+            typer.echo(f"{nome}: {resumo.get('convertidos', 0)} convertidos, "
+                       f"{resumo.get('invalidos', 0)} inválidos, {resumo.get('restantes', 0)} restantes")
+    finally:
+        client.close()
+
+
+async def latencia_juncao(db, colecao: str, campo: str, alvo: str, amostra: int, repeticoes: int) -> dict:
+    # String references never match an ObjectId _id in a $lookup: while any are
+    # left, convert them in the pipeline as the application would have to
+    converter = await db[colecao].count_documents({campo: {"$type": "string"}}, limit=1) > 0
+    chave = f"{campo}_oid" if converter else campo
+    pipeline = [
+        {"$match": {campo: {"$ne": None}}},
+        {"$limit": amostra},
+        *([{"$addFields": {chave: {"$convert": {"input": f"${campo}", "to": "objectId", "onError": None}}}}]
+          if converter else []),
+        {"$lookup": {"from": alvo, "localField": chave, "foreignField": "_id", "as": "ref"}},
+        {"$project": {"ok": {"$gt": [{"$size": "$ref"}, 0]}}},
+    ]
+    tempos, resolvidos, total = [], 0, 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        documentos = await db[colecao].aggregate(pipeline).to_list(amostra)
+        tempos.append(time.perf_counter() - inicio)
+        total = len(documentos)
+        resolvidos = sum(1 for doc in documentos if doc["ok"])
+    tempos.sort()
+    return {"documentos": total, "resolvidos": resolvidos, "convertido": converter,
+            "mediana_ms": round(tempos[len(tempos) // 2] * 1000, 2)}
+
+
+async def executar_relatorio(mongo_url: str, banco: str, rotulo: str, amostra: int, repeticoes: int,
+                             saida: Optional[Path], max_staleness: int = 90):
+    client = AsyncIOMotorClient(mongo_url)
+    preferencia = replicas.preferencia_leitura(True, max_staleness)
+    db = client.get_database(banco, read_preference=preferencia)
+    relatorio = {"rotulo": rotulo, "banco": banco, "em": datetime.now(timezone.utc).isoformat(),
+                 "indices": {}, "juncoes": {}, "strings_restantes": {}}
+    try:
+        for colecao, campos in CAMPOS.items():
+            stats = await db.command("collStats", colecao, read_preference=preferencia)
+            relatorio["indices"][colecao] = {
+                nome: tamanho for nome, tamanho in stats.get("indexSizes", {}).items()
+                if any(campo in nome for campo in campos)
+            }
+            relatorio["strings_restantes"][colecao] = await db[colecao].count_documents(
+                {"$or": [{campo: {"$type": "string"}} for campo in campos]}
+            )
+        for colecao, campo, alvo in JUNCOES:
+            relatorio["juncoes"][f"{colecao}.{campo}"] = await latencia_juncao(
+                db, colecao, campo, alvo, amostra, repeticoes
+            )
+    finally:
+        client.close()
+
+    typer.echo(json.dumps(relatorio, indent=2))
+    if saida:
+        with saida.open("a") as arquivo_saida:
+            arquivo_saida.write(json.dumps(relatorio) + "\n")
+
+
+@app.command()
+def migrar(
+    lote: int = typer.Option(500, min=1, help="Documentos por lote"),
+    pausa_ms: int = typer.Option(50, min=0, help="Pausa entre lotes, para limitar a carga no primário"),
+    reiniciar: bool = typer.Option(False, help="Ignorar checkpoints e percorrer tudo de novo"),
+    mongo_url: str = typer.Option(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), envvar="MONGO_URL"),
+    banco: str = typer.Option(os.environ.get('DB_NAME', 'GymTrack_DB'), envvar="DB_NAME"),
+):
+    """Converte as referências em string para ObjectId (retomável)."""
+    asyncio.run(executar_migracao(mongo_url, banco, lote, pausa_ms / 1000, reiniciar))
+
+
+@app.command()
+def relatorio(
+    rotulo: str = typer.Option("atual", help="Identificação da medição (ex.: antes, depois)"),
+    amostra: int = typer.Option(1000, min=1, help="Documentos por junção medida"),
+    repeticoes: int = typer.Option(5, min=1),
+    saida: Optional[Path] = typer.Option(
+        Path("migracao_referencias.jsonl"), help="Arquivo JSONL acumulando as medições"
+    ),
+    max_staleness: int = typer.Option(
+        int(os.environ.get('LEITURA_MAX_STALENESS_S', '90')), envvar="LEITURA_MAX_STALENESS_S",
+        help="Atraso máximo, em segundos, do secundário lido"
+    ),
+    mongo_url: str = typer.Option(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), envvar="MONGO_URL"),
+    banco: str = typer.Option(os.environ.get('DB_NAME', 'GymTrack_DB'), envvar="DB_NAME"),
+):
+    """Tamanho dos índices de referência e latência das junções."""
+    asyncio.run(executar_relatorio(mongo_url, banco, rotulo, amostra, repeticoes, saida, max_staleness))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,281 @@
+"""Per-aluno progress summaries, maintained incrementally.
+
+Every aluno carries a summary of its treinos: how many it has, how many
+were completed, the date and nivel of the latest completed session and
+completed sessions per ISO week (a session is a completed treino with a
+date). Each treino write hands the treino as it was and as it is now to
+``variacoes``, which reduces them to per-aluno deltas; on Mongo those are
+applied to ``alunos.progresso`` with ``$inc``/``$max``, on SQLite to the
+aluno's columns inside the treino's own transaction. Listing alunos by
+progress then reads indexed fields instead of scanning treinos.
+
+``$max`` cannot go back down: when the latest session is removed (deleted,
+reopened, moved to an earlier date) the latest remaining one is looked up
+through the (aluno, concluido, data) index. ``reconstruir`` recomputes
+every summary from scratch, in parallel batches, and backfills alunos
+created before summaries existed.
+"""
+import asyncio
+from datetime import date, timedelta
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+import arquivo
+import referencias
+
+SEMANAS_FREQUENCIA = 4
+INDICE_SESSOES = [("aluno_id_aluno", ASCENDING), ("concluido", ASCENDING), ("data", ASCENDING)]
+ORDENACOES = ("nome", "treinos_total", "treinos_concluidos", "ultimo_treino")
+# Fields of a treino that count towards the summary
+CAMPOS_TREINO = {"aluno_id_aluno": 1, "concluido": 1, "data": 1, "nivel": 1}
+
+
+def semana_iso(data: Optional[str]) -> Optional[str]:
+    """ISO week of a YYYY-MM-DD date ("2024-12-30" -> "2025-W01"); None if invalid."""
+    try:
+        ano, semana, _ = date.fromisoformat(data).isocalendar()
+    except (TypeError, ValueError):
+        return None
+    return f"{ano}-W{semana:02d}"
+
+
+def sessao(treino: Optional[dict]) -> Optional[Tuple[str, Optional[str]]]:
+    """(data, nivel) when the treino counts as a completed session."""
+    if treino and treino.get('concluido') and semana_iso(treino.get('data')):
+        return treino['data'], treino.get('nivel')
+    return None
+
+
+def variacoes(pares: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> Dict[str, dict]:
+    """Per-aluno deltas of treinos changing from ``antes`` to ``depois``.
+
+    Either side may be None (created / deleted treino). Each delta holds
+    ``inc`` (treinos_total, treinos_concluidos), ``semanas`` (ISO week ->
+    sessions), ``entrada`` (latest session added, as (data, nivel)) and
+    ``saida`` (latest session date removed).
+    """
+    por_aluno: Dict[str, dict] = {}
+    for antes, depois in pares:
+        sessao_antes, sessao_depois = sessao(antes), sessao(depois)
+        mesmo_aluno = antes and depois and str(antes['aluno_id_aluno']) == str(depois['aluno_id_aluno'])
+        if mesmo_aluno and sessao_antes == sessao_depois:
+            # The latest session cannot change; the counters below still net out
+            sessao_antes = sessao_depois = None
+
+        for treino, sinal, sessao_treino in ((antes, -1, sessao_antes), (depois, 1, sessao_depois)):
+            if not treino or not treino.get('aluno_id_aluno'):
+                continue
+            v = por_aluno.setdefault(str(treino['aluno_id_aluno']), {
+                "inc": {"treinos_total": 0, "treinos_concluidos": 0}, "semanas": {}, "entrada": None, "saida": None,
+            })
+            v['inc']['treinos_total'] += sinal
+            if treino.get('concluido'):
+                v['inc']['treinos_concluidos'] += sinal
+            semana = semana_iso(treino.get('data')) if treino.get('concluido') else None
+            if semana:
+                v['semanas'][semana] = v['semanas'].get(semana, 0) + sinal
+            if sessao_treino and sinal > 0 and (v['entrada'] is None or sessao_treino[0] >= v['entrada'][0]):
+                v['entrada'] = sessao_treino
+            if sessao_treino and sinal < 0 and (v['saida'] is None or sessao_treino[0] > v['saida']):
+                v['saida'] = sessao_treino[0]
+
+    for v in por_aluno.values():
+        v['inc'] = {k: n for k, n in v['inc'].items() if n}
+        v['semanas'] = {k: n for k, n in v['semanas'].items() if n}
+    return {
+        aluno_id: v for aluno_id, v in por_aluno.items()
+        if v['inc'] or v['semanas'] or v['entrada'] or v['saida']
+    }
+
+
+def precisa_reparo(variacao: dict) -> bool:
+    """Whether the removed session may have been the latest one."""
+    saida, entrada = variacao['saida'], variacao['entrada']
+    return saida is not None and (entrada is None or entrada[0] < saida)
+
+
+def resumir(treinos: Iterable[dict]) -> dict:
+    """Summary of an aluno computed from all of its treinos."""
+    resumo = {"treinos_total": 0, "treinos_concluidos": 0, "ultimo_treino": None, "nivel": None, "semanas": {}}
+    for treino in treinos:
+        resumo['treinos_total'] += 1
+        if treino.get('concluido'):
+            resumo['treinos_concluidos'] += 1
+        atual = sessao(treino)
+        if atual:
+            semana = semana_iso(atual[0])
+            resumo['semanas'][semana] = resumo['semanas'].get(semana, 0) + 1
+            if resumo['ultimo_treino'] is None or atual[0] >= resumo['ultimo_treino']:
+                resumo['ultimo_treino'], resumo['nivel'] = atual
+    return resumo
+
+
+def semanas_recentes(hoje: Optional[date] = None) -> List[str]:
+    """ISO weeks counted by the weekly frequency, the current one included."""
+    hoje = hoje or date.today()
+    return [semana_iso((hoje - timedelta(weeks=i)).isoformat()) for i in range(SEMANAS_FREQUENCIA)]
+
+
+def frequencia_semanal(sessoes_recentes: int) -> float:
+    return round(sessoes_recentes / SEMANAS_FREQUENCIA, 2)
+
+
+def para_api(resumo: Optional[dict]) -> dict:
+    """Flat summary fields exposed on the aluno."""
+    resumo = resumo or {}
+    semanas = resumo.get('semanas') or {}
+    return {
+        "treinos_total": resumo.get('treinos_total', 0),
+        "treinos_concluidos": resumo.get('treinos_concluidos', 0),
+        "ultimo_treino": resumo.get('ultimo_treino'),
+        "nivel": resumo.get('nivel'),
+        "frequencia_semanal": frequencia_semanal(sum(semanas.get(s, 0) for s in semanas_recentes())),
+    }
+
+
+def ordenacao(ordenar: Optional[str]) -> Optional[Tuple[str, bool]]:
+    """Parse ``?ordenar=`` ("-ultimo_treino" -> ("ultimo_treino", True)); ValueError if unknown."""
+    if not ordenar:
+        return None
+    decrescente = ordenar.startswith("-")
+    campo = ordenar.lstrip("-")
+    if campo not in ORDENACOES:
+        raise ValueError(ordenar)
+    return campo, decrescente
+
+
+async def em_lotes(ids: AsyncIterable, lote: int, paralelos: int, processar: Callable[[list], Awaitable[int]]) -> int:
+    """Feed ``ids`` to ``processar`` in batches of ``lote``, ``paralelos`` batches at a time."""
+    semaforo = asyncio.Semaphore(paralelos)
+    tarefas = []
+
+    async def executar(ids_lote):
+        try:
+            return await processar(ids_lote)
+        finally:
+            semaforo.release()
+
+    async def disparar(ids_lote):
+        # Reading more ids waits for a free slot, so memory stays bounded
+        await semaforo.acquire()
+        tarefas.append(asyncio.create_task(executar(ids_lote)))
+
+    atual = []
+    async for id_ in ids:
+        atual.append(id_)
+        if len(atual) >= lote:
+            await disparar(atual)
+            atual = []
+    if atual:
+        await disparar(atual)
+    return sum(await asyncio.gather(*tarefas))
+
+
+# ===================== MONGO =====================
+
+async def criar_indices(db):
+    await db.alunos.create_index([("progresso.treinos_concluidos", ASCENDING)])
+    await db.alunos.create_index([("progresso.treinos_total", ASCENDING)])
+    await db.alunos.create_index([("progresso.ultimo_treino", ASCENDING)])
+    await db.alunos.create_index([("progresso.nivel", ASCENDING), ("progresso.ultimo_treino", ASCENDING)])
+    # Also serves plain lookups of an aluno's treinos
+    await db.treinos.create_index(INDICE_SESSOES)
+
+
+async def ultima_sessao(db, aluno_id: str) -> Optional[dict]:
+    """Latest completed treino of the aluno, hot or archived."""
+    filtro = {"aluno_id_aluno": referencias.filtro(aluno_id), "concluido": True, "data": {"$ne": None}}
+    projecao = {"data": 1, "nivel": 1}
+    quentes = await db.treinos.find(filtro, projecao).sort("data", DESCENDING).limit(1).to_list(1)
+    arquivada = None
+    # Partitions are monthly, so the newest one holding a session has the latest archived one
+    for nome in reversed(await arquivo.particoes(db)):
+        cursor = arquivo.colecao_particao(db, nome).find(filtro, projecao).sort("data", DESCENDING)
+        docs = await cursor.limit(1).to_list(1)
+        if docs:
+            arquivada = docs[0]
+            break
+    candidatas = [doc for doc in quentes + [arquivada] if doc]
+    return max(candidatas, key=lambda doc: doc['data']) if candidatas else None
+
+
+async def aplicar(db, pares: Iterable[Tuple[Optional[dict], Optional[dict]]]):
+    """Apply the summary deltas of treino changes to ``alunos.progresso``."""
+    deltas = variacoes(pares)
+    operacoes = []
+    for aluno_id, v in deltas.items():
+        update = {}
+        inc = {f"progresso.{k}": n for k, n in v['inc'].items()}
+        inc.update({f"progresso.semanas.{s}": n for s, n in v['semanas'].items()})
+        if inc:
+            update["$inc"] = inc
+        if v['entrada']:
+            update["$max"] = {"progresso.ultimo_treino": v['entrada'][0]}
+        if update:
+            operacoes.append(UpdateOne({"_id": referencias.para_oid(aluno_id)}, update))
+    if operacoes:
+        await db.alunos.bulk_write(operacoes, ordered=False)
+
+    for aluno_id, v in deltas.items():
+        oid = referencias.para_oid(aluno_id)
+        if v['entrada']:
+            # The nivel follows the latest session: only set it if this one still is
+            data, nivel = v['entrada']
+            await db.alunos.update_one(
+                {"_id": oid, "progresso.ultimo_treino": data}, {"$set": {"progresso.nivel": nivel}}
+            )
+        if precisa_reparo(v):
+            ultima = await ultima_sessao(db, aluno_id)
+            await db.alunos.update_one(
+                {"_id": oid, "progresso.ultimo_treino": v['saida']},
+                {"$set": {
+                    "progresso.ultimo_treino": ultima['data'] if ultima else None,
+                    "progresso.nivel": ultima.get('nivel') if ultima else None,
+                }}
+            )
+
+
+async def recalcular(db, aluno_ids: Iterable, particoes: Optional[List[str]] = None) -> int:
+    """Recompute the summaries of some alunos from their hot and archived treinos."""
+    oids = [referencias.para_oid(str(i)) for i in dict.fromkeys(aluno_ids) if i]
+    if not oids:
+        return 0
+    if particoes is None:
+        particoes = await arquivo.particoes(db)
+
+    # Same matching as referencias.filtro, for a whole batch
+    valores = [v for oid in oids for v in ((oid, str(oid)) if referencias.LEGADO else (oid,))]
+    filtro = {"aluno_id_aluno": {"$in": valores}}
+    colecoes = [db.treinos] + [arquivo.colecao_particao(db, nome) for nome in particoes]
+    resultados = await asyncio.gather(*(c.find(filtro, CAMPOS_TREINO).to_list(None) for c in colecoes))
+
+    por_aluno = {}
+    for treinos in resultados:
+        for treino in treinos:
+            por_aluno.setdefault(str(treino['aluno_id_aluno']), []).append(treino)
+    await db.alunos.bulk_write([
+        UpdateOne({"_id": oid}, {"$set": {"progresso": resumir(por_aluno.get(str(oid), []))}}) for oid in oids
+    ], ordered=False)
+    return len(oids)
+
+
+async def reconstruir(db, lote: int = 500, paralelos: int = 4, somente_faltantes: bool = False) -> int:
+    """Recompute every aluno's summary; returns how many were written.
+
+    Meant for backfills and repairs. Treino writes to an aluno while its
+    batch is being recomputed may be overwritten, so run it when traffic
+    is low (or run it again).
+    """
+    particoes = await arquivo.particoes(db)
+    for nome in particoes:
+        # Partitions archived before summaries existed lack it
+        await arquivo.colecao_particao(db, nome).create_index(INDICE_SESSOES)
+
+    filtro = {"progresso": {"$exists": False}} if somente_faltantes else {}
+
+    async def ids():
+        async for doc in db.alunos.find(filtro, {"_id": 1}).sort("_id", ASCENDING):
+            yield doc['_id']
+
+    return await em_lotes(ids(), lote, paralelos, lambda oids: recalcular(db, oids, particoes))
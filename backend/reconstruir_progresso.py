@@ -0,0 +1,75 @@
+"""Recompute every aluno's progress summary from its treinos.
+
+    python reconstruir_progresso.py
+    python reconstruir_progresso.py --banco GymTrack_DB_centro --paralelos 8
+    STORAGE_ENGINE=sqlite python reconstruir_progresso.py
+
+The API keeps the summaries up to date on its own (see progresso.py); this
+is for repairs, e.g. after restoring a backup or editing treinos by hand.
+Alunos are recomputed in batches of ``--lote``, ``--paralelos`` batches at
+a time. A treino written to an aluno while its batch is being recomputed
+may be overwritten, so prefer a quiet moment (or run it twice). Run it once
+per tenant database.
+"""
+import os
+import asyncio
+import time
+from pathlib import Path
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import progresso
+from repositorio import MOTORES
+from repositorio_sqlite import RepositorioSQLite
+from tenancy import TenantRouter
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+app = typer.Typer(help="Recalcula o resumo de progresso de todos os alunos")
+
+
+async def reconstruir_mongo(mongo_url: str, banco: str, lote: int, paralelos: int) -> int:
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        return await progresso.reconstruir(client[banco], lote, paralelos)
+    finally:
+        client.close()
+
+
+async def reconstruir_sqlite(pasta: Path, banco: str, lote: int, paralelos: int) -> int:
+    repo = RepositorioSQLite(pasta, TenantRouter(None, banco), threads=paralelos)
+    try:
+        await repo.inicializar()
+        return await repo.alunos.reconstruir_progresso(lote, paralelos)
+    finally:
+        await repo.fechar()
+
+
+@app.command()
+def reconstruir(
+    lote: int = typer.Option(500, min=1, help="Alunos por lote"),
+    paralelos: int = typer.Option(4, min=1, help="Lotes processados ao mesmo tempo"),
+    motor: str = typer.Option(
+        os.environ.get('STORAGE_ENGINE', 'mongo'), envvar="STORAGE_ENGINE", help=f"{' ou '.join(MOTORES)}"
+    ),
+    banco: str = typer.Option(os.environ.get('DB_NAME', 'GymTrack_DB'), envvar="DB_NAME"),
+    mongo_url: str = typer.Option(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), envvar="MONGO_URL"),
+    pasta: Path = typer.Option(Path(os.environ.get('SQLITE_PASTA', ROOT_DIR / 'dados')), envvar="SQLITE_PASTA"),
+):
+    """Recalcula os resumos em lotes paralelos."""
+    motor = motor.lower()
+    if motor not in MOTORES:
+        raise typer.BadParameter(f"motor inválido: {motor} (use {' ou '.join(MOTORES)})")
+    inicio = time.perf_counter()
+    if motor == "mongo":
+        total = asyncio.run(reconstruir_mongo(mongo_url, banco, lote, paralelos))
+    else:
+        total = asyncio.run(reconstruir_sqlite(pasta, banco, lote, paralelos))
+    typer.echo(f"{total} alunos recalculados em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    app()
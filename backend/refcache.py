@@ -0,0 +1,184 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process on the invalidation channel
+WORKER_ID = uuid.uuid4().hex
+
+
+class ReferenceCache:
+    """Bounded LRU + TTL read-through cache of small reference documents.
+
+    Keys are ``(database name, id)`` so one instance serves every database
+    of the client. Misses of ``get_many`` are filled with a single ``$in``
+    query. Documents are shared between callers and must not be mutated.
+
+    A fill whose query started before an invalidation of the same key is
+    returned to its caller but not stored, since it may predate the write.
+    """
+
+    def __init__(self, colecao: str, max_size: int = 10000, ttl: float = 300.0,
+                 projection: Optional[dict] = None):
+        self.colecao = colecao
+        self.max_size = max_size
+        self.ttl = ttl
+        self.projection = projection
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._generation = 0
+        # key -> generation of its last invalidation, kept only while fills are running
+        self._invalidated: Dict[tuple, int] = {}
+        self._filling = 0
+
+    def _lookup(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, doc = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, doc
+
+    def _store(self, key: tuple, doc: Optional[dict]):
+        self._entries[key] = (time.monotonic() + self.ttl, doc)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, db, id_: str) -> Optional[dict]:
+        return (await self.get_many(db, [id_])).get(str(id_))
+
+    async def get_many(self, db, ids: Iterable) -> Dict[str, Optional[dict]]:
+        """id -> document (None when it does not exist) for every valid id."""
+        result, faltando = {}, []
+        for id_ in {str(i) for i in ids if i}:
+            if not ObjectId.is_valid(id_):
+                continue
+            encontrado, doc = self._lookup((db.name, id_))
+            if encontrado:
+                self.hits += 1
+                result[id_] = doc
+            else:
+                self.misses += 1
+                faltando.append(ObjectId(id_))
+
+        if faltando:
+            generation = self._generation
+            self._filling += 1
+            try:
+                encontrados = {
+                    str(doc['_id']): doc
+                    async for doc in db[self.colecao].find({"_id": {"$in": faltando}}, self.projection)
+                }
+                for oid in faltando:
+                    key, doc = (db.name, str(oid)), encontrados.get(str(oid))
+                    if self._invalidated.get(key, -1) < generation:
+                        self._store(key, doc)
+                    result[str(oid)] = doc
+            finally:
+                self._filling -= 1
+                if not self._filling:
+                    self._invalidated.clear()
+
+        return result
+
+    def invalidate(self, db_name: str, id_: str):
+        self.invalidations += 1
+        self._generation += 1
+        key = (db_name, str(id_))
+        self._entries.pop(key, None)
+        if self._filling:
+            self._invalidated[key] = self._generation
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class InvalidationChannel:
+    """Broadcasts cache invalidations to the other workers.
+
+    Messages go to a small capped collection that every worker follows
+    with a tailable cursor; a worker ignores its own messages since it
+    already invalidated locally when publishing. The channel lives in the
+    database given to ``preparar`` and carries the database name of every
+    invalidation, so one channel serves all tenants of the client.
+    """
+
+    def __init__(self, caches: Dict[str, ReferenceCache], colecao: str = "cache_invalidacoes",
+                 size_bytes: int = 1024 * 1024):
+        self.caches = caches
+        self.colecao = colecao
+        self.size_bytes = size_bytes
+        self.recebidas = 0
+        self.falhas = 0
+        self.db = None
+
+    async def preparar(self, db):
+        self.db = db
+        try:
+            await db.create_collection(self.colecao, capped=True, size=self.size_bytes)
+            # A tailable cursor on an empty capped collection dies immediately
+            await db[self.colecao].insert_one({"origem": WORKER_ID, "cache": None})
+        except CollectionInvalid:
+            pass
+        except Exception as e:
+            logger.warning(f"Canal de invalidação de cache indisponível: {e}")
+
+    async def invalidar(self, db, cache: str, id_: str):
+        self.caches[cache].invalidate(db.name, id_)
+        canal = (self.db if self.db is not None else db)[self.colecao]
+        try:
+            await canal.insert_one({"origem": WORKER_ID, "cache": cache, "db": db.name, "id": str(id_)})
+        except Exception as e:
+            # The write itself succeeded; other workers' copies expire by TTL
+            self.falhas += 1
+            logger.warning(f"Falha ao publicar invalidação de cache ({cache} {id_}): {e}")
+
+    async def escutar(self, db):
+        canal = db[self.colecao]
+        while True:
+            try:
+                # Replaying older messages after a reconnect only evicts a few
+                # entries, so the whole capped collection is simply tailed.
+                cursor = canal.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for mensagem in cursor:
+                        if mensagem.get('origem') == WORKER_ID or mensagem.get('cache') not in self.caches:
+                            continue
+                        self.recebidas += 1
+                        self.caches[mensagem['cache']].invalidate(mensagem['db'], mensagem['id'])
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Without the channel other workers' edits still expire by TTL
+                logger.warning(f"Canal de invalidação de cache indisponível: {e}")
+                await asyncio.sleep(5)
@@ -0,0 +1,48 @@
+"""Instrutor and aluno references stored as ObjectId.
+
+``treinos.aluno_id_aluno``, ``treinos.instrutor_id_instrutor`` and
+``agendas_fixas.instrutor_id_instrutor`` used to hold the hex string of
+the referenced ``_id``. New writes store ObjectId; documents written
+before are converted by ``migrar_referencias.py``. Until that migration
+has finished everywhere (``REFS_LEGADO=false``), reads match both forms.
+The API keeps exposing the references as strings.
+"""
+import os
+from typing import Optional
+
+from bson import ObjectId
+
+CAMPOS = {
+    "treinos": ("aluno_id_aluno", "instrutor_id_instrutor"),
+    "agendas_fixas": ("instrutor_id_instrutor",),
+}
+
+# Match legacy string references as well; turn off once the migration is done
+LEGADO = os.environ.get('REFS_LEGADO', 'true').lower() not in ('0', 'false', 'no')
+
+
+def para_oid(valor):
+    """ObjectId for a valid hex id; anything else is stored as given."""
+    if isinstance(valor, str) and ObjectId.is_valid(valor):
+        return ObjectId(valor)
+    return valor
+
+
+def filtro(valor):
+    """Query condition matching a reference in either representation."""
+    oid = para_oid(valor)
+    if not isinstance(oid, ObjectId):
+        return valor
+    return {"$in": [oid, str(oid)]} if LEGADO else oid
+
+
+def para_banco(colecao: str, dados: dict) -> dict:
+    """Copy of ``dados`` with the reference fields converted for storage."""
+    return {k: para_oid(v) if k in CAMPOS[colecao] else v for k, v in dados.items()}
+
+
+def para_api(colecao: str, doc: Optional[dict]) -> Optional[dict]:
+    """Copy of ``doc`` with the reference fields as strings."""
+    if doc is None:
+        return None
+    return {k: str(v) if k in CAMPOS[colecao] and isinstance(v, ObjectId) else v for k, v in doc.items()}
@@ -0,0 +1,135 @@
+"""Read routing across replica set members.
+
+Read-only endpoints read through a database handle with
+``secondaryPreferred`` and a bounded ``maxStalenessSeconds``; mutations,
+and everything that feeds a later write decision, keep using the primary.
+
+Read-your-writes across requests uses causally consistent sessions:
+every successful mutation returns the primary's ``operationTime`` in the
+``X-Consistencia`` header. A client that echoes it on its next reads gets
+a session advanced to that time, so a secondary only answers once it has
+replicated the write. A session must not be used by two operations at
+once, and handlers gather their reads, so each read opens its own session
+advanced to the same time.
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+from bson import Timestamp
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from starlette.datastructures import Headers, MutableHeaders
+
+from tenancy import TenantDatabase
+
+CONSISTENCIA_HEADER = "x-consistencia"
+METODOS_LEITURA = {"find", "find_one", "count_documents", "aggregate", "distinct"}
+
+sessao_atual: ContextVar = ContextVar("sessao_atual", default=None)
+
+
+def preferencia_leitura(secundaria: bool, max_staleness: int):
+    # Mongo rejects maxStalenessSeconds below 90
+    return SecondaryPreferred(max_staleness=max(90, max_staleness)) if secundaria else Primary()
+
+
+def codificar(ts: Timestamp) -> str:
+    return f"{ts.time}.{ts.inc}"
+
+
+def decodificar(valor: str) -> Optional[Timestamp]:
+    try:
+        time, inc = valor.split(".")
+        return Timestamp(int(time), int(inc))
+    except (ValueError, TypeError):
+        return None
+
+
+class LeituraCausal:
+    """Causal sessions of one request, all advanced to its token's time."""
+
+    def __init__(self, client, ts: Timestamp):
+        self.client = client
+        self.ts = ts
+        self.sessoes = []
+
+    def sessao(self) -> AsyncIOMotorClientSession:
+        # Synchronous so cursors (find, aggregate) can take it; the pool is
+        # already connected by the time requests arrive, so no I/O happens here
+        sessao = AsyncIOMotorClientSession(self.client.delegate.start_session(causal_consistency=True), self.client)
+        sessao.advance_operation_time(self.ts)
+        self.sessoes.append(sessao)
+        return sessao
+
+    def encerrar(self):
+        for sessao in self.sessoes:
+            sessao.delegate.end_session()
+        self.sessoes.clear()
+
+
+class ColecaoLeitura:
+    """Collection whose read methods join the request's causal reads."""
+
+    def __init__(self, colecao: AsyncIOMotorCollection):
+        self._colecao = colecao
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._colecao, nome)
+        if nome not in METODOS_LEITURA:
+            return atributo
+
+        def com_sessao(*args, **kwargs):
+            leitura = sessao_atual.get()
+            if leitura is not None and "session" not in kwargs:
+                kwargs["session"] = leitura.sessao()
+            return atributo(*args, **kwargs)
+        return com_sessao
+
+
+class BancoLeitura(TenantDatabase):
+    """Tenant database proxy for read-only endpoints."""
+
+    def __getattr__(self, nome):
+        valor = super().__getattr__(nome)
+        return ColecaoLeitura(valor) if isinstance(valor, AsyncIOMotorCollection) else valor
+
+    def __getitem__(self, nome):
+        return ColecaoLeitura(super().__getitem__(nome))
+
+
+class ConsistenciaMiddleware:
+    """Issues and honours ``X-Consistencia`` tokens; a no-op when disabled."""
+
+    def __init__(self, app, client, habilitado: bool):
+        self.app = app
+        self.client = client
+        self.habilitado = habilitado
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.habilitado:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] in ("GET", "HEAD"):
+            ts = decodificar(Headers(scope=scope).get(CONSISTENCIA_HEADER, ""))
+            if ts is None:
+                await self.app(scope, receive, send)
+                return
+            leitura = LeituraCausal(self.client, ts)
+            token = sessao_atual.set(leitura)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                sessao_atual.reset(token)
+                leitura.encerrar()
+            return
+
+        async def send_com_token(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                # Any reply from the primary carries an operationTime at or after our write
+                resposta = await self.client.admin.command("ping")
+                if resposta.get("operationTime"):
+                    MutableHeaders(scope=message)[CONSISTENCIA_HEADER] = codificar(resposta["operationTime"])
+            await send(message)
+
+        await self.app(scope, receive, send_com_token)
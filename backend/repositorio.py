@@ -0,0 +1,280 @@
+"""Storage layer behind the API routes.
+
+Handlers talk to a ``Repositorio`` instead of a Motor database, so the same
+routes run on MongoDB (``repositorio_mongo.py``) or on an embedded SQLite
+file per tenant (``repositorio_sqlite.py``) for single-gym installs that do
+not want to run a mongod. The engine is chosen with ``STORAGE_ENGINE``.
+
+Repositories take and return plain dicts shaped like the API models: ids
+are hex strings under ``id_aluno``, ``id_treino``... and references are hex
+strings too. Every call acts on the current request's tenant.
+"""
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import reservas
+
+MOTORES = ("mongo", "sqlite")
+CAMPOS_HORARIO = ('tipo_treino', 'data', 'hora_inicio', 'hora_fim', 'instrutor_id_instrutor')
+
+
+class ConflitoHorario(Exception):
+    """The instrutor already has a personalised treino overlapping the slot."""
+
+
+def mudou_horario(atual: dict, dados: dict) -> bool:
+    return any(k in dados and dados[k] != atual.get(k) for k in CAMPOS_HORARIO)
+
+
+def slot_treino(treino: dict) -> Optional[Tuple[int, int]]:
+    """Booked (inicio, fim) minutes of a personalised treino; None for others."""
+    if treino.get('tipo_treino') != "Personalizado" or not all(treino.get(k) for k in CAMPOS_HORARIO[1:]):
+        return None
+    return reservas.minutos(treino['hora_inicio']), reservas.minutos(treino['hora_fim'])
+
+
+class RepositorioAdmins(ABC):
+    @abstractmethod
+    async def por_email(self, email: str) -> Optional[dict]:
+        """The admin with its password hash, for login."""
+
+    @abstractmethod
+    async def obter(self, id_admin: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def criar(self, dados: dict) -> dict:
+        ...
+
+
+class RepositorioPessoas(ABC):
+    """Alunos and instrutores: CRUD plus the ranked search of busca.py."""
+
+    @abstractmethod
+    async def listar(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def buscar(self, q: str, limite: int) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def obter(self, id_: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def obter_muitos(self, ids: Iterable) -> Dict[str, Optional[dict]]:
+        """id -> document (None when it does not exist) for every valid id."""
+
+    @abstractmethod
+    async def email_em_uso(self, email: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def criar(self, dados: dict) -> dict:
+        ...
+
+    @abstractmethod
+    async def atualizar(self, id_: str, dados: dict) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def remover(self, id_: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def contar(self) -> int:
+        ...
+
+
+class RepositorioAlunos(RepositorioPessoas):
+    """Alunos also carry the progress summary of progresso.py.
+
+    ``obter``/``obter_muitos`` resolve references and may leave it out.
+    """
+
+    @abstractmethod
+    async def listar(self, ordenar: Optional[Tuple[str, bool]] = None, nivel: Optional[str] = None,
+                     concluidos_min: Optional[int] = None, ultimo_treino_desde: Optional[str] = None) -> List[dict]:
+        """Filtered and sorted by summary fields; ``ordenar`` is (campo, decrescente)."""
+
+    @abstractmethod
+    async def reconstruir_progresso(self, lote: int = 500, paralelos: int = 4) -> int:
+        """Recompute every summary from the treinos; how many alunos were written."""
+
+
+class RepositorioAgendas(ABC):
+    @abstractmethod
+    async def listar(self, disponivel: Optional[bool] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def instrutores_no_horario(self, hora_inicio: str, hora_fim: str) -> List[str]:
+        """Ids of instrutores available whose agenda covers the whole slot."""
+
+    @abstractmethod
+    async def por_instrutor(self, instrutor_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def criar(self, dados: dict) -> dict:
+        ...
+
+    @abstractmethod
+    async def atualizar(self, id_agenda: str, dados: dict) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def remover(self, id_agenda: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def alternar_disponibilidade(self, instrutor_id: str) -> Optional[bool]:
+        """Flip the instrutor's agenda; the new value, or None without an agenda."""
+
+    @abstractmethod
+    async def contar(self, disponivel: Optional[bool] = None) -> int:
+        ...
+
+    @abstractmethod
+    async def remover_do_instrutor(self, instrutor_id: str) -> int:
+        """Cascade of a deleted instrutor, when it does not run as a job."""
+
+
+class RepositorioTreinos(ABC):
+    """Treinos, including the slot booking of personalised ones.
+
+    ``criar`` and ``atualizar`` raise ``ConflitoHorario`` when a
+    personalised treino would overlap another one of the same instrutor;
+    the check and the write are atomic on every engine.
+    """
+
+    @abstractmethod
+    async def listar(self, data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def listar_personalizados(self) -> List[dict]:
+        """Personalised treinos with a date, for the agendas page."""
+
+    @abstractmethod
+    async def obter(self, id_treino: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def criar(self, dados: dict) -> dict:
+        ...
+
+    @abstractmethod
+    async def atualizar(self, id_treino: str, dados: dict, atual: dict) -> Optional[dict]:
+        """Apply ``dados`` to the treino previously read as ``atual``."""
+
+    @abstractmethod
+    async def remover(self, id_treino: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def alternar_concluido(self, id_treino: str) -> Optional[bool]:
+        ...
+
+    @abstractmethod
+    async def ocupados(self, instrutor_ids: Iterable[str], data: str) -> Dict[str, List[Tuple[int, int]]]:
+        """instrutor_id -> booked [(inicio, fim), ...] in minutes, for one day."""
+
+    @abstractmethod
+    async def contar(self) -> int:
+        ...
+
+    @abstractmethod
+    async def concluir_muitos(self, ids: List[str], concluido: bool) -> Set[str]:
+        """Ids that exist and were updated."""
+
+    @abstractmethod
+    async def reatribuir_muitos(self, ids: List[str], instrutor_id: str) -> Dict[str, str]:
+        """id -> "ok" or "conflito" for every existing treino, in ``ids`` order."""
+
+    @abstractmethod
+    async def remover_muitos(self, ids: List[str]) -> Set[str]:
+        ...
+
+    @abstractmethod
+    async def remover_por_filtro(self, filtro: dict, limite: int) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def remover_do_aluno(self, aluno_id: str) -> int:
+        """Cascade of a deleted aluno, when it does not run as a job."""
+
+    @abstractmethod
+    async def remover_personalizados_do_instrutor(self, instrutor_id: str) -> int:
+        ...
+
+
+class RepositorioCheckins(ABC):
+    @abstractmethod
+    def destino(self):
+        """Handle of the current tenant's storage, kept by the check-in buffer."""
+
+    @abstractmethod
+    async def gravar(self, destino, documentos: List[dict]) -> Tuple[int, int]:
+        """Write buffered check-ins and their aggregates; (written, rejected)."""
+
+    @abstractmethod
+    async def frequencia(self, data_inicio: Optional[str], data_fim: Optional[str]) -> List[dict]:
+        ...
+
+
+class RepositorioIdempotencia(ABC):
+    """Responses stored under an ``Idempotency-Key`` (see idempotencia.py).
+
+    Records are dicts with ``impressao`` (request fingerprint) and
+    ``estado``: "em_andamento" while reserved, "concluida" with ``status``,
+    ``headers`` ([[name, value], ...]) and ``corpo`` (bytes) once stored.
+    """
+
+    @abstractmethod
+    async def reservar(self, chave: str, impressao: str, lease: timedelta, ttl: timedelta) -> Optional[dict]:
+        """Claim the key for one execution: None when claimed, else the existing record.
+
+        A reservation whose lease expired (its worker died) is taken over,
+        and an expired record counts as absent.
+        """
+
+    @abstractmethod
+    async def concluir(self, chave: str, registro: dict, ttl: timedelta):
+        ...
+
+    @abstractmethod
+    async def liberar(self, chave: str):
+        """Drop a reservation whose response is not kept, so a retry runs again."""
+
+
+class Repositorio(ABC):
+    """One engine's repositories plus its lifecycle.
+
+    ``cascata_em_segundo_plano`` tells the routes whether dependent
+    treinos and agendas are removed by persisted jobs (Mongo) or right
+    after the delete, within the same request.
+    """
+
+    motor: str
+    cascata_em_segundo_plano: bool = False
+    admins: RepositorioAdmins
+    alunos: RepositorioAlunos
+    instrutores: RepositorioPessoas
+    agendas: RepositorioAgendas
+    treinos: RepositorioTreinos
+    checkins: RepositorioCheckins
+    idempotencia: RepositorioIdempotencia
+
+    @abstractmethod
+    async def inicializar(self):
+        """Create the current tenant's schema and indexes; idempotent."""
+
+    @abstractmethod
+    async def estatisticas(self) -> dict:
+        ...
+
+    async def fechar(self):
+        pass
@@ -0,0 +1,579 @@
+"""MongoDB implementation of the storage layer (see repositorio.py).
+
+This is what the routes used to do on Motor directly: list endpoints read
+through ``db_leitura`` (secondaries, see replicas.py), single instrutor and
+aluno lookups go through the reference caches (see refcache.py),
+personalised treinos book their slot in ``reservas`` (see reservas.py),
+date-ranged listings reach the archive partitions (see arquivo.py) and
+references are stored as ObjectId (see referencias.py).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import arquivo
+import busca
+import checkins
+import progresso
+import referencias
+import reservas
+from repositorio import (
+    ConflitoHorario, Repositorio, RepositorioAdmins, RepositorioAgendas, RepositorioAlunos, RepositorioCheckins,
+    RepositorioIdempotencia, RepositorioPessoas, RepositorioTreinos, mudou_horario, slot_treino,
+)
+
+logger = logging.getLogger(__name__)
+
+# Treinos deleted per round by the inline cascades
+LOTE_CASCATA = 500
+
+
+def com_id(doc: Optional[dict], campo: str) -> Optional[dict]:
+    return {**doc, campo: str(doc['_id'])} if doc else None
+
+
+class AdminsMongo(RepositorioAdmins):
+    def __init__(self, repo: "RepositorioMongo"):
+        self.repo = repo
+
+    async def por_email(self, email: str) -> Optional[dict]:
+        return com_id(await self.repo.db.admins.find_one({"email": email}), "id_admin")
+
+    async def obter(self, id_admin: str) -> Optional[dict]:
+        return com_id(await self.repo.db.admins.find_one({"_id": ObjectId(id_admin)}), "id_admin")
+
+    async def criar(self, dados: dict) -> dict:
+        result = await self.repo.db.admins.insert_one(dict(dados))
+        return {**dados, "id_admin": str(result.inserted_id)}
+
+
+class PessoasMongo(RepositorioPessoas):
+    def __init__(self, repo: "RepositorioMongo", colecao: str, campo_id: str, cache):
+        self.repo = repo
+        self.colecao = colecao
+        self.campo_id = campo_id
+        self.cache = cache
+
+    def _api(self, doc: Optional[dict]) -> Optional[dict]:
+        return com_id(doc, self.campo_id)
+
+    async def listar(self) -> List[dict]:
+        docs = await self.repo.db_leitura[self.colecao].find({}, busca.BUSCA_PROJECAO).to_list(1000)
+        return [self._api(doc) for doc in docs]
+
+    async def buscar(self, q: str, limite: int) -> List[dict]:
+        docs = await busca.buscar_documentos(self.repo.db_leitura[self.colecao], q, limite)
+        return [self._api(doc) for doc in docs]
+
+    async def obter(self, id_: str) -> Optional[dict]:
+        return self._api(await self.cache.get(self.repo.db, id_))
+
+    async def obter_muitos(self, ids: Iterable) -> Dict[str, Optional[dict]]:
+        docs = await self.cache.get_many(self.repo.db, ids)
+        return {id_: self._api(doc) for id_, doc in docs.items()}
+
+    async def email_em_uso(self, email: str) -> bool:
+        return await self.repo.db[self.colecao].find_one({"email": email}, {"_id": 1}) is not None
+
+    async def criar(self, dados: dict) -> dict:
+        colecao = self.repo.db[self.colecao]
+        result = await colecao.insert_one({**dados, **busca.campos_busca(dados.get('nome'), dados.get('email'))})
+        return self._api(await colecao.find_one({"_id": result.inserted_id}))
+
+    async def atualizar(self, id_: str, dados: dict) -> Optional[dict]:
+        colecao = self.repo.db[self.colecao]
+        dados = dict(dados)
+        if 'nome' in dados or 'email' in dados:
+            atual = await colecao.find_one({"_id": ObjectId(id_)}, {"nome": 1, "email": 1})
+            if atual:
+                merged = {**atual, **dados}
+                dados.update(busca.campos_busca(merged.get('nome'), merged.get('email')))
+
+        result = await colecao.update_one({"_id": ObjectId(id_)}, {"$set": dados})
+        if result.matched_count == 0:
+            return None
+
+        await self.repo.canal_cache.invalidar(self.repo.db, self.colecao, id_)
+        return self._api(await colecao.find_one({"_id": ObjectId(id_)}))
+
+    async def remover(self, id_: str) -> bool:
+        result = await self.repo.db[self.colecao].delete_one({"_id": ObjectId(id_)})
+        if result.deleted_count == 0:
+            return False
+        await self.repo.canal_cache.invalidar(self.repo.db, self.colecao, id_)
+        return True
+
+    async def contar(self) -> int:
+        return await self.repo.db_leitura[self.colecao].count_documents({})
+
+
+class AlunosMongo(PessoasMongo, RepositorioAlunos):
+    """The summary lives in ``progresso`` on the aluno document (see progresso.py)."""
+
+    CAMPOS_ORDENACAO = {
+        "nome": "busca_nome",
+        "treinos_total": "progresso.treinos_total",
+        "treinos_concluidos": "progresso.treinos_concluidos",
+        "ultimo_treino": "progresso.ultimo_treino",
+    }
+
+    def __init__(self, repo: "RepositorioMongo", cache):
+        super().__init__(repo, "alunos", "id_aluno", cache)
+
+    def _api(self, doc: Optional[dict]) -> Optional[dict]:
+        if doc is None or 'progresso' not in doc:
+            # Cached references leave the summary out
+            return com_id(doc, "id_aluno")
+        aluno = com_id({k: v for k, v in doc.items() if k != 'progresso'}, "id_aluno")
+        return {**aluno, **progresso.para_api(doc['progresso'])}
+
+    async def listar(self, ordenar: Optional[tuple] = None, nivel: Optional[str] = None,
+                     concluidos_min: Optional[int] = None, ultimo_treino_desde: Optional[str] = None) -> List[dict]:
+        filtro = {}
+        if nivel is not None:
+            filtro["progresso.nivel"] = nivel
+        if concluidos_min is not None:
+            filtro["progresso.treinos_concluidos"] = {"$gte": concluidos_min}
+        if ultimo_treino_desde:
+            filtro["progresso.ultimo_treino"] = {"$gte": ultimo_treino_desde}
+
+        cursor = self.repo.db_leitura.alunos.find(filtro, busca.BUSCA_PROJECAO)
+        if ordenar:
+            campo, decrescente = ordenar
+            cursor = cursor.sort(self.CAMPOS_ORDENACAO[campo], DESCENDING if decrescente else ASCENDING)
+        return [self._api(doc) for doc in await cursor.to_list(1000)]
+
+    async def criar(self, dados: dict) -> dict:
+        return await super().criar({**dados, "progresso": progresso.resumir([])})
+
+    async def reconstruir_progresso(self, lote: int = 500, paralelos: int = 4) -> int:
+        return await progresso.reconstruir(self.repo.db, lote, paralelos)
+
+
+class AgendasMongo(RepositorioAgendas):
+    def __init__(self, repo: "RepositorioMongo"):
+        self.repo = repo
+
+    @staticmethod
+    def _api(doc: Optional[dict]) -> Optional[dict]:
+        return com_id(referencias.para_api("agendas_fixas", doc), "id_agenda")
+
+    async def listar(self, disponivel: Optional[bool] = None) -> List[dict]:
+        filtro = {} if disponivel is None else {"disponivel": disponivel}
+        return [self._api(a) for a in await self.repo.db_leitura.agendas_fixas.find(filtro).to_list(1000)]
+
+    async def instrutores_no_horario(self, hora_inicio: str, hora_fim: str) -> List[str]:
+        # Read from the primary: the answer is used to book the slot right away
+        agendas = await self.repo.db.agendas_fixas.find({"disponivel": True}).to_list(1000)
+        return [
+            str(agenda['instrutor_id_instrutor']) for agenda in agendas
+            if agenda['hora_inicio'] <= hora_inicio and agenda['hora_fim'] >= hora_fim
+        ]
+
+    async def por_instrutor(self, instrutor_id: str) -> Optional[dict]:
+        return self._api(await self.repo.db.agendas_fixas.find_one(
+            {"instrutor_id_instrutor": referencias.filtro(instrutor_id)}
+        ))
+
+    async def criar(self, dados: dict) -> dict:
+        result = await self.repo.db.agendas_fixas.insert_one(referencias.para_banco("agendas_fixas", dados))
+        return self._api(await self.repo.db.agendas_fixas.find_one({"_id": result.inserted_id}))
+
+    async def atualizar(self, id_agenda: str, dados: dict) -> Optional[dict]:
+        result = await self.repo.db.agendas_fixas.update_one(
+            {"_id": ObjectId(id_agenda)},
+            {"$set": referencias.para_banco("agendas_fixas", dados)}
+        )
+        if result.matched_count == 0:
+            return None
+        return self._api(await self.repo.db.agendas_fixas.find_one({"_id": ObjectId(id_agenda)}))
+
+    async def remover(self, id_agenda: str) -> bool:
+        result = await self.repo.db.agendas_fixas.delete_one({"_id": ObjectId(id_agenda)})
+        return result.deleted_count > 0
+
+    async def remover_do_instrutor(self, instrutor_id: str) -> int:
+        # The API runs this cascade as a job on Mongo (see server.py)
+        result = await self.repo.db.agendas_fixas.delete_many(
+            {"instrutor_id_instrutor": referencias.filtro(instrutor_id)}
+        )
+        return result.deleted_count
+
+    async def alternar_disponibilidade(self, instrutor_id: str) -> Optional[bool]:
+        agenda = await self.repo.db.agendas_fixas.find_one({"instrutor_id_instrutor": referencias.filtro(instrutor_id)})
+        if not agenda:
+            return None
+        novo_status = not agenda.get('disponivel', True)
+        await self.repo.db.agendas_fixas.update_one({"_id": agenda['_id']}, {"$set": {"disponivel": novo_status}})
+        return novo_status
+
+    async def contar(self, disponivel: Optional[bool] = None) -> int:
+        filtro = {} if disponivel is None else {"disponivel": disponivel}
+        return await self.repo.db_leitura.agendas_fixas.count_documents(filtro)
+
+
+class TreinosMongo(RepositorioTreinos):
+    def __init__(self, repo: "RepositorioMongo"):
+        self.repo = repo
+
+    @staticmethod
+    def _api(doc: Optional[dict]) -> Optional[dict]:
+        return com_id(referencias.para_api("treinos", doc), "id_treino")
+
+    async def _registrar(self, pares: list, exato: bool = True):
+        """Update the alunos' summaries; recompute them when a bulk write raced another."""
+        if exato:
+            await progresso.aplicar(self.repo.db, pares)
+        else:
+            await progresso.recalcular(self.repo.db, (t['aluno_id_aluno'] for par in pares for t in par if t))
+
+    async def listar(self, data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> List[dict]:
+        filtro = {}
+        if data_inicio:
+            filtro.setdefault("data", {})["$gte"] = data_inicio
+        if data_fim:
+            filtro.setdefault("data", {})["$lte"] = data_fim
+
+        treinos = await self.repo.db_leitura.treinos.find(filtro).to_list(1000)
+        # Archive partitions are only read when the requested range reaches them
+        if filtro:
+            treinos += await arquivo.buscar(self.repo.db_leitura, filtro, data_inicio, data_fim, 1000)
+        return [self._api(t) for t in treinos]
+
+    async def listar_personalizados(self) -> List[dict]:
+        treinos = await self.repo.db_leitura.treinos.find(
+            {"tipo_treino": "Personalizado", "data": {"$ne": None}}
+        ).to_list(1000)
+        return [self._api(t) for t in treinos]
+
+    async def obter(self, id_treino: str) -> Optional[dict]:
+        return self._api(await self.repo.db.treinos.find_one({"_id": ObjectId(id_treino)}))
+
+    async def criar(self, dados: dict) -> dict:
+        db = self.repo.db
+        treino = {**dados, "_id": ObjectId()}
+        id_treino = str(treino['_id'])
+
+        slot = slot_treino(treino)
+        if slot:
+            # Reserve the slot atomically before inserting (see reservas.py)
+            reservado = await reservas.reservar(
+                db.reservas, treino['instrutor_id_instrutor'], treino['data'], *slot, id_treino
+            )
+            if not reservado:
+                raise ConflitoHorario()
+            try:
+                await db.treinos.insert_one(referencias.para_banco("treinos", treino))
+            except Exception:
+                await reservas.liberar(db.reservas, id_treino, treino['instrutor_id_instrutor'], treino['data'])
+                raise
+        else:
+            await db.treinos.insert_one(referencias.para_banco("treinos", treino))
+
+        await self._registrar([(None, treino)])
+        return self._api(await db.treinos.find_one({"_id": treino['_id']}))
+
+    async def atualizar(self, id_treino: str, dados: dict, atual: dict) -> Optional[dict]:
+        db = self.repo.db
+        # Re-check the instructor's slot whenever the schedule changes
+        mudou = mudou_horario(atual, dados)
+        novo = {**atual, **dados}
+        reservado = False
+
+        slot = slot_treino(novo) if mudou else None
+        if slot:
+            reservado = await reservas.reservar(
+                db.reservas, novo['instrutor_id_instrutor'], novo['data'], *slot, id_treino
+            )
+            if not reservado:
+                raise ConflitoHorario()
+
+        # The previous version is what the summary delta is computed from
+        alteracoes = referencias.para_banco("treinos", dados)
+        anterior = await db.treinos.find_one_and_update(
+            {"_id": ObjectId(id_treino)}, {"$set": alteracoes}, return_document=ReturnDocument.BEFORE
+        )
+
+        if anterior is None:
+            if reservado:
+                await reservas.liberar(db.reservas, id_treino, novo['instrutor_id_instrutor'], novo['data'])
+            return None
+
+        if mudou and atual.get('tipo_treino') == "Personalizado":
+            chave_antiga = (atual.get('instrutor_id_instrutor'), atual.get('data'))
+            if not reservado or chave_antiga != (novo['instrutor_id_instrutor'], novo['data']):
+                await reservas.liberar(db.reservas, id_treino, *chave_antiga)
+
+        atualizado = {**anterior, **alteracoes}
+        await self._registrar([(anterior, atualizado)])
+        return self._api(atualizado)
+
+    async def remover(self, id_treino: str) -> bool:
+        removido = await self.repo.db.treinos.find_one_and_delete({"_id": ObjectId(id_treino)}, progresso.CAMPOS_TREINO)
+        if removido is None:
+            return False
+        await reservas.liberar(self.repo.db.reservas, id_treino)
+        await self._registrar([(removido, None)])
+        return True
+
+    async def alternar_concluido(self, id_treino: str) -> Optional[bool]:
+        while True:
+            treino = await self.repo.db.treinos.find_one({"_id": ObjectId(id_treino)}, progresso.CAMPOS_TREINO)
+            if not treino:
+                return None
+            novo_status = not treino.get('concluido', False)
+            # Conditioned on the value read, so the summary gets exactly the change made
+            result = await self.repo.db.treinos.update_one(
+                {"_id": treino['_id'], "concluido": {"$ne": True} if novo_status else True},
+                {"$set": {"concluido": novo_status}}
+            )
+            if result.modified_count:
+                await self._registrar([(treino, {**treino, "concluido": novo_status})])
+                return novo_status
+
+    async def ocupados(self, instrutor_ids: Iterable[str], data: str) -> dict:
+        # One read of the instructors' slot documents for that day
+        return await reservas.intervalos_ocupados(self.repo.db.reservas, instrutor_ids, data)
+
+    async def contar(self) -> int:
+        quentes, arquivados = await asyncio.gather(
+            self.repo.db_leitura.treinos.count_documents({}),
+            arquivo.total_arquivado(self.repo.db_leitura),
+        )
+        return quentes + arquivados
+
+    async def concluir_muitos(self, ids: List[str], concluido: bool) -> Set[str]:
+        oids = [ObjectId(i) for i in ids]
+        encontrados = await self.repo.db.treinos.find({"_id": {"$in": oids}}, progresso.CAMPOS_TREINO).to_list(None)
+        mudando = [t for t in encontrados if bool(t.get('concluido')) != concluido]
+        if mudando:
+            result = await self.repo.db.treinos.update_many(
+                {"_id": {"$in": [t['_id'] for t in mudando]}, "concluido": {"$ne": concluido}},
+                {"$set": {"concluido": concluido}}
+            )
+            await self._registrar(
+                [(t, {**t, "concluido": concluido}) for t in mudando], result.modified_count == len(mudando)
+            )
+        return {str(t['_id']) for t in encontrados}
+
+    async def reatribuir_muitos(self, ids: List[str], instrutor_id: str) -> Dict[str, str]:
+        db = self.repo.db
+        oids = [ObjectId(i) for i in ids]
+        treinos = {
+            doc['_id']: referencias.para_api("treinos", doc)
+            async for doc in db.treinos.find(
+                {"_id": {"$in": oids}},
+                {"tipo_treino": 1, "data": 1, "hora_inicio": 1, "hora_fim": 1, "instrutor_id_instrutor": 1}
+            )
+        }
+
+        # One read of the target instructor's slot documents for every date in the batch
+        datas = list({t['data'] for t in treinos.values() if t.get('data')})
+        ocupados = {}
+        if datas:
+            chaves = [reservas.chave_slot(instrutor_id, data) for data in datas]
+            async for doc in db.reservas.find({"_id": {"$in": chaves}}):
+                data = doc['_id'].rsplit(":", 1)[1]
+                ocupados[data] = [
+                    (i['inicio'], i['fim']) for i in doc.get('intervalos', [])
+                    if ObjectId(i['treino_id']) not in treinos
+                ]
+
+        status, aceitos, liberar = {}, [], []
+        for oid in oids:
+            treino = treinos.get(oid)
+            if not treino:
+                continue
+
+            slot = slot_treino({**treino, "instrutor_id_instrutor": instrutor_id})
+            if slot:
+                horarios = ocupados.setdefault(treino['data'], [])
+                conflito = any(reservas.conflita(*slot, ini, f) for ini, f in horarios)
+                # The pre-check is a snapshot; the reservation itself is the atomic guard
+                if conflito or not await reservas.reservar(db.reservas, instrutor_id, treino['data'], *slot, str(oid)):
+                    status[str(oid)] = "conflito"
+                    continue
+                # Later items in the same batch must not overlap this one either
+                horarios.append(slot)
+                if treino.get('instrutor_id_instrutor') != instrutor_id:
+                    liberar.append((str(oid), treino.get('instrutor_id_instrutor'), treino['data']))
+
+            aceitos.append(oid)
+            status[str(oid)] = "ok"
+
+        if aceitos:
+            await db.treinos.update_many(
+                {"_id": {"$in": aceitos}}, {"$set": {"instrutor_id_instrutor": ObjectId(instrutor_id)}}
+            )
+
+        for id_treino, instrutor_antigo, data in liberar:
+            await reservas.liberar(db.reservas, id_treino, instrutor_antigo, data)
+
+        return status
+
+    async def _remover(self, query: dict, limite: int) -> List[ObjectId]:
+        db = self.repo.db
+        treinos = await db.treinos.find(query, progresso.CAMPOS_TREINO).limit(limite).to_list(limite)
+        encontrados = [t['_id'] for t in treinos]
+        if encontrados:
+            result = await db.treinos.delete_many({"_id": {"$in": encontrados}})
+            await reservas.liberar_muitos(db.reservas, [str(oid) for oid in encontrados])
+            await self._registrar([(t, None) for t in treinos], result.deleted_count == len(treinos))
+        return encontrados
+
+    async def remover_muitos(self, ids: List[str]) -> Set[str]:
+        encontrados = await self._remover({"_id": {"$in": [ObjectId(i) for i in ids]}}, len(ids))
+        return {str(oid) for oid in encontrados}
+
+    async def remover_por_filtro(self, filtro: dict, limite: int) -> List[str]:
+        query = {k: referencias.filtro(v) if k in referencias.CAMPOS["treinos"] else v for k, v in filtro.items()}
+        return [str(oid) for oid in await self._remover(query, limite)]
+
+    # The API runs these cascades as jobs on Mongo (see server.py); inline versions for scripts
+    async def _remover_com_arquivo(self, query: dict) -> int:
+        removidos = 0
+        while True:
+            lote = await self._remover(query, LOTE_CASCATA)
+            if not lote:
+                break
+            removidos += len(lote)
+        alunos = await arquivo.distintos(self.repo.db, "aluno_id_aluno", query)
+        removidos += await arquivo.deletar(self.repo.db, query)
+        await progresso.recalcular(self.repo.db, alunos)
+        return removidos
+
+    async def remover_do_aluno(self, aluno_id: str) -> int:
+        return await self._remover_com_arquivo({"aluno_id_aluno": referencias.filtro(aluno_id)})
+
+    async def remover_personalizados_do_instrutor(self, instrutor_id: str) -> int:
+        return await self._remover_com_arquivo(
+            {"tipo_treino": "Personalizado", "instrutor_id_instrutor": referencias.filtro(instrutor_id)})
+
+
+class CheckinsMongo(RepositorioCheckins):
+    def __init__(self, repo: "RepositorioMongo"):
+        self.repo = repo
+
+    def destino(self):
+        return self.repo.db.atual()
+
+    async def gravar(self, destino, documentos: List[dict]):
+        return await checkins.gravar_mongo(destino, documentos)
+
+    async def frequencia(self, data_inicio: Optional[str], data_fim: Optional[str]) -> List[dict]:
+        filtro = {}
+        if data_inicio:
+            filtro.setdefault("_id", {})["$gte"] = data_inicio
+        if data_fim:
+            filtro.setdefault("_id", {})["$lte"] = data_fim
+        dias = await self.repo.db_leitura[checkins.FREQUENCIA].find(filtro).sort("_id", ASCENDING).to_list(1000)
+        return [{"data": dia['_id'], "checkins": dia['checkins']} for dia in dias]
+
+
+class IdempotenciaMongo(RepositorioIdempotencia):
+    """One document per key in ``idempotencia``, removed by a TTL index on ``expira``."""
+
+    def __init__(self, repo: "RepositorioMongo"):
+        self.repo = repo
+
+    @staticmethod
+    def _registro(doc: dict) -> dict:
+        registro = {k: doc[k] for k in ("impressao", "estado", "status", "headers") if k in doc}
+        if 'corpo' in doc:
+            registro['corpo'] = bytes(doc['corpo'])
+        return registro
+
+    async def reservar(self, chave: str, impressao: str, lease: timedelta, ttl: timedelta) -> Optional[dict]:
+        colecao = self.repo.db.idempotencia
+        while True:
+            momento = datetime.now(timezone.utc)
+            reserva = {"_id": chave, "impressao": impressao, "estado": "em_andamento",
+                       "lease_ate": momento + lease, "expira": momento + ttl}
+            try:
+                await colecao.insert_one(reserva)
+                return None
+            except DuplicateKeyError:
+                pass
+            # The TTL monitor only runs every minute, so expired documents may still be there
+            result = await colecao.replace_one({"_id": chave, "$or": [
+                {"estado": "em_andamento", "lease_ate": {"$lt": momento}},
+                {"expira": {"$lt": momento}},
+            ]}, reserva)
+            if result.modified_count:
+                return None
+            existente = await colecao.find_one({"_id": chave})
+            if existente:
+                return self._registro(existente)
+            # Released or expired in between: claim it again
+
+    async def concluir(self, chave: str, registro: dict, ttl: timedelta):
+        await self.repo.db.idempotencia.update_one(
+            {"_id": chave, "estado": "em_andamento"},
+            {"$set": {**registro, "expira": datetime.now(timezone.utc) + ttl}, "$unset": {"lease_ate": ""}}
+        )
+
+    async def liberar(self, chave: str):
+        await self.repo.db.idempotencia.delete_one({"_id": chave, "estado": "em_andamento"})
+
+
+class RepositorioMongo(Repositorio):
+    """``db`` and ``db_leitura`` are the tenant-aware proxies of server.py."""
+
+    motor = "mongo"
+    # Cascades of deleted alunos/instrutores run as persisted jobs (see jobs.py)
+    cascata_em_segundo_plano = True
+
+    def __init__(self, db, db_leitura, cache_alunos, cache_instrutores, canal_cache):
+        self.db = db
+        self.db_leitura = db_leitura
+        self.canal_cache = canal_cache
+        self.admins = AdminsMongo(self)
+        self.alunos = AlunosMongo(self, cache_alunos)
+        self.instrutores = PessoasMongo(self, "instrutores", "id_instrutor", cache_instrutores)
+        self.agendas = AgendasMongo(self)
+        self.treinos = TreinosMongo(self)
+        self.checkins = CheckinsMongo(self)
+        self.idempotencia = IdempotenciaMongo(self)
+
+    async def inicializar(self):
+        db = self.db
+        for colecao in (db.alunos, db.instrutores):
+            await busca.criar_indices_busca(colecao)
+            await busca.preencher_campos_busca(colecao)
+
+        await reservas.criar_indices(db.reservas)
+        if await db.reservas.estimated_document_count() == 0:
+            slots = await reservas.reconstruir(db.reservas, db.treinos)
+            if slots:
+                logger.info(f"Reservas reconstruídas a partir dos treinos ({db.name}): {slots} slots")
+
+        await db.treinos.create_index([("concluido", ASCENDING), ("data", ASCENDING)])
+        await db.treinos.create_index([("data", ASCENDING)])
+        await progresso.criar_indices(db)
+        resumos = await progresso.reconstruir(db, somente_faltantes=True)
+        if resumos:
+            logger.info(f"Progresso calculado para alunos sem resumo ({db.name}): {resumos}")
+        await db.agendas_fixas.create_index([("instrutor_id_instrutor", ASCENDING)])
+        await checkins.criar_colecao(db)
+        await db.idempotencia.create_index([("expira", ASCENDING)], expireAfterSeconds=0)
+
+    async def estatisticas(self) -> dict:
+        total_alunos, total_instrutores, total_agendas, total_treinos, agendas_disponiveis = await asyncio.gather(
+            self.alunos.contar(),
+            self.instrutores.contar(),
+            self.agendas.contar(),
+            self.treinos.contar(),
+            self.agendas.contar(disponivel=True),
+        )
+        return {
+            "total_alunos": total_alunos,
+            "total_instrutores": total_instrutores,
+            "total_agendas": total_agendas,
+            "total_treinos": total_treinos,
+            "agendas_disponiveis": agendas_disponiveis,
+        }
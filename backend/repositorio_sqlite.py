@@ -0,0 +1,961 @@
+"""Embedded SQLite implementation of the storage layer (see repositorio.py).
+
+Meant for single-gym installs: one database file per tenant under
+``SQLITE_PASTA`` and no server to run. sqlite3 calls block, so every
+statement runs on a small thread pool (``SQLITE_THREADS``) and the event
+loop only awaits it. Each pool thread keeps one connection per file, in
+WAL mode so readers never wait for the writer. Statements are constant,
+parameterised SQL (id lists are bound as one JSON array and expanded with
+``json_each``), so each connection's statement cache prepares them once
+and reuses them.
+
+Writes that check before they write (slot booking, bulk reassignment,
+cascades) run in ``BEGIN IMMEDIATE`` transactions: they take the file's
+write lock up front, so two desks booking the same slot are serialized
+by SQLite itself. Slot conflicts are checked against the ``inicio``/``fim``
+minutes stored on personalised treinos, through the (instrutor, data)
+index, so there is no separate reservations table.
+
+Progress summaries (see progresso.py) are columns of ``alunos`` plus
+``alunos_semanas``, updated in the same transaction as the treino write.
+
+Background jobs, archival and read replicas are Mongo features; on this
+engine deletes cascade right after the delete instead.
+"""
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+import busca
+import checkins
+import progresso
+from repositorio import (
+    ConflitoHorario, Repositorio, RepositorioAdmins, RepositorioAgendas, RepositorioAlunos, RepositorioCheckins,
+    RepositorioIdempotencia, RepositorioPessoas, RepositorioTreinos, mudou_horario, slot_treino,
+)
+from tenancy import TenantRouter, tenant_atual
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # Durable at checkpoints; a power loss may drop the last commits but never corrupts
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+)
+STATEMENTS_POR_CONEXAO = 256
+LIMITE_LISTAGEM = 1000
+# Upper bound of a prefix range: sorts after every string starting with the prefix
+FIM_PREFIXO = "\U0010ffff"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS admins (
+    id TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    senha TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alunos (
+    id TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    endereco TEXT,
+    idade INTEGER NOT NULL,
+    email TEXT,
+    ultimo_checkin TEXT,
+    busca_nome TEXT NOT NULL,
+    busca_email TEXT NOT NULL,
+    treinos_total INTEGER NOT NULL DEFAULT 0,
+    treinos_concluidos INTEGER NOT NULL DEFAULT 0,
+    ultimo_treino TEXT,
+    nivel TEXT
+);
+CREATE INDEX IF NOT EXISTS alunos_email ON alunos (email);
+CREATE INDEX IF NOT EXISTS alunos_busca_nome ON alunos (busca_nome);
+CREATE INDEX IF NOT EXISTS alunos_busca_email ON alunos (busca_email);
+CREATE TABLE IF NOT EXISTS alunos_tokens (
+    token TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (token, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS alunos_tokens_id ON alunos_tokens (id);
+-- Completed sessions per aluno and ISO week, for the weekly frequency
+CREATE TABLE IF NOT EXISTS alunos_semanas (
+    aluno_id TEXT NOT NULL,
+    semana TEXT NOT NULL,
+    treinos INTEGER NOT NULL,
+    PRIMARY KEY (aluno_id, semana)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS instrutores (
+    id TEXT PRIMARY KEY,
+    nome TEXT NOT NULL,
+    idade INTEGER NOT NULL,
+    email TEXT,
+    telefone TEXT,
+    busca_nome TEXT NOT NULL,
+    busca_email TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS instrutores_email ON instrutores (email);
+CREATE INDEX IF NOT EXISTS instrutores_busca_nome ON instrutores (busca_nome);
+CREATE INDEX IF NOT EXISTS instrutores_busca_email ON instrutores (busca_email);
+CREATE TABLE IF NOT EXISTS instrutores_tokens (
+    token TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (token, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS instrutores_tokens_id ON instrutores_tokens (id);
+
+CREATE TABLE IF NOT EXISTS agendas_fixas (
+    id TEXT PRIMARY KEY,
+    instrutor_id_instrutor TEXT NOT NULL,
+    dias_semana TEXT NOT NULL,
+    hora_inicio TEXT NOT NULL,
+    hora_fim TEXT NOT NULL,
+    disponivel INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS agendas_fixas_instrutor ON agendas_fixas (instrutor_id_instrutor);
+
+CREATE TABLE IF NOT EXISTS treinos (
+    id TEXT PRIMARY KEY,
+    tipo_treino TEXT NOT NULL,
+    nome_treino TEXT NOT NULL,
+    aluno_id_aluno TEXT NOT NULL,
+    data TEXT,
+    hora_inicio TEXT,
+    hora_fim TEXT,
+    instrutor_id_instrutor TEXT,
+    descricao TEXT,
+    nivel TEXT,
+    concluido INTEGER NOT NULL DEFAULT 0,
+    -- Booked minutes of personalised treinos, NULL for the others
+    inicio INTEGER,
+    fim INTEGER
+);
+CREATE INDEX IF NOT EXISTS treinos_data ON treinos (data);
+CREATE INDEX IF NOT EXISTS treinos_aluno_sessoes ON treinos (aluno_id_aluno, concluido, data);
+CREATE INDEX IF NOT EXISTS treinos_slot ON treinos (instrutor_id_instrutor, data, inicio);
+
+CREATE TABLE IF NOT EXISTS checkins (
+    id TEXT PRIMARY KEY,
+    aluno_id_aluno TEXT NOT NULL,
+    momento TEXT NOT NULL,
+    origem TEXT,
+    tipo TEXT NOT NULL DEFAULT 'checkin',
+    treino_id TEXT,
+    exercicio TEXT
+);
+CREATE INDEX IF NOT EXISTS checkins_aluno_momento ON checkins (aluno_id_aluno, momento);
+
+CREATE TABLE IF NOT EXISTS frequencia_diaria (
+    data TEXT PRIMARY KEY,
+    checkins INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Responses stored under an Idempotency-Key; times are Unix seconds
+CREATE TABLE IF NOT EXISTS idempotencia (
+    chave TEXT PRIMARY KEY,
+    impressao TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    lease_ate REAL,
+    expira REAL NOT NULL,
+    status INTEGER,
+    headers TEXT,
+    corpo BLOB
+);
+CREATE INDEX IF NOT EXISTS idempotencia_expira ON idempotencia (expira);
+"""
+
+# Created after MIGRACOES, since older files lack the columns
+SCHEMA_PROGRESSO = """
+CREATE INDEX IF NOT EXISTS alunos_treinos_concluidos ON alunos (treinos_concluidos);
+CREATE INDEX IF NOT EXISTS alunos_treinos_total ON alunos (treinos_total);
+CREATE INDEX IF NOT EXISTS alunos_ultimo_treino ON alunos (ultimo_treino);
+CREATE INDEX IF NOT EXISTS alunos_nivel ON alunos (nivel, ultimo_treino);
+"""
+# Columns added to existing tables after their first release: (table, column, definition)
+MIGRACOES = (
+    ("alunos", "treinos_total", "INTEGER NOT NULL DEFAULT 0"),
+    ("alunos", "treinos_concluidos", "INTEGER NOT NULL DEFAULT 0"),
+    ("alunos", "ultimo_treino", "TEXT"),
+    ("alunos", "nivel", "TEXT"),
+    ("checkins", "tipo", "TEXT NOT NULL DEFAULT 'checkin'"),
+    ("checkins", "treino_id", "TEXT"),
+    ("checkins", "exercicio", "TEXT"),
+)
+
+COLUNAS_PROGRESSO = ("treinos_total", "treinos_concluidos", "ultimo_treino", "nivel")
+COLUNAS_AGENDA = ("instrutor_id_instrutor", "dias_semana", "hora_inicio", "hora_fim", "disponivel")
+COLUNAS_TREINO = ("tipo_treino", "nome_treino", "aluno_id_aluno", "data", "hora_inicio", "hora_fim",
+                  "instrutor_id_instrutor", "descricao", "nivel", "concluido")
+CONFLITO_SQL = (
+    "SELECT 1 FROM treinos WHERE instrutor_id_instrutor = ? AND data = ? AND inicio < ? AND fim > ? AND id <> ? LIMIT 1"
+)
+IDS_SQL = "SELECT value FROM json_each(?)"
+SESSOES_SQL = f"SELECT id, {', '.join(progresso.CAMPOS_TREINO)} FROM treinos"
+PROGRESSO_SQL = """
+UPDATE alunos SET
+    treinos_total = treinos_total + ?1,
+    treinos_concluidos = treinos_concluidos + ?2,
+    nivel = CASE WHEN ?3 IS NOT NULL AND (ultimo_treino IS NULL OR ultimo_treino <= ?3) THEN ?4 ELSE nivel END,
+    ultimo_treino = CASE WHEN ?3 IS NOT NULL AND (ultimo_treino IS NULL OR ultimo_treino < ?3)
+        THEN ?3 ELSE ultimo_treino END
+WHERE id = ?5
+"""
+SEMANAS_SQL = (
+    "INSERT INTO alunos_semanas (aluno_id, semana, treinos) VALUES (?, ?, ?) "
+    "ON CONFLICT (aluno_id, semana) DO UPDATE SET treinos = treinos + excluded.treinos"
+)
+ULTIMA_SESSAO_SQL = (
+    "SELECT data, nivel FROM treinos WHERE aluno_id_aluno = ? AND concluido = 1 AND data IS NOT NULL "
+    "ORDER BY data DESC LIMIT 1"
+)
+FREQUENCIA_SQL = (
+    f"SELECT aluno_id, SUM(treinos) AS treinos FROM alunos_semanas "
+    f"WHERE aluno_id IN ({IDS_SQL}) AND semana IN ({IDS_SQL}) GROUP BY aluno_id"
+)
+
+
+def novo_id() -> str:
+    return str(ObjectId())
+
+
+def ids_json(ids: Iterable[str]) -> str:
+    return json.dumps(list(ids))
+
+
+def momento_texto(momento) -> str:
+    # Fixed width, so stored moments compare correctly as text
+    return momento.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _linhas(cursor) -> List[dict]:
+    return [dict(linha) for linha in cursor]
+
+
+def _em_transacao(con: sqlite3.Connection, fn, args):
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        resultado = fn(con, *args)
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+    return resultado
+
+
+def _aplicar_progresso(con: sqlite3.Connection, pares: list):
+    """Apply the summary deltas of treino changes (see progresso.variacoes)."""
+    for aluno_id, v in progresso.variacoes(pares).items():
+        data, nivel = v['entrada'] or (None, None)
+        con.execute(PROGRESSO_SQL, (
+            v['inc'].get('treinos_total', 0), v['inc'].get('treinos_concluidos', 0), data, nivel, aluno_id
+        ))
+        con.executemany(SEMANAS_SQL, [(aluno_id, semana, n) for semana, n in v['semanas'].items()])
+        if progresso.precisa_reparo(v):
+            ultima = con.execute(ULTIMA_SESSAO_SQL, (aluno_id,)).fetchone()
+            con.execute(
+                "UPDATE alunos SET ultimo_treino = ?, nivel = ? WHERE id = ? AND ultimo_treino = ?",
+                (ultima['data'] if ultima else None, ultima['nivel'] if ultima else None, aluno_id, v['saida'])
+            )
+
+
+class BancoSQLite:
+    """One database file, used only from the executor's threads."""
+
+    def __init__(self, caminho: Path, executor: ThreadPoolExecutor):
+        self.caminho = caminho
+        self.name = caminho.stem
+        self._executor = executor
+        self._local = threading.local()
+        self._conexoes: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _conexao(self) -> sqlite3.Connection:
+        con = getattr(self._local, "conexao", None)
+        if con is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE.
+            # Each connection stays on its thread; check_same_thread is off only so
+            # fechar() can close them from the event loop.
+            con = sqlite3.connect(self.caminho, isolation_level=None, check_same_thread=False,
+                                  cached_statements=STATEMENTS_POR_CONEXAO)
+            con.row_factory = sqlite3.Row
+            for pragma in PRAGMAS:
+                con.execute(pragma)
+            self._local.conexao = con
+            with self._lock:
+                self._conexoes.append(con)
+        return con
+
+    async def executar(self, fn, *args):
+        """Run ``fn(conexao, *args)`` on the thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._conexao(), *args))
+
+    async def transacao(self, fn, *args):
+        """Run ``fn(conexao, *args)`` inside BEGIN IMMEDIATE ... COMMIT."""
+        return await self.executar(_em_transacao, fn, args)
+
+    async def ler(self, sql: str, parametros: tuple = ()) -> List[dict]:
+        return await self.executar(lambda con: _linhas(con.execute(sql, parametros)))
+
+    async def ler_um(self, sql: str, parametros: tuple = ()) -> Optional[dict]:
+        linha = await self.executar(lambda con: con.execute(sql, parametros).fetchone())
+        return dict(linha) if linha else None
+
+    async def escrever(self, sql: str, parametros: tuple = ()) -> int:
+        return await self.executar(lambda con: con.execute(sql, parametros).rowcount)
+
+    def fechar(self):
+        with self._lock:
+            for con in self._conexoes:
+                con.close()
+            self._conexoes.clear()
+
+
+class AdminsSQLite(RepositorioAdmins):
+    SELECT = "SELECT id AS id_admin, nome, email, senha FROM admins"
+
+    def __init__(self, repo: "RepositorioSQLite"):
+        self.repo = repo
+
+    async def por_email(self, email: str) -> Optional[dict]:
+        return await self.repo.banco().ler_um(self.SELECT + " WHERE email = ?", (email,))
+
+    async def obter(self, id_admin: str) -> Optional[dict]:
+        return await self.repo.banco().ler_um(self.SELECT + " WHERE id = ?", (id_admin,))
+
+    async def criar(self, dados: dict) -> dict:
+        id_admin = novo_id()
+        await self.repo.banco().escrever(
+            "INSERT INTO admins (id, nome, email, senha) VALUES (?, ?, ?, ?)",
+            (id_admin, dados['nome'], dados['email'], dados['senha'])
+        )
+        return {**dados, "id_admin": id_admin}
+
+
+class PessoasSQLite(RepositorioPessoas):
+    """Alunos or instrutores; search tokens live in ``<tabela>_tokens``."""
+
+    def __init__(self, repo: "RepositorioSQLite", tabela: str, campo_id: str, colunas: tuple,
+                 somente_leitura: tuple = ()):
+        self.repo = repo
+        self.tabela = tabela
+        self.campo_id = campo_id
+        self.colunas = colunas
+        self.select = f"SELECT id AS {campo_id}, {', '.join(colunas + somente_leitura)} FROM {tabela}"
+
+    def _gravar_tokens(self, con: sqlite3.Connection, id_: str, tokens: List[str]):
+        con.execute(f"DELETE FROM {self.tabela}_tokens WHERE id = ?", (id_,))
+        con.executemany(f"INSERT INTO {self.tabela}_tokens (token, id) VALUES (?, ?)", [(t, id_) for t in tokens])
+
+    async def listar(self) -> List[dict]:
+        return await self.repo.banco().ler(self.select + " ORDER BY rowid LIMIT ?", (LIMITE_LISTAGEM,))
+
+    async def buscar(self, q: str, limite: int) -> List[dict]:
+        termo = busca.normalizar_busca(q)
+        if not termo:
+            return []
+        limite = busca.limitar(limite)
+        tokens = busca.tokens_consulta(termo)
+        faixa = (termo, termo + FIM_PREFIXO)
+
+        def consultar(con):
+            por_nome = _linhas(con.execute(
+                self.select + " WHERE busca_nome >= ? AND busca_nome < ? ORDER BY busca_nome LIMIT ?", (*faixa, limite)
+            ))
+            por_email = _linhas(con.execute(
+                self.select + " WHERE busca_email >= ? AND busca_email < ? ORDER BY busca_email LIMIT ?",
+                (*faixa, limite)
+            ))
+            por_token = []
+            if tokens:
+                condicoes = " AND ".join(
+                    f"id IN (SELECT id FROM {self.tabela}_tokens WHERE token >= ? AND token < ?)" for _ in tokens
+                )
+                parametros = [valor for t in tokens for valor in (t, t + FIM_PREFIXO)]
+                por_token = _linhas(con.execute(f"{self.select} WHERE {condicoes} LIMIT ?", (*parametros, limite)))
+            return por_nome, por_email, por_token
+
+        por_nome, por_email, por_token = await self.repo.banco().executar(consultar)
+        return busca.ranquear(termo, por_nome, por_email, por_token, limite, lambda doc: doc[self.campo_id])
+
+    async def obter(self, id_: str) -> Optional[dict]:
+        return await self.repo.banco().ler_um(self.select + " WHERE id = ?", (id_,))
+
+    async def obter_muitos(self, ids: Iterable) -> Dict[str, Optional[dict]]:
+        validos = {str(i) for i in ids if i and ObjectId.is_valid(str(i))}
+        if not validos:
+            return {}
+        docs = await self.repo.banco().ler(self.select + f" WHERE id IN ({IDS_SQL})", (ids_json(validos),))
+        encontrados = {doc[self.campo_id]: doc for doc in docs}
+        return {id_: encontrados.get(id_) for id_ in validos}
+
+    async def email_em_uso(self, email: str) -> bool:
+        linha = await self.repo.banco().ler_um(f"SELECT 1 FROM {self.tabela} WHERE email = ? LIMIT 1", (email,))
+        return linha is not None
+
+    async def criar(self, dados: dict) -> dict:
+        id_ = novo_id()
+        doc = {**{coluna: None for coluna in self.colunas}, **dados}
+        chaves = busca.campos_busca(doc.get('nome'), doc.get('email'))
+        colunas = self.colunas + ("busca_nome", "busca_email")
+        valores = [doc[coluna] for coluna in self.colunas] + [chaves['busca_nome'], chaves['busca_email']]
+
+        def inserir(con):
+            con.execute(
+                f"INSERT INTO {self.tabela} (id, {', '.join(colunas)}) VALUES (?{', ?' * len(colunas)})",
+                (id_, *valores)
+            )
+            self._gravar_tokens(con, id_, chaves['busca_tokens'])
+
+        await self.repo.banco().transacao(inserir)
+        return {**doc, self.campo_id: id_}
+
+    async def atualizar(self, id_: str, dados: dict) -> Optional[dict]:
+        dados = {k: v for k, v in dados.items() if k in self.colunas}
+
+        def alterar(con):
+            atual = con.execute(f"SELECT nome, email FROM {self.tabela} WHERE id = ?", (id_,)).fetchone()
+            if atual is None:
+                return None
+            alteracoes = dict(dados)
+            if 'nome' in dados or 'email' in dados:
+                merged = {**dict(atual), **dados}
+                chaves = busca.campos_busca(merged.get('nome'), merged.get('email'))
+                alteracoes.update(busca_nome=chaves['busca_nome'], busca_email=chaves['busca_email'])
+                self._gravar_tokens(con, id_, chaves['busca_tokens'])
+            atribuicoes = ", ".join(f"{coluna} = ?" for coluna in alteracoes)
+            con.execute(f"UPDATE {self.tabela} SET {atribuicoes} WHERE id = ?", (*alteracoes.values(), id_))
+            linha = con.execute(self.select + " WHERE id = ?", (id_,)).fetchone()
+            return dict(linha)
+
+        return await self.repo.banco().transacao(alterar)
+
+    async def remover(self, id_: str) -> bool:
+        def apagar(con):
+            con.execute(f"DELETE FROM {self.tabela}_tokens WHERE id = ?", (id_,))
+            return con.execute(f"DELETE FROM {self.tabela} WHERE id = ?", (id_,)).rowcount
+
+        return await self.repo.banco().transacao(apagar) > 0
+
+    async def contar(self) -> int:
+        return (await self.repo.banco().ler_um(f"SELECT COUNT(*) AS total FROM {self.tabela}"))['total']
+
+
+class AlunosSQLite(PessoasSQLite, RepositorioAlunos):
+    """The summary lives in columns of ``alunos`` plus ``alunos_semanas`` (see progresso.py)."""
+
+    def __init__(self, repo: "RepositorioSQLite"):
+        super().__init__(repo, "alunos", "id_aluno", ("nome", "endereco", "idade", "email", "ultimo_checkin"),
+                         COLUNAS_PROGRESSO)
+
+    async def _com_frequencia(self, docs: List[dict]) -> List[dict]:
+        if not docs:
+            return docs
+        linhas = await self.repo.banco().ler(FREQUENCIA_SQL, (
+            ids_json(doc['id_aluno'] for doc in docs), ids_json(progresso.semanas_recentes())
+        ))
+        recentes = {linha['aluno_id']: linha['treinos'] for linha in linhas}
+        for doc in docs:
+            doc['frequencia_semanal'] = progresso.frequencia_semanal(recentes.get(doc['id_aluno'], 0))
+        return docs
+
+    async def listar(self, ordenar: Optional[Tuple[str, bool]] = None, nivel: Optional[str] = None,
+                     concluidos_min: Optional[int] = None, ultimo_treino_desde: Optional[str] = None) -> List[dict]:
+        condicoes, parametros = [], []
+        for condicao, valor in (("nivel = ?", nivel), ("treinos_concluidos >= ?", concluidos_min),
+                                ("ultimo_treino >= ?", ultimo_treino_desde)):
+            if valor is not None:
+                condicoes.append(condicao)
+                parametros.append(valor)
+        where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        ordem = "rowid"
+        if ordenar:
+            campo, decrescente = ordenar
+            ordem = f"{'busca_nome' if campo == 'nome' else campo} {'DESC' if decrescente else 'ASC'}, rowid"
+        docs = await self.repo.banco().ler(
+            f"{self.select}{where} ORDER BY {ordem} LIMIT ?", (*parametros, LIMITE_LISTAGEM)
+        )
+        return await self._com_frequencia(docs)
+
+    async def buscar(self, q: str, limite: int) -> List[dict]:
+        return await self._com_frequencia(await super().buscar(q, limite))
+
+    async def atualizar(self, id_: str, dados: dict) -> Optional[dict]:
+        doc = await super().atualizar(id_, dados)
+        return (await self._com_frequencia([doc]))[0] if doc else None
+
+    async def criar(self, dados: dict) -> dict:
+        return {**await super().criar(dados), **progresso.para_api(None)}
+
+    async def remover(self, id_: str) -> bool:
+        def apagar(con):
+            con.execute("DELETE FROM alunos_tokens WHERE id = ?", (id_,))
+            con.execute("DELETE FROM alunos_semanas WHERE aluno_id = ?", (id_,))
+            return con.execute("DELETE FROM alunos WHERE id = ?", (id_,)).rowcount
+
+        return await self.repo.banco().transacao(apagar) > 0
+
+    async def reconstruir_progresso(self, lote: int = 500, paralelos: int = 4) -> int:
+        banco = self.repo.banco()
+
+        def recalcular(con, ids_lote):
+            treinos = _linhas(con.execute(
+                f"{SESSOES_SQL} WHERE aluno_id_aluno IN ({IDS_SQL})", (ids_json(ids_lote),)
+            ))
+            por_aluno = {}
+            for treino in treinos:
+                por_aluno.setdefault(treino['aluno_id_aluno'], []).append(treino)
+            for aluno_id in ids_lote:
+                resumo = progresso.resumir(por_aluno.get(aluno_id, []))
+                con.execute(
+                    "UPDATE alunos SET treinos_total = ?, treinos_concluidos = ?, ultimo_treino = ?, nivel = ? "
+                    "WHERE id = ?",
+                    (*(resumo[coluna] for coluna in COLUNAS_PROGRESSO), aluno_id)
+                )
+                con.execute("DELETE FROM alunos_semanas WHERE aluno_id = ?", (aluno_id,))
+                con.executemany(SEMANAS_SQL, [(aluno_id, semana, n) for semana, n in resumo['semanas'].items()])
+            return len(ids_lote)
+
+        async def ids():
+            for linha in await banco.ler("SELECT id FROM alunos ORDER BY rowid"):
+                yield linha['id']
+
+        # Writers queue on the file lock, so extra batches mostly overlap the reads
+        return await progresso.em_lotes(ids(), lote, paralelos, lambda ids_lote: banco.transacao(recalcular, ids_lote))
+
+
+class AgendasSQLite(RepositorioAgendas):
+    SELECT = f"SELECT id AS id_agenda, {', '.join(COLUNAS_AGENDA)} FROM agendas_fixas"
+
+    def __init__(self, repo: "RepositorioSQLite"):
+        self.repo = repo
+
+    @staticmethod
+    def _doc(linha) -> Optional[dict]:
+        if linha is None:
+            return None
+        doc = dict(linha)
+        doc['disponivel'] = bool(doc['disponivel'])
+        return doc
+
+    async def listar(self, disponivel: Optional[bool] = None) -> List[dict]:
+        if disponivel is None:
+            linhas = await self.repo.banco().ler(self.SELECT + " ORDER BY rowid LIMIT ?", (LIMITE_LISTAGEM,))
+        else:
+            linhas = await self.repo.banco().ler(
+                self.SELECT + " WHERE disponivel = ? ORDER BY rowid LIMIT ?", (int(disponivel), LIMITE_LISTAGEM)
+            )
+        return [self._doc(linha) for linha in linhas]
+
+    async def instrutores_no_horario(self, hora_inicio: str, hora_fim: str) -> List[str]:
+        linhas = await self.repo.banco().ler(
+            "SELECT instrutor_id_instrutor FROM agendas_fixas "
+            "WHERE disponivel = 1 AND hora_inicio <= ? AND hora_fim >= ?",
+            (hora_inicio, hora_fim)
+        )
+        return [linha['instrutor_id_instrutor'] for linha in linhas]
+
+    async def por_instrutor(self, instrutor_id: str) -> Optional[dict]:
+        return self._doc(await self.repo.banco().ler_um(
+            self.SELECT + " WHERE instrutor_id_instrutor = ? ORDER BY rowid LIMIT 1", (instrutor_id,)
+        ))
+
+    async def criar(self, dados: dict) -> dict:
+        id_agenda = novo_id()
+        doc = {**dados, "disponivel": bool(dados.get('disponivel', True))}
+        await self.repo.banco().escrever(
+            f"INSERT INTO agendas_fixas (id, {', '.join(COLUNAS_AGENDA)}) VALUES (?, ?, ?, ?, ?, ?)",
+            (id_agenda, *(doc[coluna] for coluna in COLUNAS_AGENDA))
+        )
+        return {**doc, "id_agenda": id_agenda}
+
+    async def atualizar(self, id_agenda: str, dados: dict) -> Optional[dict]:
+        dados = {k: v for k, v in dados.items() if k in COLUNAS_AGENDA}
+
+        def alterar(con):
+            atribuicoes = ", ".join(f"{coluna} = ?" for coluna in dados)
+            cursor = con.execute(f"UPDATE agendas_fixas SET {atribuicoes} WHERE id = ?", (*dados.values(), id_agenda))
+            if cursor.rowcount == 0:
+                return None
+            return self._doc(con.execute(self.SELECT + " WHERE id = ?", (id_agenda,)).fetchone())
+
+        return await self.repo.banco().transacao(alterar)
+
+    async def remover(self, id_agenda: str) -> bool:
+        return await self.repo.banco().escrever("DELETE FROM agendas_fixas WHERE id = ?", (id_agenda,)) > 0
+
+    async def alternar_disponibilidade(self, instrutor_id: str) -> Optional[bool]:
+        def alternar(con):
+            linha = con.execute(
+                "SELECT id, disponivel FROM agendas_fixas WHERE instrutor_id_instrutor = ? ORDER BY rowid LIMIT 1",
+                (instrutor_id,)
+            ).fetchone()
+            if linha is None:
+                return None
+            novo_status = not linha['disponivel']
+            con.execute("UPDATE agendas_fixas SET disponivel = ? WHERE id = ?", (int(novo_status), linha['id']))
+            return novo_status
+
+        return await self.repo.banco().transacao(alternar)
+
+    async def contar(self, disponivel: Optional[bool] = None) -> int:
+        if disponivel is None:
+            linha = await self.repo.banco().ler_um("SELECT COUNT(*) AS total FROM agendas_fixas")
+        else:
+            linha = await self.repo.banco().ler_um(
+                "SELECT COUNT(*) AS total FROM agendas_fixas WHERE disponivel = ?", (int(disponivel),)
+            )
+        return linha['total']
+
+    async def remover_do_instrutor(self, instrutor_id: str) -> int:
+        return await self.repo.banco().escrever(
+            "DELETE FROM agendas_fixas WHERE instrutor_id_instrutor = ?", (instrutor_id,)
+        )
+
+
+class TreinosSQLite(RepositorioTreinos):
+    SELECT = f"SELECT id AS id_treino, {', '.join(COLUNAS_TREINO)} FROM treinos"
+
+    def __init__(self, repo: "RepositorioSQLite"):
+        self.repo = repo
+
+    @staticmethod
+    def _doc(linha) -> Optional[dict]:
+        if linha is None:
+            return None
+        doc = dict(linha)
+        doc['concluido'] = bool(doc['concluido'])
+        return doc
+
+    @staticmethod
+    def _conflita(con: sqlite3.Connection, id_treino: str, instrutor_id: str, data: str, slot: tuple) -> bool:
+        inicio, fim = slot
+        return con.execute(CONFLITO_SQL, (instrutor_id, data, fim, inicio, id_treino)).fetchone() is not None
+
+    async def listar(self, data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> List[dict]:
+        condicoes, parametros = [], []
+        if data_inicio:
+            condicoes.append("data >= ?")
+            parametros.append(data_inicio)
+        if data_fim:
+            condicoes.append("data <= ?")
+            parametros.append(data_fim)
+        where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        linhas = await self.repo.banco().ler(
+            f"{self.SELECT}{where} ORDER BY rowid LIMIT ?", (*parametros, LIMITE_LISTAGEM)
+        )
+        return [self._doc(linha) for linha in linhas]
+
+    async def listar_personalizados(self) -> List[dict]:
+        linhas = await self.repo.banco().ler(
+            self.SELECT + " WHERE tipo_treino = 'Personalizado' AND data IS NOT NULL ORDER BY rowid LIMIT ?",
+            (LIMITE_LISTAGEM,)
+        )
+        return [self._doc(linha) for linha in linhas]
+
+    async def obter(self, id_treino: str) -> Optional[dict]:
+        return self._doc(await self.repo.banco().ler_um(self.SELECT + " WHERE id = ?", (id_treino,)))
+
+    async def criar(self, dados: dict) -> dict:
+        id_treino = novo_id()
+        doc = {**{coluna: None for coluna in COLUNAS_TREINO}, **dados}
+        doc['concluido'] = bool(doc['concluido'])
+        slot = slot_treino(doc)
+
+        def inserir(con):
+            if slot and self._conflita(con, id_treino, doc['instrutor_id_instrutor'], doc['data'], slot):
+                raise ConflitoHorario()
+            con.execute(
+                f"INSERT INTO treinos (id, {', '.join(COLUNAS_TREINO)}, inicio, fim) "
+                f"VALUES (?{', ?' * (len(COLUNAS_TREINO) + 2)})",
+                (id_treino, *(doc[coluna] for coluna in COLUNAS_TREINO), *(slot or (None, None)))
+            )
+            _aplicar_progresso(con, [(None, doc)])
+
+        await self.repo.banco().transacao(inserir)
+        return {**doc, "id_treino": id_treino}
+
+    async def atualizar(self, id_treino: str, dados: dict, atual: dict) -> Optional[dict]:
+        dados = {k: v for k, v in dados.items() if k in COLUNAS_TREINO}
+
+        def alterar(con):
+            # Re-read inside the transaction: ``atual`` may be stale by now
+            linha = self._doc(con.execute(self.SELECT + " WHERE id = ?", (id_treino,)).fetchone())
+            if linha is None:
+                return None
+            novo = {**linha, **dados}
+            slot = slot_treino(novo)
+            if slot and mudou_horario(linha, dados) and self._conflita(
+                con, id_treino, novo['instrutor_id_instrutor'], novo['data'], slot
+            ):
+                raise ConflitoHorario()
+            alteracoes = {**dados, "inicio": slot[0] if slot else None, "fim": slot[1] if slot else None}
+            atribuicoes = ", ".join(f"{coluna} = ?" for coluna in alteracoes)
+            con.execute(f"UPDATE treinos SET {atribuicoes} WHERE id = ?", (*alteracoes.values(), id_treino))
+            _aplicar_progresso(con, [(linha, novo)])
+            return self._doc(con.execute(self.SELECT + " WHERE id = ?", (id_treino,)).fetchone())
+
+        return await self.repo.banco().transacao(alterar)
+
+    @staticmethod
+    def _remover(con: sqlite3.Connection, where: str, parametros: tuple) -> List[str]:
+        """Delete the matching treinos and their share of the summaries; their ids."""
+        removidos = _linhas(con.execute(f"{SESSOES_SQL} WHERE {where}", parametros))
+        ids = [treino['id'] for treino in removidos]
+        con.execute(f"DELETE FROM treinos WHERE id IN ({IDS_SQL})", (ids_json(ids),))
+        _aplicar_progresso(con, [(treino, None) for treino in removidos])
+        return ids
+
+    async def remover(self, id_treino: str) -> bool:
+        return len(await self.repo.banco().transacao(self._remover, "id = ?", (id_treino,))) > 0
+
+    async def alternar_concluido(self, id_treino: str) -> Optional[bool]:
+        def alternar(con):
+            linha = con.execute(SESSOES_SQL + " WHERE id = ?", (id_treino,)).fetchone()
+            if linha is None:
+                return None
+            novo_status = not linha['concluido']
+            con.execute("UPDATE treinos SET concluido = ? WHERE id = ?", (int(novo_status), id_treino))
+            _aplicar_progresso(con, [(dict(linha), {**dict(linha), "concluido": novo_status})])
+            return novo_status
+
+        return await self.repo.banco().transacao(alternar)
+
+    async def ocupados(self, instrutor_ids: Iterable[str], data: str) -> dict:
+        linhas = await self.repo.banco().ler(
+            "SELECT instrutor_id_instrutor, inicio, fim FROM treinos "
+            f"WHERE data = ? AND inicio IS NOT NULL AND instrutor_id_instrutor IN ({IDS_SQL})",
+            (data, ids_json(instrutor_ids))
+        )
+        ocupados = {}
+        for linha in linhas:
+            ocupados.setdefault(linha['instrutor_id_instrutor'], []).append((linha['inicio'], linha['fim']))
+        return ocupados
+
+    async def contar(self) -> int:
+        return (await self.repo.banco().ler_um("SELECT COUNT(*) AS total FROM treinos"))['total']
+
+    async def concluir_muitos(self, ids: List[str], concluido: bool) -> Set[str]:
+        def concluir(con):
+            encontrados = _linhas(con.execute(f"{SESSOES_SQL} WHERE id IN ({IDS_SQL})", (ids_json(ids),)))
+            mudando = [treino for treino in encontrados if bool(treino['concluido']) != concluido]
+            con.execute(
+                f"UPDATE treinos SET concluido = ? WHERE id IN ({IDS_SQL})",
+                (int(concluido), ids_json(treino['id'] for treino in mudando))
+            )
+            _aplicar_progresso(con, [(treino, {**treino, "concluido": concluido}) for treino in mudando])
+            return {treino['id'] for treino in encontrados}
+
+        return await self.repo.banco().transacao(concluir)
+
+    async def reatribuir_muitos(self, ids: List[str], instrutor_id: str) -> Dict[str, str]:
+        def reatribuir(con):
+            treinos = {
+                linha['id_treino']: dict(linha)
+                for linha in con.execute(self.SELECT + f" WHERE id IN ({IDS_SQL})", (ids_json(ids),))
+            }
+            status = {}
+            for id_treino in ids:
+                treino = treinos.get(id_treino)
+                if not treino:
+                    continue
+                slot = slot_treino({**treino, "instrutor_id_instrutor": instrutor_id})
+                # Updated one by one, so later items in the batch see the earlier ones
+                if slot and self._conflita(con, id_treino, instrutor_id, treino['data'], slot):
+                    status[id_treino] = "conflito"
+                    continue
+                con.execute(
+                    "UPDATE treinos SET instrutor_id_instrutor = ?, inicio = ?, fim = ? WHERE id = ?",
+                    (instrutor_id, *(slot or (None, None)), id_treino)
+                )
+                status[id_treino] = "ok"
+            return status
+
+        return await self.repo.banco().transacao(reatribuir)
+
+    async def remover_muitos(self, ids: List[str]) -> Set[str]:
+        return set(await self.repo.banco().transacao(self._remover, f"id IN ({IDS_SQL})", (ids_json(ids),)))
+
+    async def remover_por_filtro(self, filtro: dict, limite: int) -> List[str]:
+        filtro = {k: int(v) if isinstance(v, bool) else v for k, v in filtro.items() if k in COLUNAS_TREINO}
+        condicoes = " AND ".join(f"{coluna} = ?" for coluna in filtro)
+        return await self.repo.banco().transacao(
+            self._remover, f"{condicoes} ORDER BY rowid LIMIT ?", (*filtro.values(), limite)
+        )
+
+    async def remover_do_aluno(self, aluno_id: str) -> int:
+        # The aluno is gone, and its summary with it
+        return await self.repo.banco().escrever("DELETE FROM treinos WHERE aluno_id_aluno = ?", (aluno_id,))
+
+    async def remover_personalizados_do_instrutor(self, instrutor_id: str) -> int:
+        removidos = await self.repo.banco().transacao(
+            self._remover, "tipo_treino = 'Personalizado' AND instrutor_id_instrutor = ?", (instrutor_id,)
+        )
+        return len(removidos)
+
+
+class CheckinsSQLite(RepositorioCheckins):
+    def __init__(self, repo: "RepositorioSQLite"):
+        self.repo = repo
+
+    def destino(self):
+        return self.repo.banco()
+
+    async def gravar(self, destino: BancoSQLite, documentos: List[dict]):
+        def gravar(con):
+            gravados = []
+            for doc in documentos:
+                cursor = con.execute(
+                    "INSERT OR IGNORE INTO checkins (id, aluno_id_aluno, momento, origem, tipo, treino_id, exercicio) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (str(doc['_id']), str(doc['aluno_id_aluno']), momento_texto(doc['momento']), doc.get('origem'),
+                     doc.get('tipo', checkins.CHEGADA), str(doc['treino_id']) if doc.get('treino_id') else None,
+                     doc.get('exercicio'))
+                )
+                if cursor.rowcount:
+                    gravados.append(doc)
+
+            ultimo, por_dia = {}, {}
+            # Only arrivals count in the aggregates
+            for doc in (d for d in gravados if d.get('tipo', checkins.CHEGADA) == checkins.CHEGADA):
+                aluno, momento = str(doc['aluno_id_aluno']), momento_texto(doc['momento'])
+                ultimo[aluno] = max(ultimo.get(aluno, momento), momento)
+                por_dia[momento[:10]] = por_dia.get(momento[:10], 0) + 1
+            con.executemany(
+                "UPDATE alunos SET ultimo_checkin = ?1 "
+                "WHERE id = ?2 AND (ultimo_checkin IS NULL OR ultimo_checkin < ?1)",
+                [(momento, aluno) for aluno, momento in ultimo.items()]
+            )
+            con.executemany(
+                "INSERT INTO frequencia_diaria (data, checkins) VALUES (?, ?) "
+                "ON CONFLICT (data) DO UPDATE SET checkins = checkins + excluded.checkins",
+                list(por_dia.items())
+            )
+            return len(gravados), len(documentos) - len(gravados)
+
+        return await destino.transacao(gravar)
+
+    async def frequencia(self, data_inicio: Optional[str], data_fim: Optional[str]) -> List[dict]:
+        return await self.repo.banco().ler(
+            "SELECT data, checkins FROM frequencia_diaria WHERE data >= ? AND data <= ? ORDER BY data LIMIT ?",
+            (data_inicio or "", data_fim or FIM_PREFIXO, LIMITE_LISTAGEM)
+        )
+
+
+class IdempotenciaSQLite(RepositorioIdempotencia):
+    """Expired rows are purged by the writes themselves (no TTL monitor here)."""
+
+    def __init__(self, repo: "RepositorioSQLite"):
+        self.repo = repo
+
+    @staticmethod
+    def _registro(linha) -> dict:
+        registro = {"impressao": linha['impressao'], "estado": linha['estado']}
+        if linha['estado'] == "concluida":
+            registro.update(status=linha['status'], headers=json.loads(linha['headers']), corpo=bytes(linha['corpo']))
+        return registro
+
+    async def reservar(self, chave: str, impressao: str, lease: timedelta, ttl: timedelta) -> Optional[dict]:
+        def reservar(con):
+            momento = time.time()
+            con.execute("DELETE FROM idempotencia WHERE expira < ?", (momento,))
+            linha = con.execute("SELECT * FROM idempotencia WHERE chave = ?", (chave,)).fetchone()
+            if linha is not None and not (linha['estado'] == "em_andamento" and linha['lease_ate'] < momento):
+                return self._registro(linha)
+            con.execute(
+                "INSERT OR REPLACE INTO idempotencia (chave, impressao, estado, lease_ate, expira) "
+                "VALUES (?, ?, 'em_andamento', ?, ?)",
+                (chave, impressao, momento + lease.total_seconds(), momento + ttl.total_seconds())
+            )
+            return None
+
+        return await self.repo.banco().transacao(reservar)
+
+    async def concluir(self, chave: str, registro: dict, ttl: timedelta):
+        await self.repo.banco().escrever(
+            "UPDATE idempotencia SET estado = 'concluida', lease_ate = NULL, expira = ?, status = ?, headers = ?, "
+            "corpo = ? WHERE chave = ? AND estado = 'em_andamento'",
+            (time.time() + ttl.total_seconds(), registro['status'], json.dumps(registro['headers']), registro['corpo'],
+             chave)
+        )
+
+    async def liberar(self, chave: str):
+        await self.repo.banco().escrever(
+            "DELETE FROM idempotencia WHERE chave = ? AND estado = 'em_andamento'", (chave,)
+        )
+
+
+class RepositorioSQLite(Repositorio):
+    """One ``<nome do banco>.sqlite3`` file per tenant inside ``pasta``."""
+
+    motor = "sqlite"
+    cascata_em_segundo_plano = False
+
+    def __init__(self, pasta: Path, router: TenantRouter, threads: int = 4):
+        self.pasta = Path(pasta)
+        self.router = router
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="sqlite")
+        self._bancos: Dict[str, BancoSQLite] = {}
+        self.admins = AdminsSQLite(self)
+        self.alunos = AlunosSQLite(self)
+        self.instrutores = PessoasSQLite(self, "instrutores", "id_instrutor", ("nome", "idade", "email", "telefone"))
+        self.agendas = AgendasSQLite(self)
+        self.treinos = TreinosSQLite(self)
+        self.checkins = CheckinsSQLite(self)
+        self.idempotencia = IdempotenciaSQLite(self)
+
+    def banco(self) -> BancoSQLite:
+        nome = self.router.nome_banco(tenant_atual.get())
+        banco = self._bancos.get(nome)
+        if banco is None:
+            banco = self._bancos[nome] = BancoSQLite(self.pasta / f"{nome}.sqlite3", self.executor)
+        return banco
+
+    async def inicializar(self):
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        banco = self.banco()
+
+        def criar_schema(con) -> bool:
+            con.executescript(SCHEMA)
+            migradas = 0
+            for tabela, coluna, definicao in MIGRACOES:
+                existentes = {linha['name'] for linha in con.execute(f"PRAGMA table_info({tabela})")}
+                if coluna not in existentes:
+                    con.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+                    migradas += 1
+            con.executescript(SCHEMA_PROGRESSO)
+            # The old (aluno_id_aluno) index is a prefix of treinos_aluno_sessoes
+            con.execute("DROP INDEX IF EXISTS treinos_aluno")
+            return migradas > 0
+
+        if await banco.executar(criar_schema):
+            total = await self.alunos.reconstruir_progresso()
+            logger.info(f"Progresso calculado para alunos existentes ({total}) em {banco.caminho}")
+        logger.info(f"Banco SQLite pronto: {banco.caminho}")
+
+    async def estatisticas(self) -> dict:
+        return await self.banco().ler_um("""
+            SELECT
+                (SELECT COUNT(*) FROM alunos) AS total_alunos,
+                (SELECT COUNT(*) FROM instrutores) AS total_instrutores,
+                (SELECT COUNT(*) FROM agendas_fixas) AS total_agendas,
+                (SELECT COUNT(*) FROM treinos) AS total_treinos,
+                (SELECT COUNT(*) FROM agendas_fixas WHERE disponivel = 1) AS agendas_disponiveis
+        """)
+
+    async def fechar(self):
+        self.executor.shutdown(wait=True)
+        for banco in self._bancos.values():
+            banco.fechar()
@@ -0,0 +1,123 @@
+"""Atomic slot reservations for personalised treinos.
+
+Each (instrutor, data) pair owns one document in ``reservas``::
+
+    {"_id": "<instrutor_id>:<YYYY-MM-DD>",
+     "intervalos": [{"treino_id": "...", "inicio": 480, "fim": 540}, ...]}
+
+Times are minutes since midnight. A booking is a single conditional update
+that only matches while no other interval overlaps the new one, so two
+desks booking the same slot at the same moment are serialized by MongoDB's
+per-document atomicity; no global lock or transaction is needed.
+"""
+from typing import Iterable, Optional
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+
+def minutos(hora: str) -> int:
+    """Convert "HH:MM" to minutes since midnight."""
+    horas, minutos_ = hora.split(":")[:2]
+    return int(horas) * 60 + int(minutos_)
+
+
+def conflita(inicio: int, fim: int, outro_inicio: int, outro_fim: int) -> bool:
+    return inicio < outro_fim and fim > outro_inicio
+
+
+def chave_slot(instrutor_id: str, data: str) -> str:
+    return f"{instrutor_id}:{data}"
+
+
+def _sem_conflito(treino_id: str, inicio: int, fim: int) -> dict:
+    return {"intervalos": {"$not": {"$elemMatch": {
+        "treino_id": {"$ne": treino_id},
+        "inicio": {"$lt": fim},
+        "fim": {"$gt": inicio},
+    }}}}
+
+
+async def reservar(colecao, instrutor_id: str, data: str, inicio: int, fim: int, treino_id: str) -> bool:
+    """Reserve [inicio, fim) for ``treino_id``; False if it overlaps another treino.
+
+    If the treino already holds an interval in this slot document (time
+    change on the same day) the interval is moved in place.
+    """
+    chave = chave_slot(instrutor_id, data)
+    intervalo = {"treino_id": treino_id, "inicio": inicio, "fim": fim}
+    filtro_novo = {
+        "_id": chave,
+        "$and": [_sem_conflito(treino_id, inicio, fim), {"intervalos.treino_id": {"$ne": treino_id}}],
+    }
+
+    try:
+        await colecao.update_one(filtro_novo, {"$push": {"intervalos": intervalo}}, upsert=True)
+        return True
+    except DuplicateKeyError:
+        # The document exists but did not match: either a conflict, this
+        # treino already has an interval here, or another request created
+        # the document between our match and our insert.
+        pass
+
+    result = await colecao.update_one(filtro_novo, {"$push": {"intervalos": intervalo}})
+    if result.matched_count:
+        return True
+
+    result = await colecao.update_one(
+        {"_id": chave, "$and": [_sem_conflito(treino_id, inicio, fim), {"intervalos.treino_id": treino_id}]},
+        {"$set": {"intervalos.$[t].inicio": inicio, "intervalos.$[t].fim": fim}},
+        array_filters=[{"t.treino_id": treino_id}],
+    )
+    return result.matched_count > 0
+
+
+async def liberar(colecao, treino_id: str, instrutor_id: Optional[str] = None, data: Optional[str] = None):
+    filtro = {"_id": chave_slot(instrutor_id, data)} if instrutor_id and data else {"intervalos.treino_id": treino_id}
+    await colecao.update_many(filtro, {"$pull": {"intervalos": {"treino_id": treino_id}}})
+
+
+async def liberar_muitos(colecao, treino_ids: Iterable[str]):
+    treino_ids = list(treino_ids)
+    if treino_ids:
+        await colecao.update_many(
+            {"intervalos.treino_id": {"$in": treino_ids}},
+            {"$pull": {"intervalos": {"treino_id": {"$in": treino_ids}}}}
+        )
+
+
+async def intervalos_ocupados(colecao, instrutor_ids: Iterable[str], data: str) -> dict:
+    """instrutor_id -> [(inicio, fim), ...] for one day, in a single query."""
+    chaves = [chave_slot(instrutor_id, data) for instrutor_id in instrutor_ids]
+    ocupados = {}
+    async for doc in colecao.find({"_id": {"$in": chaves}}):
+        instrutor_id = doc['_id'].rsplit(":", 1)[0]
+        ocupados[instrutor_id] = [(i['inicio'], i['fim']) for i in doc.get('intervalos', [])]
+    return ocupados
+
+
+async def criar_indices(colecao):
+    await colecao.create_index([("intervalos.treino_id", ASCENDING)])
+
+
+async def reconstruir(colecao, treinos, lote: int = 1000):
+    """Rebuild every slot document from the personalised treinos."""
+    slots = {}
+    async for treino in treinos.find(
+        {"tipo_treino": "Personalizado", "data": {"$ne": None}, "instrutor_id_instrutor": {"$ne": None}},
+        {"data": 1, "hora_inicio": 1, "hora_fim": 1, "instrutor_id_instrutor": 1}
+    ):
+        if not treino.get('hora_inicio') or not treino.get('hora_fim'):
+            continue
+        chave = chave_slot(str(treino['instrutor_id_instrutor']), treino['data'])
+        slots.setdefault(chave, []).append({
+            "treino_id": str(treino['_id']),
+            "inicio": minutos(treino['hora_inicio']),
+            "fim": minutos(treino['hora_fim']),
+        })
+
+    await colecao.delete_many({})
+    documentos = [{"_id": chave, "intervalos": intervalos} for chave, intervalos in slots.items()]
+    for i in range(0, len(documentos), lote):
+        await colecao.insert_many(documentos[i:i + lote], ordered=False)
+    return len(documentos)
@@ -1,35 +1,157 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
-from datetime import datetime, timezone, date, time
+from typing import List, Optional, Set, Tuple
+from datetime import datetime, timezone, date, time, timedelta
 import bcrypt
 import jwt
 from bson import ObjectId
+from pymongo import ASCENDING
+
+from columnar import wants_columnar, columnar_response
+from admission import admission, admission_stats
+from coalesce import SingleFlight, request_key
+import reservas
+import arquivo
+import referencias
+import checkins
+import jobs
+import replicas
+import progresso
+import idempotencia
+from busca import BUSCA_LIMITE_PADRAO
+import repositorio
+from repositorio import MOTORES, ConflitoHorario
+from repositorio_mongo import RepositorioMongo
+from repositorio_sqlite import RepositorioSQLite
+from refcache import ReferenceCache, InvalidationChannel
+import tenancy
+from tenancy import TenantRouter, TenantDatabase, TenantMiddleware, tenant_atual
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Storage engine (see repositorio.py): "mongo", or "sqlite" for single-gym
+# installs without a mongod
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'mongo').lower()
+if STORAGE_ENGINE not in MOTORES:
+    raise RuntimeError(f"STORAGE_ENGINE inválido: {STORAGE_ENGINE} (use {' ou '.join(MOTORES)})")
+MONGO = STORAGE_ENGINE == "mongo"
+
 # MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client['GymTrack_DB']
+client = AsyncIOMotorClient(os.environ['MONGO_URL']) if MONGO else None
+
+# Multi-gym tenancy (see tenancy.py): one shared client, one database per
+# tenant. ``db`` resolves the current request's tenant on every access.
+DB_NAME = os.environ.get('DB_NAME', 'GymTrack_DB')
+TENANTS = [t.strip() for t in os.environ.get('TENANTS', '').split(',') if t.strip()]
+tenants = TenantRouter(client, DB_NAME, TENANTS)
+db = TenantDatabase(tenants)
+
+# Read-only endpoints may read from secondaries (see replicas.py); writes,
+# caches and anything feeding a write decision stay on the primary
+LEITURA_SECUNDARIA = os.environ.get('LEITURA_SECUNDARIA', 'false').lower() in ('1', 'true', 'yes')
+LEITURA_MAX_STALENESS_S = int(os.environ.get('LEITURA_MAX_STALENESS_S', '90'))
+db_leitura = replicas.BancoLeitura(tenants, replicas.preferencia_leitura(LEITURA_SECUNDARIA, LEITURA_MAX_STALENESS_S))
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET', 'gymtrack_secret_key_change_in_production')
 ALGORITHM = "HS256"
 
+# Archival of completed treinos (see arquivo.py); 0 disables it
+ARQUIVO_HORIZONTE_DIAS = int(os.environ.get('ARQUIVO_HORIZONTE_DIAS', '365'))
+ARQUIVO_INTERVALO_HORAS = float(os.environ.get('ARQUIVO_INTERVALO_HORAS', '6'))
+ARQUIVO_LOTE = int(os.environ.get('ARQUIVO_LOTE', '500'))
+
 security = HTTPBearer()
 
+# Read-through cache of instrutor/aluno documents, invalidated on writes
+# and across workers through a capped collection (see refcache.py)
+REFCACHE_MAX = int(os.environ.get('REFCACHE_MAX', '10000'))
+REFCACHE_TTL_S = float(os.environ.get('REFCACHE_TTL_S', '300'))
+PROJECAO_BUSCA = {"busca_nome": 0, "busca_email": 0, "busca_tokens": 0}
+cache_instrutores = ReferenceCache("instrutores", REFCACHE_MAX, REFCACHE_TTL_S, PROJECAO_BUSCA)
+# The progress summary changes with every treino write, keep it out of the cache
+cache_alunos = ReferenceCache("alunos", REFCACHE_MAX, REFCACHE_TTL_S, {**PROJECAO_BUSCA, "progresso": 0})
+canal_cache = InvalidationChannel({"instrutores": cache_instrutores, "alunos": cache_alunos})
+
+if MONGO:
+    repo = RepositorioMongo(db, db_leitura, cache_alunos, cache_instrutores, canal_cache)
+else:
+    repo = RepositorioSQLite(
+        Path(os.environ.get('SQLITE_PASTA', ROOT_DIR / 'dados')),
+        tenants,
+        threads=int(os.environ.get('SQLITE_THREADS', '4')),
+    )
+
+# Buffered check-in ingestion (see checkins.py)
+buffer_checkins = checkins.CheckinBuffer(
+    capacidade=int(os.environ.get('CHECKIN_BUFFER_CAPACIDADE', '10000')),
+    lote=int(os.environ.get('CHECKIN_LOTE', '500')),
+    intervalo=int(os.environ.get('CHECKIN_INTERVALO_MS', '1000')) / 1000,
+    espera_maxima=int(os.environ.get('CHECKIN_ESPERA_MS', '2000')) / 1000,
+    gravar=repo.checkins.gravar,
+    tentativas=int(os.environ.get('CHECKIN_TENTATIVAS', '5')),
+)
+CHECKIN_LOTE_MAXIMO = 1000
+
+# Retried creates and bulk requests with an Idempotency-Key run once (see idempotencia.py)
+respostas_idempotentes = idempotencia.RespostasIdempotentes(
+    repo.idempotencia,
+    ttl=timedelta(hours=float(os.environ.get('IDEMPOTENCIA_TTL_H', '24'))),
+    lease=timedelta(seconds=float(os.environ.get('IDEMPOTENCIA_LEASE_S', '60'))),
+    espera=float(os.environ.get('IDEMPOTENCIA_ESPERA_S', '30')),
+    max_bytes_resposta=int(os.environ.get('IDEMPOTENCIA_MAX_KB', '256')) * 1024,
+    max_bytes_cache=int(os.environ.get('IDEMPOTENCIA_CACHE_MB', '32')) * 1024 * 1024,
+)
+
+# Cascades, reassignments and reconciliation run as persisted jobs (see jobs.py)
+executor_jobs = jobs.JobRunner(
+    lote=int(os.environ.get('JOBS_LOTE', '200')),
+    pausa=int(os.environ.get('JOBS_PAUSA_MS', '100')) / 1000,
+    intervalo=float(os.environ.get('JOBS_INTERVALO_S', '5')),
+)
+RECONCILIAR_CARENCIA = timedelta(seconds=int(os.environ.get('RECONCILIAR_CARENCIA_S', '300')))
+
+# Identical concurrent reads share one computation (see coalesce.py)
+leituras = SingleFlight(ttl=int(os.environ.get('COALESCE_TTL_MS', '0')) / 1000)
+
+def chave_leitura(request: Request):
+    return (tenant_atual.get(), request_key(request))
+
+async def ler_coalescido(request: Request, compute):
+    # A read with X-Consistencia must not join a flight that ignores its token,
+    # nor lend its causal sessions to callers that outlive its request
+    if replicas.sessao_atual.get() is not None:
+        return await compute()
+    return await leituras.run(chave_leitura(request), compute)
+
+# Writes none of the coalesced reads depend on: check-in ingestion and login
+ESCRITAS_SEM_INVALIDACAO = ("/api/checkins", "/api/auth/")
+
+async def invalidar_leituras(request: Request):
+    # Bumped before and after every write so no read started around it is reused.
+    # Per process: other workers only see the write once their TTL runs out.
+    if request.method in ("GET", "HEAD", "OPTIONS") or request.url.path.startswith(ESCRITAS_SEM_INVALIDACAO):
+        yield
+        return
+    leituras.invalidate()
+    try:
+        yield
+    finally:
+        leituras.invalidate()
+
 # Create the main app
 app = FastAPI(title="GymTrack API")
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", dependencies=[Depends(invalidar_leituras)])
 
 # ===================== MODELS =====================
 
@@ -59,6 +181,13 @@ class Aluno(BaseModel):
     endereco: Optional[str] = None
     idade: int
     email: Optional[EmailStr] = None
+    ultimo_checkin: Optional[datetime] = None
+    # Progress summary (see progresso.py)
+    treinos_total: int = 0
+    treinos_concluidos: int = 0
+    ultimo_treino: Optional[str] = None
+    nivel: Optional[str] = None
+    frequencia_semanal: float = 0
 
 class AlunoCreate(BaseModel):
     nome: str
@@ -164,6 +293,33 @@ class InstrutorDisponivel(BaseModel):
     nome: str
     idade: int
 
+class TreinoBulkFiltro(BaseModel):
+    data: Optional[str] = None
+    tipo_treino: Optional[str] = None
+    aluno_id_aluno: Optional[str] = None
+    instrutor_id_instrutor: Optional[str] = None
+    concluido: Optional[bool] = None
+
+class TreinoBulkRequest(BaseModel):
+    acao: str  # "concluir", "reatribuir" ou "deletar"
+    ids: Optional[List[str]] = None
+    filtro: Optional[TreinoBulkFiltro] = None  # apenas para "deletar"
+    concluido: bool = True
+    instrutor_id_instrutor: Optional[str] = None
+
+class TreinoBulkItem(BaseModel):
+    id_treino: str
+    status: str  # "ok", "nao_encontrado", "id_invalido" ou "conflito"
+    detalhe: Optional[str] = None
+
+class TreinoBulkResult(BaseModel):
+    acao: str
+    total: int
+    sucesso: int
+    falhas: int
+    itens: List[TreinoBulkItem]
+    truncado: bool = False  # deletar por filtro parou em BULK_LIMITE; repita até False
+
 class DashboardStats(BaseModel):
     total_alunos: int
     total_instrutores: int
@@ -182,6 +338,72 @@ class InstrutorComHorario(BaseModel):
     horario: Optional[str] = None
     disponivel: bool = True
 
+class CheckinCreate(BaseModel):
+    aluno_id_aluno: str
+    momento: Optional[datetime] = None  # padrão: agora (UTC)
+    origem: Optional[str] = None  # ex.: "catraca", "app"
+    tipo: str = checkins.CHEGADA  # "checkin" (chegada) ou "exercicio" (exercício concluído)
+    treino_id: Optional[str] = None  # obrigatório para "exercicio"
+    exercicio: Optional[str] = None  # nome do exercício, para "exercicio"
+
+class CheckinBatch(BaseModel):
+    checkins: List[CheckinCreate]
+
+class CheckinRejeitado(BaseModel):
+    indice: int
+    aluno_id_aluno: str
+    detalhe: str
+
+class CheckinResult(BaseModel):
+    aceitos: int
+    rejeitados: List[CheckinRejeitado] = []
+
+class FrequenciaDiaria(BaseModel):
+    data: str
+    checkins: int
+
+class Job(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id_job: str
+    tipo: str
+    status: str  # "pendente", "executando", "concluido" ou "falhou"
+    params: dict = {}
+    processados: int = 0
+    resultado: Optional[dict] = None
+    erro: Optional[str] = None
+    tentativas: int = 0
+    criado_em: Optional[datetime] = None
+    atualizado_em: Optional[datetime] = None
+    concluido_em: Optional[datetime] = None
+
+class JobCriado(BaseModel):
+    message: str
+    id_job: str
+
+class ReatribuicaoRequest(BaseModel):
+    instrutor_destino: str
+    a_partir_de: Optional[str] = None  # YYYY-MM-DD; padrão: todos os treinos
+
+class DashboardBootstrap(BaseModel):
+    stats: DashboardStats
+    instrutores_horarios: List[InstrutorComHorario]
+
+class AgendasBootstrap(BaseModel):
+    agendas_fixas: List[AgendaFixa]
+    treinos_personalizados: List[Treino]
+    instrutores: List[Instrutor]
+
+# ===================== FORMATO COLUNAR =====================
+
+# Columns whose values repeat across rows; sent once in a dictionary table.
+COLUNAS_DICIONARIO_TREINOS = (
+    "tipo_treino", "nome_treino", "aluno_id_aluno", "aluno_nome", "data",
+    "hora_inicio", "hora_fim", "instrutor_id_instrutor", "instrutor_nome", "nivel",
+)
+COLUNAS_DICIONARIO_AGENDAS = (
+    "instrutor_id_instrutor", "instrutor_nome", "dias_semana", "hora_inicio", "hora_fim",
+)
+
 # ===================== AUTH MIDDLEWARE =====================
 
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -201,7 +423,7 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
 
 @api_router.post("/auth/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
-    admin = await db.admins.find_one({"email": request.email})
+    admin = await repo.admins.por_email(request.email)
     
     if not admin:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
@@ -210,7 +432,7 @@ async def login(request: LoginRequest):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
     token = jwt.encode(
-        {"admin_id": str(admin['_id']), "email": admin['email']},
+        {"admin_id": admin['id_admin'], "email": admin['email'], tenancy.TENANT_CLAIM: tenant_atual.get()},
         SECRET_KEY,
         algorithm=ALGORITHM
     )
@@ -218,7 +440,7 @@ async def login(request: LoginRequest):
     return {
         "token": token,
         "admin": {
-            "id_admin": str(admin['_id']),
+            "id_admin": admin['id_admin'],
             "nome": admin['nome'],
             "email": admin['email']
         }
@@ -226,12 +448,12 @@ async def login(request: LoginRequest):
 
 @api_router.get("/auth/me", response_model=Admin)
 async def get_current_admin(admin_id: str = Depends(verify_token)):
-    admin = await db.admins.find_one({"_id": ObjectId(admin_id)})
+    admin = await repo.admins.obter(admin_id)
     if not admin:
         raise HTTPException(status_code=404, detail="Admin não encontrado")
     
     return {
-        "id_admin": str(admin['_id']),
+        "id_admin": admin['id_admin'],
         "nome": admin['nome'],
         "email": admin['email']
     }
@@ -239,28 +461,30 @@ async def get_current_admin(admin_id: str = Depends(verify_token)):
 # ===================== DASHBOARD =====================
 
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(admin_id: str = Depends(verify_token)):
-    total_alunos = await db.alunos.count_documents({})
-    total_instrutores = await db.instrutores.count_documents({})
-    total_agendas = await db.agendas_fixas.count_documents({})
-    total_treinos = await db.treinos.count_documents({})
-    agendas_disponiveis = await db.agendas_fixas.count_documents({"disponivel": True})
-    
-    return {
-        "total_alunos": total_alunos,
-        "total_instrutores": total_instrutores,
-        "total_agendas": total_agendas,
-        "total_treinos": total_treinos,
-        "agendas_disponiveis": agendas_disponiveis
-    }
+async def get_dashboard_stats(request: Request, admin_id: str = Depends(verify_token)):
+    return await ler_coalescido(request, calcular_dashboard_stats)
 
-@api_router.get("/dashboard/instrutores-horarios", response_model=List[InstrutorComHorario])
-async def get_instrutores_com_horarios(admin_id: str = Depends(verify_token)):
-    instrutores = await db.instrutores.find({}).to_list(1000)
-    result = []
+async def calcular_dashboard_stats():
+    return await repo.estatisticas()
+
+@api_router.get("/dashboard/instrutores-horarios", response_model=List[InstrutorComHorario],
+                dependencies=[Depends(admission("heavy"))])
+async def get_instrutores_com_horarios(request: Request, admin_id: str = Depends(verify_token)):
+    return await ler_coalescido(request, listar_instrutores_com_horarios)
+
+async def listar_instrutores_com_horarios():
+    instrutores, agendas = await asyncio.gather(repo.instrutores.listar(), repo.agendas.listar())
+    return montar_instrutores_com_horarios(instrutores, agendas)
+
+def montar_instrutores_com_horarios(instrutores: list, agendas: list) -> list:
+    # One agenda per instrutor; the first one wins like the former find_one did
+    por_instrutor = {}
+    for agenda in agendas:
+        por_instrutor.setdefault(agenda['instrutor_id_instrutor'], agenda)
     
+    result = []
     for instrutor in instrutores:
-        agenda = await db.agendas_fixas.find_one({"instrutor_id_instrutor": str(instrutor['_id'])})
+        agenda = por_instrutor.get(instrutor['id_instrutor'])
         
         dias_semana = None
         horario = None
@@ -272,7 +496,7 @@ async def get_instrutores_com_horarios(admin_id: str = Depends(verify_token)):
             disponivel = agenda.get('disponivel', True)
         
         result.append({
-            "id_instrutor": str(instrutor['_id']),
+            "id_instrutor": instrutor['id_instrutor'],
             "nome": instrutor['nome'],
             "idade": instrutor['idade'],
             "email": instrutor.get('email'),
@@ -286,38 +510,145 @@ async def get_instrutores_com_horarios(admin_id: str = Depends(verify_token)):
 
 @api_router.patch("/instrutores/{id_instrutor}/toggle-disponibilidade")
 async def toggle_instrutor_disponibilidade(id_instrutor: str, admin_id: str = Depends(verify_token)):
-    agenda = await db.agendas_fixas.find_one({"instrutor_id_instrutor": id_instrutor})
+    novo_status = await repo.agendas.alternar_disponibilidade(id_instrutor)
     
-    if agenda:
-        novo_status = not agenda.get('disponivel', True)
-        await db.agendas_fixas.update_one(
-            {"instrutor_id_instrutor": id_instrutor},
-            {"$set": {"disponivel": novo_status}}
-        )
+    if novo_status is not None:
         return {"message": "Disponibilidade atualizada", "disponivel": novo_status}
     else:
         raise HTTPException(status_code=404, detail="Instrutor não possui horário fixo cadastrado")
 
+# ===================== BOOTSTRAP =====================
+
+@api_router.get("/bootstrap/dashboard", response_model=DashboardBootstrap, dependencies=[Depends(admission("heavy"))])
+async def get_bootstrap_dashboard(request: Request, admin_id: str = Depends(verify_token)):
+    return await ler_coalescido(request, carregar_bootstrap_dashboard)
+
+async def carregar_bootstrap_dashboard():
+    stats, instrutores, agendas = await asyncio.gather(
+        calcular_dashboard_stats(),
+        repo.instrutores.listar(),
+        repo.agendas.listar()
+    )
+    return {"stats": stats, "instrutores_horarios": montar_instrutores_com_horarios(instrutores, agendas)}
+
+@api_router.get("/bootstrap/agendas", response_model=AgendasBootstrap, dependencies=[Depends(admission("heavy"))])
+async def get_bootstrap_agendas(request: Request, admin_id: str = Depends(verify_token)):
+    return await ler_coalescido(request, carregar_bootstrap_agendas)
+
+async def carregar_bootstrap_agendas():
+    agendas, treinos, instrutores = await asyncio.gather(
+        repo.agendas.listar(),
+        repo.treinos.listar_personalizados(),
+        repo.instrutores.listar()
+    )
+    
+    # The full instrutor list is already loaded; only aluno names need a lookup
+    nomes_instrutores = {i['id_instrutor']: i['nome'] for i in instrutores}
+    alunos = await repo.alunos.obter_muitos(t['aluno_id_aluno'] for t in treinos)
+    
+    return {
+        "agendas_fixas": [
+            {**a, "instrutor_nome": nomes_instrutores.get(a['instrutor_id_instrutor'], "Instrutor não encontrado")}
+            for a in agendas
+        ],
+        "treinos_personalizados": [
+            {
+                **t,
+                "aluno_nome": (
+                    alunos[t['aluno_id_aluno']]['nome'] if alunos.get(t['aluno_id_aluno']) else "Aluno não encontrado"
+                ),
+                "instrutor_nome": (
+                    nomes_instrutores.get(t['instrutor_id_instrutor'], "Instrutor não encontrado")
+                    if t.get('instrutor_id_instrutor') else None
+                ),
+            }
+            for t in treinos
+        ],
+        "instrutores": instrutores,
+    }
+
+# ===================== METRICS =====================
+
+@api_router.get("/metrics/admission")
+async def get_admission_metrics(admin_id: str = Depends(verify_token)):
+    return admission_stats()
+
+@api_router.get("/metrics/coalescing")
+async def get_coalescing_metrics(admin_id: str = Depends(verify_token)):
+    return leituras.stats()
+
+@api_router.get("/metrics/cache")
+async def get_cache_metrics(admin_id: str = Depends(verify_token)):
+    return {
+        "instrutores": cache_instrutores.stats(),
+        "alunos": cache_alunos.stats(),
+        "invalidacoes_recebidas": canal_cache.recebidas,
+        "invalidacoes_falhas": canal_cache.falhas,
+    }
+
+@api_router.get("/metrics/checkins")
+async def get_checkin_metrics(admin_id: str = Depends(verify_token)):
+    return buffer_checkins.stats()
+
+@api_router.get("/metrics/idempotencia")
+async def get_idempotency_metrics(admin_id: str = Depends(verify_token)):
+    return respostas_idempotentes.stats()
+
+@api_router.get("/metrics/armazenamento")
+async def get_storage_metrics(admin_id: str = Depends(verify_token)):
+    return {"motor": repo.motor, "cascata_em_segundo_plano": repo.cascata_em_segundo_plano}
+
+@api_router.get("/metrics/jobs")
+async def get_job_metrics(admin_id: str = Depends(verify_token)):
+    return executor_jobs.stats()
+
+@api_router.get("/metrics/tenants")
+async def get_tenant_metrics(admin_id: str = Depends(verify_token)):
+    # Other gyms' traffic is only visible from the default (operator) tenant
+    visiveis = tenancy.metricas_tenants if tenant_atual.get() == tenancy.TENANT_PADRAO else {
+        tenant_atual.get(): tenancy.metricas_tenants.get(tenant_atual.get(), tenancy.TenantMetrics())
+    }
+    return {
+        tenant: {**metricas.stats(), "inicializado": tenant in tenancy.tenants_prontos}
+        for tenant, metricas in visiveis.items()
+    }
+
 # ===================== ALUNOS CRUD =====================
 
-@api_router.get("/alunos", response_model=List[Aluno])
-async def get_alunos(admin_id: str = Depends(verify_token)):
-    alunos = await db.alunos.find({}).to_list(1000)
-    return [{**aluno, "id_aluno": str(aluno['_id'])} for aluno in alunos]
+@api_router.get("/alunos", response_model=List[Aluno], dependencies=[Depends(admission("list"))])
+async def get_alunos(
+    request: Request,
+    format: Optional[str] = None,
+    ordenar: Optional[str] = None,
+    nivel: Optional[str] = None,
+    concluidos_min: Optional[int] = None,
+    ultimo_treino_desde: Optional[str] = None,
+    admin_id: str = Depends(verify_token)
+):
+    try:
+        ordem = progresso.ordenacao(ordenar)
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail=f"Ordenação inválida; use um de {', '.join(progresso.ORDENACOES)}"
+        )
+    result = await repo.alunos.listar(ordem, nivel, concluidos_min, ultimo_treino_desde)
+    if wants_columnar(request, format):
+        return columnar_response(request, result, Aluno)
+    return result
+
+@api_router.get("/alunos/busca", response_model=List[Aluno], dependencies=[Depends(admission("list"))])
+async def buscar_alunos(q: str, limite: int = BUSCA_LIMITE_PADRAO, admin_id: str = Depends(verify_token)):
+    return await repo.alunos.buscar(q, limite)
 
 @api_router.post("/alunos", response_model=Aluno)
 async def create_aluno(aluno: AlunoCreate, admin_id: str = Depends(verify_token)):
     if aluno.idade < 7:
         raise HTTPException(status_code=400, detail="Idade mínima é 7 anos")
     
-    if aluno.email:
-        existing = await db.alunos.find_one({"email": aluno.email})
-        if existing:
-            raise HTTPException(status_code=400, detail="Email já cadastrado")
+    if aluno.email and await repo.alunos.email_em_uso(aluno.email):
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
     
-    result = await db.alunos.insert_one(aluno.model_dump())
-    created = await db.alunos.find_one({"_id": result.inserted_id})
-    return {**created, "id_aluno": str(created['_id'])}
+    return await repo.alunos.criar(aluno.model_dump())
 
 @api_router.put("/alunos/{id_aluno}", response_model=Aluno)
 async def update_aluno(id_aluno: str, aluno: AlunoUpdate, admin_id: str = Depends(verify_token)):
@@ -329,48 +660,48 @@ async def update_aluno(id_aluno: str, aluno: AlunoUpdate, admin_id: str = Depend
     if 'idade' in update_data and update_data['idade'] < 7:
         raise HTTPException(status_code=400, detail="Idade mínima é 7 anos")
     
-    result = await db.alunos.update_one(
-        {"_id": ObjectId(id_aluno)},
-        {"$set": update_data}
-    )
-    
-    if result.matched_count == 0:
+    updated = await repo.alunos.atualizar(id_aluno, update_data)
+    if not updated:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    updated = await db.alunos.find_one({"_id": ObjectId(id_aluno)})
-    return {**updated, "id_aluno": str(updated['_id'])}
+    return updated
 
 @api_router.delete("/alunos/{id_aluno}")
 async def delete_aluno(id_aluno: str, admin_id: str = Depends(verify_token)):
-    result = await db.alunos.delete_one({"_id": ObjectId(id_aluno)})
-    
-    if result.deleted_count == 0:
+    if not await repo.alunos.remover(id_aluno):
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    await db.treinos.delete_many({"aluno_id_aluno": id_aluno})
+    if not repo.cascata_em_segundo_plano:
+        await repo.treinos.remover_do_aluno(id_aluno)
+        return {"message": "Aluno deletado com sucesso", "id_job": None}
     
-    return {"message": "Aluno deletado com sucesso"}
+    # The aluno's treinos are removed in the background (see cascata_aluno)
+    id_job = await executor_jobs.enfileirar(db, "cascata_aluno", {"id_aluno": id_aluno})
+    
+    return {"message": "Aluno deletado com sucesso", "id_job": id_job}
 
 # ===================== INSTRUTORES CRUD =====================
 
-@api_router.get("/instrutores", response_model=List[Instrutor])
-async def get_instrutores(admin_id: str = Depends(verify_token)):
-    instrutores = await db.instrutores.find({}).to_list(1000)
-    return [{**instrutor, "id_instrutor": str(instrutor['_id'])} for instrutor in instrutores]
+@api_router.get("/instrutores", response_model=List[Instrutor], dependencies=[Depends(admission("list"))])
+async def get_instrutores(request: Request, format: Optional[str] = None, admin_id: str = Depends(verify_token)):
+    result = await repo.instrutores.listar()
+    if wants_columnar(request, format):
+        return columnar_response(request, result, Instrutor)
+    return result
+
+@api_router.get("/instrutores/busca", response_model=List[Instrutor], dependencies=[Depends(admission("list"))])
+async def buscar_instrutores(q: str, limite: int = BUSCA_LIMITE_PADRAO, admin_id: str = Depends(verify_token)):
+    return await repo.instrutores.buscar(q, limite)
 
 @api_router.post("/instrutores", response_model=Instrutor)
 async def create_instrutor(instrutor: InstrutorCreate, admin_id: str = Depends(verify_token)):
     if instrutor.idade < 18:
         raise HTTPException(status_code=400, detail="Idade mínima para instrutor é 18 anos")
     
-    if instrutor.email:
-        existing = await db.instrutores.find_one({"email": instrutor.email})
-        if existing:
-            raise HTTPException(status_code=400, detail="Email já cadastrado")
+    if instrutor.email and await repo.instrutores.email_em_uso(instrutor.email):
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
     
-    result = await db.instrutores.insert_one(instrutor.model_dump())
-    created = await db.instrutores.find_one({"_id": result.inserted_id})
-    return {**created, "id_instrutor": str(created['_id'])}
+    return await repo.instrutores.criar(instrutor.model_dump())
 
 @api_router.put("/instrutores/{id_instrutor}", response_model=Instrutor)
 async def update_instrutor(id_instrutor: str, instrutor: InstrutorUpdate, admin_id: str = Depends(verify_token)):
@@ -382,40 +713,46 @@ async def update_instrutor(id_instrutor: str, instrutor: InstrutorUpdate, admin_
     if 'idade' in update_data and update_data['idade'] < 18:
         raise HTTPException(status_code=400, detail="Idade mínima para instrutor é 18 anos")
     
-    result = await db.instrutores.update_one(
-        {"_id": ObjectId(id_instrutor)},
-        {"$set": update_data}
-    )
-    
-    if result.matched_count == 0:
+    updated = await repo.instrutores.atualizar(id_instrutor, update_data)
+    if not updated:
         raise HTTPException(status_code=404, detail="Instrutor não encontrado")
     
-    updated = await db.instrutores.find_one({"_id": ObjectId(id_instrutor)})
-    return {**updated, "id_instrutor": str(updated['_id'])}
+    return updated
 
 @api_router.delete("/instrutores/{id_instrutor}")
 async def delete_instrutor(id_instrutor: str, admin_id: str = Depends(verify_token)):
-    result = await db.instrutores.delete_one({"_id": ObjectId(id_instrutor)})
-    
-    if result.deleted_count == 0:
+    if not await repo.instrutores.remover(id_instrutor):
         raise HTTPException(status_code=404, detail="Instrutor não encontrado")
     
-    await db.agendas_fixas.delete_many({"instrutor_id_instrutor": id_instrutor})
+    if not repo.cascata_em_segundo_plano:
+        await repo.agendas.remover_do_instrutor(id_instrutor)
+        # Personalised treinos cannot happen without their instrutor
+        await repo.treinos.remover_personalizados_do_instrutor(id_instrutor)
+        return {"message": "Instrutor deletado com sucesso", "id_job": None}
+    
+    # Agendas and personalised treinos are removed in the background (see cascata_instrutor)
+    id_job = await executor_jobs.enfileirar(db, "cascata_instrutor", {"id_instrutor": id_instrutor})
     
-    return {"message": "Instrutor deletado com sucesso"}
+    return {"message": "Instrutor deletado com sucesso", "id_job": id_job}
 
 # ===================== AGENDAS FIXAS CRUD =====================
 
-@api_router.get("/agendas-fixas", response_model=List[AgendaFixa])
-async def get_agendas_fixas(admin_id: str = Depends(verify_token)):
-    agendas = await db.agendas_fixas.find({}).to_list(1000)
+@api_router.get("/agendas-fixas", response_model=List[AgendaFixa], dependencies=[Depends(admission("list"))])
+async def get_agendas_fixas(request: Request, format: Optional[str] = None, admin_id: str = Depends(verify_token)):
+    result = await ler_coalescido(request, listar_agendas_fixas)
+    if wants_columnar(request, format):
+        return columnar_response(request, result, AgendaFixa, COLUNAS_DICIONARIO_AGENDAS)
+    return result
+
+async def listar_agendas_fixas():
+    agendas = await repo.agendas.listar()
+    instrutores = await repo.instrutores.obter_muitos(a['instrutor_id_instrutor'] for a in agendas)
     result = []
     
     for agenda in agendas:
-        instrutor = await db.instrutores.find_one({"_id": ObjectId(agenda['instrutor_id_instrutor'])})
+        instrutor = instrutores.get(agenda['instrutor_id_instrutor'])
         result.append({
             **agenda,
-            "id_agenda": str(agenda['_id']),
             "instrutor_nome": instrutor['nome'] if instrutor else "Instrutor não encontrado"
         })
     
@@ -423,7 +760,7 @@ async def get_agendas_fixas(admin_id: str = Depends(verify_token)):
 
 @api_router.post("/agendas-fixas", response_model=AgendaFixa)
 async def create_agenda_fixa(agenda: AgendaFixaCreate, admin_id: str = Depends(verify_token)):
-    instrutor = await db.instrutores.find_one({"_id": ObjectId(agenda.instrutor_id_instrutor)})
+    instrutor = await repo.instrutores.obter(agenda.instrutor_id_instrutor)
     if not instrutor:
         raise HTTPException(status_code=404, detail="Instrutor não encontrado")
     
@@ -431,18 +768,12 @@ async def create_agenda_fixa(agenda: AgendaFixaCreate, admin_id: str = Depends(v
         raise HTTPException(status_code=400, detail="Hora de fim deve ser maior que hora de início")
     
     # Check if instrutor already has agenda
-    existing = await db.agendas_fixas.find_one({"instrutor_id_instrutor": agenda.instrutor_id_instrutor})
-    if existing:
+    if await repo.agendas.por_instrutor(agenda.instrutor_id_instrutor):
         raise HTTPException(status_code=400, detail="Instrutor já possui horário fixo cadastrado")
     
-    result = await db.agendas_fixas.insert_one(agenda.model_dump())
-    created = await db.agendas_fixas.find_one({"_id": result.inserted_id})
+    created = await repo.agendas.criar(agenda.model_dump())
     
-    return {
-        **created,
-        "id_agenda": str(created['_id']),
-        "instrutor_nome": instrutor['nome']
-    }
+    return {**created, "instrutor_nome": instrutor['nome']}
 
 @api_router.put("/agendas-fixas/{id_agenda}", response_model=AgendaFixa)
 async def update_agenda_fixa(id_agenda: str, agenda: AgendaFixaUpdate, admin_id: str = Depends(verify_token)):
@@ -452,92 +783,101 @@ async def update_agenda_fixa(id_agenda: str, agenda: AgendaFixaUpdate, admin_id:
         raise HTTPException(status_code=400, detail="Nenhum dado para atualizar")
     
     if 'instrutor_id_instrutor' in update_data:
-        instrutor = await db.instrutores.find_one({"_id": ObjectId(update_data['instrutor_id_instrutor'])})
+        instrutor = await repo.instrutores.obter(update_data['instrutor_id_instrutor'])
         if not instrutor:
             raise HTTPException(status_code=404, detail="Instrutor não encontrado")
     
-    result = await db.agendas_fixas.update_one(
-        {"_id": ObjectId(id_agenda)},
-        {"$set": update_data}
-    )
-    
-    if result.matched_count == 0:
+    updated = await repo.agendas.atualizar(id_agenda, update_data)
+    if not updated:
         raise HTTPException(status_code=404, detail="Agenda não encontrada")
     
-    updated = await db.agendas_fixas.find_one({"_id": ObjectId(id_agenda)})
-    instrutor = await db.instrutores.find_one({"_id": ObjectId(updated['instrutor_id_instrutor'])})
+    instrutor = await repo.instrutores.obter(updated['instrutor_id_instrutor'])
     
-    return {
-        **updated,
-        "id_agenda": str(updated['_id']),
-        "instrutor_nome": instrutor['nome'] if instrutor else "Instrutor não encontrado"
-    }
+    return {**updated, "instrutor_nome": instrutor['nome'] if instrutor else "Instrutor não encontrado"}
 
 @api_router.delete("/agendas-fixas/{id_agenda}")
 async def delete_agenda_fixa(id_agenda: str, admin_id: str = Depends(verify_token)):
-    result = await db.agendas_fixas.delete_one({"_id": ObjectId(id_agenda)})
-    
-    if result.deleted_count == 0:
+    if not await repo.agendas.remover(id_agenda):
         raise HTTPException(status_code=404, detail="Agenda não encontrada")
     
     return {"message": "Agenda deletada com sucesso"}
 
 # ===================== TREINOS CRUD =====================
 
-@api_router.get("/treinos", response_model=List[Treino])
-async def get_treinos(admin_id: str = Depends(verify_token)):
-    treinos = await db.treinos.find({}).to_list(1000)
-    result = []
+@api_router.get("/treinos", response_model=List[Treino], dependencies=[Depends(admission("heavy"))])
+async def get_treinos(request: Request, data_inicio: Optional[str] = None, data_fim: Optional[str] = None,
+                      format: Optional[str] = None, admin_id: str = Depends(verify_token)):
+    result = await ler_coalescido(request, lambda: listar_treinos(data_inicio, data_fim))
+    if wants_columnar(request, format):
+        return columnar_response(request, result, Treino, COLUNAS_DICIONARIO_TREINOS)
+    return result
+
+async def listar_treinos(data_inicio: Optional[str] = None, data_fim: Optional[str] = None):
+    treinos = await repo.treinos.listar(data_inicio, data_fim)
+    
+    alunos, instrutores = await asyncio.gather(
+        repo.alunos.obter_muitos(t['aluno_id_aluno'] for t in treinos),
+        repo.instrutores.obter_muitos(t.get('instrutor_id_instrutor') for t in treinos)
+    )
     
+    result = []
     for treino in treinos:
-        aluno = await db.alunos.find_one({"_id": ObjectId(treino['aluno_id_aluno'])})
-        treino_dict = {**treino, "id_treino": str(treino['_id']), "aluno_nome": aluno['nome'] if aluno else "Aluno não encontrado"}
+        aluno = alunos.get(treino['aluno_id_aluno'])
+        treino_dict = {**treino, "aluno_nome": aluno['nome'] if aluno else "Aluno não encontrado"}
         
         if treino.get('instrutor_id_instrutor'):
-            instrutor = await db.instrutores.find_one({"_id": ObjectId(treino['instrutor_id_instrutor'])})
+            instrutor = instrutores.get(treino['instrutor_id_instrutor'])
             treino_dict['instrutor_nome'] = instrutor['nome'] if instrutor else "Instrutor não encontrado"
         
         result.append(treino_dict)
     
     return result
 
-@api_router.get("/instrutores-disponiveis")
-async def get_instrutores_disponiveis(data: str, hora_inicio: str, hora_fim: str, admin_id: str = Depends(verify_token)):
-    # Get all available instructors
-    agendas_disponiveis = await db.agendas_fixas.find({"disponivel": True}).to_list(1000)
+@api_router.get("/instrutores-disponiveis", dependencies=[Depends(admission("heavy"))])
+async def get_instrutores_disponiveis(request: Request, data: str, hora_inicio: str, hora_fim: str,
+                                      admin_id: str = Depends(verify_token)):
+    return await ler_coalescido(
+        request,
+        lambda: listar_instrutores_disponiveis(data, hora_inicio, hora_fim)
+    )
+
+async def listar_instrutores_disponiveis(data: str, hora_inicio: str, hora_fim: str):
+    inicio, fim = reservas.minutos(hora_inicio), reservas.minutos(hora_fim)
     
-    instrutores_disponiveis = []
+    # Get all available instructors whose fixed schedule covers the slot
+    candidatos = await repo.agendas.instrutores_no_horario(hora_inicio, hora_fim)
     
-    for agenda in agendas_disponiveis:
-        instrutor_id = agenda['instrutor_id_instrutor']
-        
-        # Check if instructor is available at this time
-        if agenda['hora_inicio'] <= hora_inicio and agenda['hora_fim'] >= hora_fim:
-            # Check for conflicts with existing trainings
-            conflito = await db.treinos.find_one({
-                "instrutor_id_instrutor": instrutor_id,
-                "data": data,
-                "$or": [
-                    {"hora_inicio": {"$lte": hora_inicio}, "hora_fim": {"$gt": hora_inicio}},
-                    {"hora_inicio": {"$lt": hora_fim}, "hora_fim": {"$gte": hora_fim}},
-                    {"hora_inicio": {"$gte": hora_inicio}, "hora_fim": {"$lte": hora_fim}}
-                ]
-            })
-            
-            if not conflito:
-                instrutor = await db.instrutores.find_one({"_id": ObjectId(instrutor_id)})
-                if instrutor:
-                    instrutores_disponiveis.append({
-                        "id_instrutor": str(instrutor['_id']),
-                        "nome": instrutor['nome'],
-                        "idade": instrutor['idade']
-                    })
-    
-    return instrutores_disponiveis
+    ocupados = await repo.treinos.ocupados(candidatos, data)
+    livres = [
+        instrutor_id for instrutor_id in candidatos
+        if not any(reservas.conflita(inicio, fim, ini, f) for ini, f in ocupados.get(instrutor_id, []))
+    ]
+    
+    por_id = await repo.instrutores.obter_muitos(livres)
+    
+    return [
+        {"id_instrutor": instrutor_id, "nome": por_id[instrutor_id]['nome'], "idade": por_id[instrutor_id]['idade']}
+        for instrutor_id in livres if por_id.get(instrutor_id)
+    ]
+
+def validar_horario_treino(dados: dict):
+    campos = ('data', 'hora_inicio', 'hora_fim', 'instrutor_id_instrutor')
+    if not all(dados.get(campo) for campo in campos):
+        raise HTTPException(status_code=400, detail="Treino personalizado requer data, horário e instrutor")
+    
+    try:
+        inicio, fim = reservas.minutos(dados['hora_inicio']), reservas.minutos(dados['hora_fim'])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Horário inválido")
+    
+    if fim <= inicio:
+        raise HTTPException(status_code=400, detail="Hora de fim deve ser maior que hora de início")
+    
+    return inicio, fim
 
 @api_router.post("/treinos", response_model=Treino)
 async def create_treino(treino: TreinoCreate, admin_id: str = Depends(verify_token)):
-    aluno = await db.alunos.find_one({"_id": ObjectId(treino.aluno_id_aluno)})
+    aluno = await repo.alunos.obter(treino.aluno_id_aluno)
     if not aluno:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
@@ -546,39 +886,112 @@ async def create_treino(treino: TreinoCreate, admin_id: str = Depends(verify_tok
     
     # Validate personalizado
     if treino.tipo_treino == "Personalizado":
-        if not all([treino.data, treino.hora_inicio, treino.hora_fim, treino.instrutor_id_instrutor]):
-            raise HTTPException(status_code=400, detail="Treino personalizado requer data, horário e instrutor")
+        validar_horario_treino(treino_dict)
         
         # Verify instructor
-        instrutor = await db.instrutores.find_one({"_id": ObjectId(treino.instrutor_id_instrutor)})
+        instrutor = await repo.instrutores.obter(treino.instrutor_id_instrutor)
         if not instrutor:
             raise HTTPException(status_code=404, detail="Instrutor não encontrado")
-        
-        # Check availability
-        conflito = await db.treinos.find_one({
-            "instrutor_id_instrutor": treino.instrutor_id_instrutor,
-            "data": treino.data,
-            "$or": [
-                {"hora_inicio": {"$lte": treino.hora_inicio}, "hora_fim": {"$gt": treino.hora_inicio}},
-                {"hora_inicio": {"$lt": treino.hora_fim}, "hora_fim": {"$gte": treino.hora_fim}},
-                {"hora_inicio": {"$gte": treino.hora_inicio}, "hora_fim": {"$lte": treino.hora_fim}}
-            ]
-        })
-        
-        if conflito:
-            raise HTTPException(status_code=400, detail="Instrutor já possui treino agendado neste horário")
     
-    result = await db.treinos.insert_one(treino_dict)
-    created = await db.treinos.find_one({"_id": result.inserted_id})
+    try:
+        created = await repo.treinos.criar(treino_dict)
+    except ConflitoHorario:
+        raise HTTPException(status_code=400, detail="Instrutor já possui treino agendado neste horário")
     
-    response_dict = {**created, "id_treino": str(created['_id']), "aluno_nome": aluno['nome']}
+    response_dict = {**created, "aluno_nome": aluno['nome']}
     
     if created.get('instrutor_id_instrutor'):
-        instrutor = await db.instrutores.find_one({"_id": ObjectId(created['instrutor_id_instrutor'])})
+        instrutor = await repo.instrutores.obter(created['instrutor_id_instrutor'])
         response_dict['instrutor_nome'] = instrutor['nome'] if instrutor else None
     
     return response_dict
 
+BULK_LIMITE = 1000
+
+def resultado_bulk(acao: str, itens: List[dict]) -> dict:
+    sucesso = sum(1 for item in itens if item['status'] == "ok")
+    return {"acao": acao, "total": len(itens), "sucesso": sucesso, "falhas": len(itens) - sucesso, "itens": itens}
+
+def separar_ids_bulk(ids: List[str]):
+    validos, itens = [], []
+    for id_treino in dict.fromkeys(ids):
+        if ObjectId.is_valid(id_treino):
+            validos.append(id_treino)
+        else:
+            itens.append({"id_treino": id_treino, "status": "id_invalido", "detalhe": "ID inválido"})
+    return validos, itens
+
+def itens_encontrados(ids: List[str], encontrados, itens: List[dict]) -> List[dict]:
+    for id_treino in ids:
+        if id_treino in encontrados:
+            itens.append({"id_treino": id_treino, "status": "ok"})
+        else:
+            itens.append({"id_treino": id_treino, "status": "nao_encontrado", "detalhe": "Treino não encontrado"})
+    return itens
+
+@api_router.post("/treinos/bulk", response_model=TreinoBulkResult)
+async def bulk_treinos(operacao: TreinoBulkRequest, admin_id: str = Depends(verify_token)):
+    if operacao.acao not in ("concluir", "reatribuir", "deletar"):
+        raise HTTPException(status_code=400, detail="Ação inválida")
+    
+    if operacao.ids is None and (operacao.acao != "deletar" or operacao.filtro is None):
+        raise HTTPException(status_code=400, detail="Informe a lista de ids")
+    
+    if operacao.ids is not None and len(operacao.ids) > BULK_LIMITE:
+        raise HTTPException(status_code=400, detail=f"Máximo de {BULK_LIMITE} treinos por operação")
+    
+    if operacao.acao == "concluir":
+        return await bulk_concluir(operacao.ids, operacao.concluido)
+    if operacao.acao == "reatribuir":
+        return await bulk_reatribuir(operacao.ids, operacao.instrutor_id_instrutor)
+    return await bulk_deletar(operacao.ids, operacao.filtro)
+
+async def bulk_concluir(ids: List[str], concluido: bool):
+    validos, itens = separar_ids_bulk(ids)
+    encontrados = await repo.treinos.concluir_muitos(validos, concluido) if validos else set()
+    return resultado_bulk("concluir", itens_encontrados(validos, encontrados, itens))
+
+async def bulk_reatribuir(ids: List[str], instrutor_id: Optional[str]):
+    if not instrutor_id or not ObjectId.is_valid(instrutor_id):
+        raise HTTPException(status_code=400, detail="Informe o instrutor de destino")
+    
+    instrutor = await repo.instrutores.obter(instrutor_id)
+    if not instrutor:
+        raise HTTPException(status_code=404, detail="Instrutor não encontrado")
+    
+    validos, itens = separar_ids_bulk(ids)
+    status = await repo.treinos.reatribuir_muitos(validos, instrutor_id) if validos else {}
+    
+    for id_treino in validos:
+        if id_treino not in status:
+            itens.append({"id_treino": id_treino, "status": "nao_encontrado", "detalhe": "Treino não encontrado"})
+        elif status[id_treino] == "conflito":
+            itens.append({
+                "id_treino": id_treino, "status": "conflito",
+                "detalhe": "Instrutor já possui treino agendado neste horário",
+            })
+        else:
+            itens.append({"id_treino": id_treino, "status": "ok"})
+    
+    return resultado_bulk("reatribuir", itens)
+
+async def bulk_deletar(ids: Optional[List[str]], filtro: Optional[TreinoBulkFiltro]):
+    if ids is not None:
+        validos, itens = separar_ids_bulk(ids)
+        encontrados = await repo.treinos.remover_muitos(validos) if validos else set()
+        return resultado_bulk("deletar", itens_encontrados(validos, encontrados, itens))
+    
+    query = {k: v for k, v in filtro.model_dump().items() if v is not None}
+    if not query:
+        raise HTTPException(status_code=400, detail="Filtro vazio não é permitido")
+    
+    removidos = await repo.treinos.remover_por_filtro(query, BULK_LIMITE)
+    # Capped per request; a full page means matching treinos may remain
+    return {
+        **resultado_bulk("deletar", itens_encontrados(removidos, set(removidos), [])),
+        "truncado": len(removidos) >= BULK_LIMITE,
+    }
+
 @api_router.put("/treinos/{id_treino}", response_model=Treino)
 async def update_treino(id_treino: str, treino: TreinoUpdate, admin_id: str = Depends(verify_token)):
     update_data = {k: v for k, v in treino.model_dump().items() if v is not None}
@@ -587,82 +1000,406 @@ async def update_treino(id_treino: str, treino: TreinoUpdate, admin_id: str = De
         raise HTTPException(status_code=400, detail="Nenhum dado para atualizar")
     
     if 'aluno_id_aluno' in update_data:
-        aluno = await db.alunos.find_one({"_id": ObjectId(update_data['aluno_id_aluno'])})
+        aluno = await repo.alunos.obter(update_data['aluno_id_aluno'])
         if not aluno:
             raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    result = await db.treinos.update_one(
-        {"_id": ObjectId(id_treino)},
-        {"$set": update_data}
-    )
+    atual = await repo.treinos.obter(id_treino)
+    if not atual:
+        raise HTTPException(status_code=404, detail="Treino não encontrado")
+    
+    # Re-check the instructor's slot whenever the schedule changes
+    novo = {**atual, **update_data}
+    if repositorio.mudou_horario(atual, update_data) and novo.get('tipo_treino') == "Personalizado":
+        validar_horario_treino(novo)
+        
+        if 'instrutor_id_instrutor' in update_data:
+            instrutor = await repo.instrutores.obter(update_data['instrutor_id_instrutor'])
+            if not instrutor:
+                raise HTTPException(status_code=404, detail="Instrutor não encontrado")
     
-    if result.matched_count == 0:
+    try:
+        updated = await repo.treinos.atualizar(id_treino, update_data, atual)
+    except ConflitoHorario:
+        raise HTTPException(status_code=400, detail="Instrutor já possui treino agendado neste horário")
+    
+    if not updated:
         raise HTTPException(status_code=404, detail="Treino não encontrado")
     
-    updated = await db.treinos.find_one({"_id": ObjectId(id_treino)})
-    aluno = await db.alunos.find_one({"_id": ObjectId(updated['aluno_id_aluno'])})
+    aluno = await repo.alunos.obter(updated['aluno_id_aluno'])
     
-    response_dict = {**updated, "id_treino": str(updated['_id']), "aluno_nome": aluno['nome'] if aluno else None}
+    response_dict = {**updated, "aluno_nome": aluno['nome'] if aluno else None}
     
     if updated.get('instrutor_id_instrutor'):
-        instrutor = await db.instrutores.find_one({"_id": ObjectId(updated['instrutor_id_instrutor'])})
+        instrutor = await repo.instrutores.obter(updated['instrutor_id_instrutor'])
         response_dict['instrutor_nome'] = instrutor['nome'] if instrutor else None
     
     return response_dict
 
 @api_router.delete("/treinos/{id_treino}")
 async def delete_treino(id_treino: str, admin_id: str = Depends(verify_token)):
-    result = await db.treinos.delete_one({"_id": ObjectId(id_treino)})
-    
-    if result.deleted_count == 0:
+    if not await repo.treinos.remover(id_treino):
         raise HTTPException(status_code=404, detail="Treino não encontrado")
     
     return {"message": "Treino deletado com sucesso"}
 
 @api_router.patch("/treinos/{id_treino}/toggle-concluido")
 async def toggle_treino_concluido(id_treino: str, admin_id: str = Depends(verify_token)):
-    treino = await db.treinos.find_one({"_id": ObjectId(id_treino)})
-    if not treino:
+    novo_status = await repo.treinos.alternar_concluido(id_treino)
+    if novo_status is None:
         raise HTTPException(status_code=404, detail="Treino não encontrado")
     
-    novo_status = not treino.get('concluido', False)
-    
-    await db.treinos.update_one(
-        {"_id": ObjectId(id_treino)},
-        {"$set": {"concluido": novo_status}}
-    )
-    
     return {"message": "Status atualizado", "concluido": novo_status}
 
+# ===================== JOBS =====================
+
+async def remover_treinos_em_lotes(ctx: jobs.JobContext, filtro: dict, progresso_alunos: bool = True) -> int:
+    """Delete matching treinos batch by batch, releasing their slots; resumable as is.
+    
+    ``progresso_alunos`` takes them out of their alunos' summaries, unless
+    the alunos themselves are gone.
+    """
+    removidos = 0
+    while True:
+        treinos = await ctx.db.treinos.find(filtro, progresso.CAMPOS_TREINO).limit(ctx.lote).to_list(ctx.lote)
+        if not treinos:
+            return removidos
+        ids = [t['_id'] for t in treinos]
+        await ctx.db.treinos.delete_many({"_id": {"$in": ids}})
+        await reservas.liberar_muitos(ctx.db.reservas, [str(i) for i in ids])
+        if progresso_alunos:
+            await progresso.aplicar(ctx.db, [(t, None) for t in treinos])
+        removidos += len(ids)
+        await ctx.checkpoint(len(ids))
+
+@executor_jobs.handler("cascata_aluno")
+async def job_cascata_aluno(ctx: jobs.JobContext):
+    filtro = {"aluno_id_aluno": referencias.filtro(ctx.params['id_aluno'])}
+    treinos = await remover_treinos_em_lotes(ctx, filtro, progresso_alunos=False)
+    arquivados = await arquivo.deletar(ctx.db, filtro)
+    return {"treinos_removidos": treinos, "arquivados_removidos": arquivados}
+
+@executor_jobs.handler("cascata_instrutor")
+async def job_cascata_instrutor(ctx: jobs.JobContext):
+    referencia = referencias.filtro(ctx.params['id_instrutor'])
+    agendas = await ctx.db.agendas_fixas.delete_many({"instrutor_id_instrutor": referencia})
+    # Personalised treinos cannot happen without their instrutor, archived ones included
+    filtro = {"tipo_treino": "Personalizado", "instrutor_id_instrutor": referencia}
+    treinos = await remover_treinos_em_lotes(ctx, filtro)
+    if 'alunos_arquivo' not in ctx.estado:
+        alunos = await arquivo.distintos(ctx.db, "aluno_id_aluno", filtro)
+        await ctx.checkpoint(alunos_arquivo=[str(a) for a in alunos])
+    arquivados = await arquivo.deletar(ctx.db, filtro)
+    await progresso.recalcular(ctx.db, ctx.estado['alunos_arquivo'])
+    return {
+        "agendas_removidas": agendas.deleted_count, "treinos_removidos": treinos, "arquivados_removidos": arquivados,
+    }
+
+@executor_jobs.handler("reatribuir_instrutor")
+async def job_reatribuir_instrutor(ctx: jobs.JobContext):
+    origem, destino = ctx.params['de'], ctx.params['para']
+    filtro = {"instrutor_id_instrutor": referencias.filtro(origem)}
+    if ctx.params.get('a_partir_de'):
+        filtro['data'] = {"$gte": ctx.params['a_partir_de']}
+    movidos, conflitos = ctx.estado.get('movidos', 0), ctx.estado.get('conflitos', 0)
+    
+    while True:
+        # Conflicting treinos stay with the origin, so walk by _id instead of re-querying
+        filtro_lote = dict(filtro)
+        if ctx.estado.get('ultimo_id'):
+            filtro_lote['_id'] = {"$gt": ObjectId(ctx.estado['ultimo_id'])}
+        treinos = await ctx.db.treinos.find(filtro_lote).sort("_id", ASCENDING).limit(ctx.lote).to_list(ctx.lote)
+        if not treinos:
+            return {"movidos": movidos, "conflitos": conflitos}
+        
+        aceitos = []
+        for treino in treinos:
+            id_treino = str(treino['_id'])
+            if treino.get('tipo_treino') == "Personalizado" and all(
+                treino.get(campo) for campo in ('data', 'hora_inicio', 'hora_fim')
+            ):
+                inicio, fim = reservas.minutos(treino['hora_inicio']), reservas.minutos(treino['hora_fim'])
+                if not await reservas.reservar(ctx.db.reservas, destino, treino['data'], inicio, fim, id_treino):
+                    conflitos += 1
+                    continue
+                await reservas.liberar(ctx.db.reservas, id_treino, origem, treino['data'])
+            aceitos.append(treino['_id'])
+        
+        if aceitos:
+            await ctx.db.treinos.update_many(
+                {"_id": {"$in": aceitos}}, {"$set": {"instrutor_id_instrutor": ObjectId(destino)}}
+            )
+        movidos += len(aceitos)
+        await ctx.checkpoint(len(treinos), ultimo_id=str(treinos[-1]['_id']), movidos=movidos, conflitos=conflitos)
+
+async def classificar_orfaos(ctx: jobs.JobContext, treinos: List[dict]) -> Tuple[List[dict], Set[str]]:
+    """Treinos of missing alunos, or personalised ones of missing instrutores; and the alunos that exist."""
+    alunos = {t['aluno_id_aluno'] for t in treinos if t.get('aluno_id_aluno')}
+    instrutores = {t['instrutor_id_instrutor'] for t in treinos if t.get('instrutor_id_instrutor')}
+    existentes_alunos = {str(d['_id']) async for d in ctx.db.alunos.find(
+        {"_id": {"$in": [referencias.para_oid(str(a)) for a in alunos]}}, {"_id": 1})}
+    existentes_instrutores = {str(d['_id']) async for d in ctx.db.instrutores.find(
+        {"_id": {"$in": [referencias.para_oid(str(i)) for i in instrutores]}}, {"_id": 1})}
+    
+    orfaos = [
+        t for t in treinos
+        if str(t.get('aluno_id_aluno')) not in existentes_alunos
+        or (t.get('tipo_treino') == "Personalizado" and t.get('instrutor_id_instrutor')
+            and str(t['instrutor_id_instrutor']) not in existentes_instrutores)
+    ]
+    return orfaos, existentes_alunos
+
+@executor_jobs.handler("reconciliar")
+async def job_reconciliar(ctx: jobs.JobContext):
+    """Remove what earlier failures may have left behind.
+    
+    Treinos of missing alunos (or personalised ones of missing instrutores)
+    are deleted from the hot collection and the archive partitions, slot
+    intervals of missing treinos are released, and the check-in aggregates
+    are recomputed.
+    """
+    campos = {**progresso.CAMPOS_TREINO, "instrutor_id_instrutor": 1, "tipo_treino": 1}
+    treinos_orfaos = ctx.estado.get('treinos_orfaos', 0)
+    while ctx.estado.get('fase', 'treinos') == 'treinos':
+        filtro = {"_id": {"$gt": ObjectId(ctx.estado['ultimo_id'])}} if ctx.estado.get('ultimo_id') else {}
+        treinos = await ctx.db.treinos.find(filtro, campos).sort("_id", ASCENDING).limit(ctx.lote).to_list(ctx.lote)
+        if not treinos:
+            await ctx.checkpoint(fase='arquivo', ultimo_id=None)
+            break
+        
+        orfaos, existentes_alunos = await classificar_orfaos(ctx, treinos)
+        if orfaos:
+            await ctx.db.treinos.delete_many({"_id": {"$in": [t['_id'] for t in orfaos]}})
+            await reservas.liberar_muitos(ctx.db.reservas, [str(t['_id']) for t in orfaos])
+            # Personalised treinos of a missing instrutor may still count for their aluno
+            await progresso.aplicar(
+                ctx.db, [(t, None) for t in orfaos if str(t.get('aluno_id_aluno')) in existentes_alunos]
+            )
+            treinos_orfaos += len(orfaos)
+        await ctx.checkpoint(len(treinos), ultimo_id=str(treinos[-1]['_id']), treinos_orfaos=treinos_orfaos)
+    
+    arquivados_orfaos = ctx.estado.get('arquivados_orfaos', 0)
+    if ctx.estado.get('fase') == 'arquivo':
+        # Partitions in order, each walked by _id; their slots were released when archived
+        for particao in await arquivo.particoes(ctx.db):
+            if ctx.estado.get('particao') and particao < ctx.estado['particao']:
+                continue
+            colecao = arquivo.colecao_particao(ctx.db, particao)
+            while True:
+                filtro = {}
+                if ctx.estado.get('particao') == particao and ctx.estado.get('ultimo_id'):
+                    filtro = {"_id": {"$gt": ObjectId(ctx.estado['ultimo_id'])}}
+                treinos = await colecao.find(filtro, campos).sort("_id", ASCENDING).limit(ctx.lote).to_list(ctx.lote)
+                if not treinos:
+                    break
+                
+                orfaos, existentes_alunos = await classificar_orfaos(ctx, treinos)
+                if orfaos:
+                    removidos = await colecao.delete_many({"_id": {"$in": [t['_id'] for t in orfaos]}})
+                    await ctx.db[arquivo.CATALOGO].update_one(
+                        {"_id": particao}, {"$inc": {"total": -removidos.deleted_count}})
+                    await progresso.recalcular(ctx.db, {
+                        t['aluno_id_aluno'] for t in orfaos if str(t.get('aluno_id_aluno')) in existentes_alunos})
+                    arquivados_orfaos += removidos.deleted_count
+                await ctx.checkpoint(len(treinos), particao=particao, ultimo_id=str(treinos[-1]['_id']),
+                                     arquivados_orfaos=arquivados_orfaos)
+        await ctx.checkpoint(fase='reservas', particao=None, ultimo_id=None)
+    
+    intervalos_orfaos = ctx.estado.get('intervalos_orfaos', 0)
+    # criar() reserves the slot before inserting the treino: leave recent ids alone
+    limite = datetime.now(timezone.utc) - RECONCILIAR_CARENCIA
+    while True:
+        filtro = {"_id": {"$gt": ctx.estado['ultimo_id']}} if ctx.estado.get('ultimo_id') else {}
+        slots = await ctx.db.reservas.find(filtro).sort("_id", ASCENDING).limit(ctx.lote).to_list(ctx.lote)
+        if not slots:
+            break
+        
+        referenciados = {i['treino_id'] for slot in slots for i in slot.get('intervalos', [])}
+        existentes = {str(d['_id']) async for d in ctx.db.treinos.find(
+            {"_id": {"$in": [ObjectId(t) for t in referenciados if ObjectId.is_valid(t)]}}, {"_id": 1})}
+        orfaos = [
+            t for t in referenciados
+            if t not in existentes and not (ObjectId.is_valid(t) and ObjectId(t).generation_time > limite)
+        ]
+        if orfaos:
+            await reservas.liberar_muitos(ctx.db.reservas, orfaos)
+            intervalos_orfaos += len(orfaos)
+        await ctx.checkpoint(len(slots), ultimo_id=slots[-1]['_id'], intervalos_orfaos=intervalos_orfaos)
+    
+    dias, alunos = await checkins.recalcular_agregados(ctx.db)
+    return {"treinos_orfaos": treinos_orfaos, "arquivados_orfaos": arquivados_orfaos,
+            "intervalos_orfaos": intervalos_orfaos, "dias_checkins": dias, "alunos_checkins": alunos}
+
+def exige_mongo():
+    # Jobs live in the tenant's Mongo database; SQLite cascades run inline
+    if not MONGO:
+        raise HTTPException(status_code=501, detail="Tarefas em segundo plano exigem o motor MongoDB")
+
+@api_router.get("/jobs", response_model=List[Job], dependencies=[Depends(exige_mongo)])
+async def get_jobs(status: Optional[str] = None, admin_id: str = Depends(verify_token)):
+    return [jobs.serializar(job) for job in await executor_jobs.listar(db, status)]
+
+@api_router.get("/jobs/{id_job}", response_model=Job, dependencies=[Depends(exige_mongo)])
+async def get_job(id_job: str, admin_id: str = Depends(verify_token)):
+    job = await executor_jobs.obter(db, id_job)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return jobs.serializar(job)
+
+@api_router.post("/jobs/reconciliar", response_model=JobCriado, status_code=202, dependencies=[Depends(exige_mongo)])
+async def create_job_reconciliar(admin_id: str = Depends(verify_token)):
+    id_job = await executor_jobs.enfileirar(db, "reconciliar", {})
+    return {"message": "Reconciliação agendada", "id_job": id_job}
+
+@api_router.post("/instrutores/{id_instrutor}/reatribuir", response_model=JobCriado, status_code=202,
+                 dependencies=[Depends(exige_mongo)])
+async def reatribuir_treinos_instrutor(id_instrutor: str, pedido: ReatribuicaoRequest,
+                                       admin_id: str = Depends(verify_token)):
+    if not ObjectId.is_valid(id_instrutor) or not ObjectId.is_valid(pedido.instrutor_destino):
+        raise HTTPException(status_code=400, detail="ID inválido")
+    if id_instrutor == pedido.instrutor_destino:
+        raise HTTPException(status_code=400, detail="Instrutor de destino deve ser diferente do de origem")
+    
+    destino = await repo.instrutores.obter(pedido.instrutor_destino)
+    if not destino:
+        raise HTTPException(status_code=404, detail="Instrutor não encontrado")
+    
+    id_job = await executor_jobs.enfileirar(db, "reatribuir_instrutor", {
+        "de": id_instrutor, "para": pedido.instrutor_destino, "a_partir_de": pedido.a_partir_de
+    })
+    return {"message": "Reatribuição agendada", "id_job": id_job}
+
+# ===================== CHECKINS =====================
+
+async def receber_checkins(itens: List[CheckinCreate]) -> dict:
+    # Unknown alunos (and treinos of exercise events) are rejected per item with batched lookups
+    alunos = await repo.alunos.obter_muitos(c.aluno_id_aluno for c in itens)
+    ids_treinos = list({
+        c.treino_id for c in itens if c.tipo == checkins.EXERCICIO and ObjectId.is_valid(c.treino_id or '')
+    })
+    treinos = dict(zip(ids_treinos, await asyncio.gather(*(repo.treinos.obter(t) for t in ids_treinos))))
+    documentos, rejeitados = [], []
+    for indice, checkin in enumerate(itens):
+        if checkin.tipo not in checkins.TIPOS:
+            detalhe = f"Tipo inválido (use {' ou '.join(checkins.TIPOS)})"
+        elif not alunos.get(checkin.aluno_id_aluno):
+            detalhe = "Aluno não encontrado"
+        elif checkin.tipo == checkins.EXERCICIO and (
+            not treinos.get(checkin.treino_id) or treinos[checkin.treino_id]['aluno_id_aluno'] != checkin.aluno_id_aluno
+        ):
+            detalhe = "Treino não encontrado para o aluno"
+        else:
+            documentos.append(checkins.documento(
+                checkin.aluno_id_aluno, checkin.momento, checkin.origem, checkin.tipo, checkin.treino_id,
+                checkin.exercicio,
+            ))
+            continue
+        rejeitados.append({"indice": indice, "aluno_id_aluno": checkin.aluno_id_aluno, "detalhe": detalhe})
+    
+    if documentos:
+        await buffer_checkins.adicionar(repo.checkins.destino(), documentos)
+    
+    return {"aceitos": len(documentos), "rejeitados": rejeitados}
+
+@api_router.post("/checkins", response_model=CheckinResult, status_code=202)
+async def create_checkin(checkin: CheckinCreate, admin_id: str = Depends(verify_token)):
+    result = await receber_checkins([checkin])
+    if result['rejeitados']:
+        detalhe = result['rejeitados'][0]['detalhe']
+        raise HTTPException(status_code=400 if detalhe.startswith("Tipo") else 404, detail=detalhe)
+    return result
+
+@api_router.post("/checkins/batch", response_model=CheckinResult, status_code=202)
+async def create_checkins_batch(lote: CheckinBatch, admin_id: str = Depends(verify_token)):
+    if len(lote.checkins) > CHECKIN_LOTE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"Máximo de {CHECKIN_LOTE_MAXIMO} check-ins por lote")
+    return await receber_checkins(lote.checkins)
+
+@api_router.get("/checkins/frequencia", response_model=List[FrequenciaDiaria])
+async def get_frequencia(data_inicio: Optional[str] = None, data_fim: Optional[str] = None,
+                         admin_id: str = Depends(verify_token)):
+    return await repo.checkins.frequencia(data_inicio, data_fim)
+
 # Include router
 app.include_router(api_router)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("startup")
-async def startup_db():
-    existing_admin = await db.admins.find_one({"email": "admin@gymtrack.com"})
+async def inicializar_tenant():
+    """Schema, indexes, backfills and seeding of the current tenant's storage.
+
+    Runs lazily on the first request of each tenant (see TenantMiddleware).
+    """
+    await repo.inicializar()
+    if MONGO:
+        await jobs.criar_indices(db)
+    
+    existing_admin = await repo.admins.por_email("admin@gymtrack.com")
     if not existing_admin:
         hashed = bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt())
-        await db.admins.insert_one({
+        await repo.admins.criar({
             "nome": "Administrador",
             "email": "admin@gymtrack.com",
             "senha": hashed.decode('utf-8')
         })
-        logger.info("Admin padrão criado: admin@gymtrack.com / admin123")
+        logger.info(f"Admin padrão criado ({tenants.nome_banco(tenant_atual.get())}): admin@gymtrack.com / admin123")
+
+# Inside TenantMiddleware: stored responses belong to the request's tenant
+app.add_middleware(
+    idempotencia.IdempotenciaMiddleware, respostas=respostas_idempotentes, secret=SECRET_KEY, algorithm=ALGORITHM
+)
+
+app.add_middleware(replicas.ConsistenciaMiddleware, client=client, habilitado=LEITURA_SECUNDARIA and MONGO)
+
+app.add_middleware(
+    TenantMiddleware, router=tenants, secret=SECRET_KEY, algorithm=ALGORITHM, inicializar=inicializar_tenant
+)
+
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_credentials=True,
+    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Consistencia", idempotencia.REPETIDA_HEADER],
+)
+
+@app.on_event("startup")
+async def startup_db():
+    app.state.checkins = asyncio.create_task(buffer_checkins.executar_periodicamente())
+    
+    if not MONGO:
+        return
+    
+    # Cache invalidations of every tenant share the default database's channel
+    controle = tenants.banco(tenancy.TENANT_PADRAO)
+    await canal_cache.preparar(controle)
+    app.state.canal_cache = asyncio.create_task(canal_cache.escutar(controle))
+    
+    app.state.jobs = asyncio.create_task(executor_jobs.executar_periodicamente(
+        lambda: [tenants.banco(t) for t in sorted(tenancy.tenants_prontos)]
+    ))
+    
+    if ARQUIVO_HORIZONTE_DIAS > 0:
+        app.state.arquivamento = asyncio.create_task(arquivo.executar_periodicamente(
+            lambda: [tenants.banco(t) for t in sorted(tenancy.tenants_prontos)],
+            ARQUIVO_HORIZONTE_DIAS, ARQUIVO_INTERVALO_HORAS, ARQUIVO_LOTE
+        ))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for tarefa in ('arquivamento', 'canal_cache', 'checkins', 'jobs'):
+        if getattr(app.state, tarefa, None):
+            getattr(app.state, tarefa).cancel()
+    # Buffered check-ins were already acknowledged; fechar() waits for any flush
+    # in progress and writes the rest before the connections close
+    await buffer_checkins.fechar()
+    await repo.fechar()
+    if client:
+        client.close()
\ No newline at end of file
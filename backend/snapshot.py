@@ -0,0 +1,247 @@
+"""Parquet snapshots of the GymTrack collections for offline analytics.
+
+    python snapshot.py exportar --destino ./snapshots
+    python snapshot.py exportar --destino ./snapshots --incremental
+
+Each run writes ``<destino>/<colecao>/snapshot=<id>/part-NNNNN.parquet``
+(treinos are further split by ``mes=YYYY-MM``), streaming from Motor
+cursors in batches so memory stays bounded by ``--lote``. Instructor and
+aluno names are resolved per batch. Incremental runs only export
+documents whose ``_id`` is newer than the previous run, which means they
+capture new documents, not edits to old ones.
+
+An ``_id`` is generated before its insert lands, so ids do not arrive in
+order: documents younger than ``--atraso`` seconds are left for the next
+run, and the watermark is the last ``_id`` actually written.
+
+Reads go to secondaries when there are any (``secondaryPreferred``, at
+most ``--max-staleness`` seconds behind, see replicas.py).
+
+Analysts read a snapshot with ``pandas.read_parquet("snapshots/treinos")``.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import arquivo
+import replicas
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+app = typer.Typer(help="Snapshots colunares (Parquet) do GymTrack para análise offline")
+
+ESTADO = "_estado.json"
+
+SCHEMAS = {
+    "alunos": pa.schema([
+        ("id_aluno", pa.string()),
+        ("nome", pa.string()),
+        ("endereco", pa.string()),
+        ("idade", pa.int64()),
+        ("email", pa.string()),
+        ("criado_em", pa.timestamp("s", tz="UTC")),
+    ]),
+    "instrutores": pa.schema([
+        ("id_instrutor", pa.string()),
+        ("nome", pa.string()),
+        ("idade", pa.int64()),
+        ("email", pa.string()),
+        ("telefone", pa.string()),
+        ("criado_em", pa.timestamp("s", tz="UTC")),
+    ]),
+    "agendas_fixas": pa.schema([
+        ("id_agenda", pa.string()),
+        ("instrutor_id_instrutor", pa.string()),
+        ("instrutor_nome", pa.string()),
+        ("dias_semana", pa.string()),
+        ("hora_inicio", pa.string()),
+        ("hora_fim", pa.string()),
+        ("disponivel", pa.bool_()),
+        ("criado_em", pa.timestamp("s", tz="UTC")),
+    ]),
+    "treinos": pa.schema([
+        ("id_treino", pa.string()),
+        ("tipo_treino", pa.string()),
+        ("nome_treino", pa.string()),
+        ("aluno_id_aluno", pa.string()),
+        ("aluno_nome", pa.string()),
+        ("data", pa.string()),
+        ("hora_inicio", pa.string()),
+        ("hora_fim", pa.string()),
+        ("instrutor_id_instrutor", pa.string()),
+        ("instrutor_nome", pa.string()),
+        ("descricao", pa.string()),
+        ("nivel", pa.string()),
+        ("concluido", pa.bool_()),
+        ("arquivado", pa.bool_()),
+        ("criado_em", pa.timestamp("s", tz="UTC")),
+    ]),
+}
+
+ID_CAMPO = {
+    "alunos": "id_aluno",
+    "instrutores": "id_instrutor",
+    "agendas_fixas": "id_agenda",
+    "treinos": "id_treino",
+}
+
+
+def ler_estado(destino: Path) -> dict:
+    caminho = destino / ESTADO
+    return json.loads(caminho.read_text()) if caminho.exists() else {"ultimo_id": {}, "snapshots": []}
+
+
+def salvar_estado(destino: Path, estado: dict):
+    temporario = destino / (ESTADO + ".tmp")
+    temporario.write_text(json.dumps(estado, indent=2))
+    temporario.replace(destino / ESTADO)
+
+
+async def resolver_nomes(colecao, ids) -> dict:
+    oids = [ObjectId(i) for i in {str(i) for i in ids if i} if ObjectId.is_valid(i)]
+    if not oids:
+        return {}
+    return {str(doc['_id']): doc['nome'] async for doc in colecao.find({"_id": {"$in": oids}}, {"nome": 1})}
+
+
+async def linhas_do_lote(db, colecao: str, documentos: list, arquivado: bool) -> list:
+    schema = SCHEMAS[colecao]
+    instrutores, alunos = {}, {}
+    if colecao in ("treinos", "agendas_fixas"):
+        instrutores = await resolver_nomes(db.instrutores, [d.get('instrutor_id_instrutor') for d in documentos])
+    if colecao == "treinos":
+        alunos = await resolver_nomes(db.alunos, [d.get('aluno_id_aluno') for d in documentos])
+
+    linhas = []
+    for doc in documentos:
+        linha = {campo: doc.get(campo) for campo in schema.names}
+        linha[ID_CAMPO[colecao]] = str(doc['_id'])
+        linha['criado_em'] = doc['_id'].generation_time
+        for ref in ("aluno_id_aluno", "instrutor_id_instrutor"):
+            if linha.get(ref) is not None:
+                linha[ref] = str(linha[ref])
+        if "instrutor_nome" in linha:
+            linha['instrutor_nome'] = instrutores.get(linha.get('instrutor_id_instrutor'))
+        if colecao == "treinos":
+            linha['aluno_nome'] = alunos.get(linha.get('aluno_id_aluno'))
+            linha['arquivado'] = arquivado
+        linhas.append(linha)
+    return linhas
+
+
+def escrever_parte(pasta: Path, colecao: str, linhas: list, numero: int) -> int:
+    """Write one batch; treinos are split into mes=YYYY-MM sub-partitions."""
+    grupos = {"": linhas}
+    if colecao == "treinos":
+        grupos = {}
+        for linha in linhas:
+            mes = (linha.get('data') or "")[:7] or "sem_data"
+            grupos.setdefault(f"mes={mes}", []).append(linha)
+
+    for subpasta, grupo in grupos.items():
+        alvo = pasta / subpasta if subpasta else pasta
+        alvo.mkdir(parents=True, exist_ok=True)
+        tabela = pa.Table.from_pylist(grupo, schema=SCHEMAS[colecao])
+        pq.write_table(tabela, alvo / f"part-{numero:05d}.parquet", compression="zstd")
+    return len(linhas)
+
+
+async def exportar_colecao(db, colecao: str, pasta: Path, lote: int, desde: Optional[str], atraso: float = 60.0):
+    # Inserts still in flight carry ids older than now: stop short of them
+    corte = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=atraso))
+    filtro = {"_id": {"$gt": ObjectId(desde), "$lt": corte} if desde else {"$lt": corte}}
+    fontes = [(db[colecao], False)]
+    if colecao == "treinos":
+        # Archived partitions keep their original _id, so one watermark covers both
+        fontes += [(arquivo.colecao_particao(db, nome), True) for nome in await arquivo.particoes(db)]
+
+    total, numero, ultimo_id = 0, 0, desde
+    for fonte, arquivado in fontes:
+        projecao = {"busca_nome": 0, "busca_email": 0, "busca_tokens": 0}
+        cursor = fonte.find(filtro, projecao).sort("_id", 1).batch_size(lote)
+        documentos = []
+        async for doc in cursor:
+            documentos.append(doc)
+            if ultimo_id is None or doc['_id'] > ObjectId(ultimo_id):
+                ultimo_id = str(doc['_id'])
+            if len(documentos) >= lote:
+                linhas = await linhas_do_lote(db, colecao, documentos, arquivado)
+                total += escrever_parte(pasta, colecao, linhas, numero)
+                numero += 1
+                documentos = []
+        if documentos:
+            total += escrever_parte(pasta, colecao, await linhas_do_lote(db, colecao, documentos, arquivado), numero)
+            numero += 1
+
+    return total, ultimo_id
+
+
+async def executar_exportacao(mongo_url: str, banco: str, destino: Path, colecoes: List[str], lote: int,
+                              incremental: bool, atraso: float = 60.0, max_staleness: int = 90):
+    client = AsyncIOMotorClient(mongo_url)
+    db = client.get_database(banco, read_preference=replicas.preferencia_leitura(True, max_staleness))
+    destino.mkdir(parents=True, exist_ok=True)
+    estado = ler_estado(destino)
+    snapshot_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    resumo = {}
+
+    try:
+        for colecao in colecoes:
+            desde = estado["ultimo_id"].get(colecao) if incremental else None
+            pasta = destino / colecao / f"snapshot={snapshot_id}"
+            total, ultimo_id = await exportar_colecao(db, colecao, pasta, lote, desde, atraso)
+            if ultimo_id:
+                estado["ultimo_id"][colecao] = ultimo_id
+            resumo[colecao] = total
+            typer.echo(f"{colecao}: {total} documentos")
+    finally:
+        client.close()
+
+    estado["snapshots"].append({"id": snapshot_id, "incremental": incremental, "documentos": resumo})
+    salvar_estado(destino, estado)
+
+
+@app.command()
+def exportar(
+    destino: Path = typer.Option(Path("snapshots"), help="Pasta onde os arquivos Parquet são gravados"),
+    colecao: List[str] = typer.Option(list(SCHEMAS), help="Coleções a exportar (repita a opção)"),
+    lote: int = typer.Option(5000, min=1, help="Documentos por lote / arquivo Parquet"),
+    incremental: bool = typer.Option(False, help="Exportar apenas documentos novos desde o último snapshot"),
+    atraso: float = typer.Option(
+        60.0, min=0, help="Segundos de documentos recentes deixados para a próxima execução"
+    ),
+    max_staleness: int = typer.Option(
+        int(os.environ.get('LEITURA_MAX_STALENESS_S', '90')), envvar="LEITURA_MAX_STALENESS_S",
+        help="Atraso máximo, em segundos, do secundário lido"
+    ),
+    mongo_url: str = typer.Option(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), envvar="MONGO_URL"),
+    banco: str = typer.Option(os.environ.get('DB_NAME', 'GymTrack_DB'), envvar="DB_NAME"),
+):
+    """Exporta alunos, instrutores, agendas fixas e treinos para Parquet."""
+    invalidas = [c for c in colecao if c not in SCHEMAS]
+    if invalidas:
+        raise typer.BadParameter(f"Coleções desconhecidas: {', '.join(invalidas)}")
+    asyncio.run(executar_exportacao(mongo_url, banco, destino, colecao, lote, incremental, atraso, max_staleness))
+
+
+@app.command()
+def listar(destino: Path = typer.Option(Path("snapshots"))):
+    """Lista os snapshots já gravados em DESTINO."""
+    for snapshot in ler_estado(destino)["snapshots"]:
+        tipo = "incremental" if snapshot["incremental"] else "completo"
+        typer.echo(f"{snapshot['id']} ({tipo}): {snapshot['documentos']}")
+
+
+if __name__ == "__main__":
+    app()
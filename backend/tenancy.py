@@ -0,0 +1,180 @@
+import re
+import time
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+import jwt
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+TENANT_HEADER = "x-tenant"
+TENANT_CLAIM = "tenant"
+TENANT_PADRAO = "default"
+TENANT_REGEX = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+tenant_atual: ContextVar[str] = ContextVar("tenant_atual", default=TENANT_PADRAO)
+
+
+class TenantRouter:
+    """Maps tenants to databases of one shared ``AsyncIOMotorClient``.
+
+    The default tenant keeps the configured ``DB_NAME`` so single-gym
+    deployments see no change; every other tenant gets ``<DB_NAME>_<tenant>``.
+    Only configured tenants are accepted: each one gets its own seeded
+    database, so an arbitrary header must not be able to create them.
+    """
+
+    def __init__(self, client, db_name: str, permitidos: Iterable[str] = ()):
+        self.client = client
+        self.db_name = db_name
+        self.permitidos = {t for t in permitidos if TENANT_REGEX.match(t)}
+
+    def valido(self, tenant: str) -> bool:
+        return tenant == TENANT_PADRAO or tenant in self.permitidos
+
+    def tenants(self) -> list:
+        return [TENANT_PADRAO] + sorted(self.permitidos)
+
+    def nome_banco(self, tenant: str) -> str:
+        return self.db_name if tenant == TENANT_PADRAO else f"{self.db_name}_{tenant}"
+
+    def banco(self, tenant: str, read_preference=None):
+        if read_preference is None:
+            return self.client[self.nome_banco(tenant)]
+        return self.client.get_database(self.nome_banco(tenant), read_preference=read_preference)
+
+
+class TenantDatabase:
+    """Stands in for the module-level ``db``: resolves the current tenant's
+    database from the request context on every attribute access."""
+
+    def __init__(self, router: TenantRouter, read_preference=None):
+        self._router = router
+        self._read_preference = read_preference
+
+    def atual(self):
+        return self._router.banco(tenant_atual.get(), self._read_preference)
+
+    @property
+    def name(self) -> str:
+        return self._router.nome_banco(tenant_atual.get())
+
+    def __getattr__(self, nome):
+        return getattr(self.atual(), nome)
+
+    def __getitem__(self, nome):
+        return self.atual()[nome]
+
+
+class TenantMetrics:
+    def __init__(self):
+        self.requisicoes = 0
+        self.em_andamento = 0
+        self.erros = 0
+        self.latencia_total = 0.0
+        self.latencia_max = 0.0
+
+    def registrar(self, duracao: float, status: int):
+        self.requisicoes += 1
+        self.latencia_total += duracao
+        self.latencia_max = max(self.latencia_max, duracao)
+        if status >= 500:
+            self.erros += 1
+
+    def stats(self) -> dict:
+        return {
+            "requisicoes": self.requisicoes,
+            "em_andamento": self.em_andamento,
+            "erros_5xx": self.erros,
+            "latencia_media_ms": round(self.latencia_total / self.requisicoes * 1000, 2) if self.requisicoes else None,
+            "latencia_max_ms": round(self.latencia_max * 1000, 2),
+        }
+
+
+class TenantMiddleware:
+    """Resolves the tenant of each request and runs its lazy initialization.
+
+    The tenant comes from the JWT claim, else from the ``X-Tenant`` header,
+    else the default tenant. A header that contradicts the token's claim is
+    rejected. ``inicializar`` (indexes, backfills, seeding) runs once per
+    tenant on its first request, inside that tenant's context.
+    """
+
+    def __init__(self, app, router: TenantRouter, secret: str, algorithm: str,
+                 inicializar: Callable[[], Awaitable[None]]):
+        self.app = app
+        self.router = router
+        self.secret = secret
+        self.algorithm = algorithm
+        self.inicializar = inicializar
+
+    def claim(self, headers: Headers) -> Optional[str]:
+        autorizacao = headers.get("authorization", "")
+        if not autorizacao.lower().startswith("bearer "):
+            return None
+        try:
+            payload = jwt.decode(autorizacao[7:], self.secret, algorithms=[self.algorithm])
+        except jwt.InvalidTokenError:
+            return None  # verify_token rejects it later with the usual message
+        return payload.get(TENANT_CLAIM, TENANT_PADRAO)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        do_token = self.claim(headers)
+        do_header = headers.get(TENANT_HEADER)
+        if do_token and do_header and do_token != do_header:
+            await JSONResponse({"detail": "Tenant não corresponde ao token"}, status_code=403)(scope, receive, send)
+            return
+
+        tenant = do_token or do_header or TENANT_PADRAO
+        if not self.router.valido(tenant):
+            await JSONResponse({"detail": "Tenant inválido"}, status_code=400)(scope, receive, send)
+            return
+
+        token = tenant_atual.set(tenant)
+        try:
+            await garantir_tenant(tenant, self.inicializar)
+            metricas = metricas_tenants.setdefault(tenant, TenantMetrics())
+            status = {"code": 500}
+
+            async def send_com_status(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                await send(message)
+
+            inicio = time.perf_counter()
+            metricas.em_andamento += 1
+            try:
+                await self.app(scope, receive, send_com_status)
+            finally:
+                metricas.em_andamento -= 1
+                metricas.registrar(time.perf_counter() - inicio, status["code"])
+        finally:
+            tenant_atual.reset(token)
+
+
+metricas_tenants: Dict[str, TenantMetrics] = {}
+tenants_prontos = set()
+_locks: Dict[str, asyncio.Lock] = {}
+
+
+async def garantir_tenant(tenant: str, inicializar: Callable[[], Awaitable[None]]):
+    """Run ``inicializar`` once for ``tenant``; concurrent first requests wait."""
+    if tenant in tenants_prontos:
+        return
+    lock = _locks.setdefault(tenant, asyncio.Lock())
+    async with lock:
+        if tenant in tenants_prontos:
+            return
+        inicio = time.perf_counter()
+        await inicializar()
+        tenants_prontos.add(tenant)
+        logger.info(f"Tenant '{tenant}' inicializado em {(time.perf_counter() - inicio) * 1000:.0f} ms")
@@ -0,0 +1,205 @@
+import sys
+import time
+import uuid
+import random
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+
+class GymTrackBenchmark:
+    """Load scenarios against a running GymTrack API"""
+
+    def __init__(self, base_url="http://localhost:8001", workers=32):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api"
+        self.workers = workers
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+
+    def login(self):
+        response = self.session.post(
+            f"{self.api_url}/auth/login",
+            json={"email": "admin@gymtrack.com", "senha": "admin123"},
+            timeout=10
+        )
+        response.raise_for_status()
+        self.session.headers['Authorization'] = f"Bearer {response.json()['token']}"
+
+    def motor(self):
+        response = self.session.get(f"{self.api_url}/metrics/armazenamento", timeout=10)
+        return response.json()['motor'] if response.ok else "desconhecido"
+
+    def request(self, method, endpoint, **kwargs):
+        inicio = time.perf_counter()
+        response = self.session.request(method, f"{self.api_url}/{endpoint}", timeout=60, **kwargs)
+        return response, time.perf_counter() - inicio
+
+    def run_concurrently(self, fn, total):
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            resultados = list(executor.map(fn, range(total)))
+        return resultados, time.perf_counter() - inicio
+
+    def report(self, nome, resultados, duracao):
+        latencias = sorted(latencia for _, latencia in resultados)
+        status = {}
+        for codigo, _ in resultados:
+            status[codigo] = status.get(codigo, 0) + 1
+        p95 = latencias[int(len(latencias) * 0.95) - 1] if latencias else 0
+        print(f"\n📈 {nome}")
+        print(f"    Requisições: {len(resultados)} em {duracao:.2f}s ({len(resultados) / duracao:.1f} req/s)")
+        print(f"    Latência p50: {statistics.median(latencias) * 1000:.1f} ms, p95: {p95 * 1000:.1f} ms")
+        print(f"    Status: {status}")
+
+    # ===================== SCENARIOS =====================
+
+    def cenario_reservas(self, total=500, instrutores=4, slots=10):
+        """Contended bookings over a few instructor slots; checks no double booking"""
+        sufixo = datetime.now().strftime('%H%M%S%f')
+        aluno, _ = self.request("POST", "alunos", json={"nome": "Benchmark Reserva", "idade": 30})
+        aluno_id = aluno.json()['id_aluno']
+        instrutor_ids = []
+        for i in range(instrutores):
+            response, _ = self.request("POST", "instrutores", json={
+                "nome": f"Benchmark Instrutor {i}",
+                "idade": 30,
+                "email": f"bench.{sufixo}.{i}@test.com"
+            })
+            instrutor_ids.append(response.json()['id_instrutor'])
+
+        data = "2031-03-10"
+
+        def reservar(_):
+            hora = 6 + random.randrange(slots)
+            # Half of the attempts straddle two slots to exercise partial overlaps
+            minuto = random.choice(("00", "30"))
+            response, latencia = self.request("POST", "treinos", json={
+                "tipo_treino": "Personalizado",
+                "nome_treino": "Benchmark",
+                "aluno_id_aluno": aluno_id,
+                "data": data,
+                "hora_inicio": f"{hora:02d}:{minuto}",
+                "hora_fim": f"{hora + 1:02d}:{minuto}",
+                "instrutor_id_instrutor": random.choice(instrutor_ids)
+            })
+            return response.status_code, latencia
+
+        resultados, duracao = self.run_concurrently(reservar, total)
+        self.report("Reservas sob contenção", resultados, duracao)
+
+        treinos, _ = self.request("GET", "treinos")
+        duplos = 0
+        por_instrutor = {}
+        for treino in treinos.json():
+            if treino.get('aluno_id_aluno') == aluno_id:
+                por_instrutor.setdefault(treino['instrutor_id_instrutor'], []).append(
+                    (treino['hora_inicio'], treino['hora_fim'])
+                )
+        for horarios in por_instrutor.values():
+            horarios.sort()
+            duplos += sum(1 for a, b in zip(horarios, horarios[1:]) if b[0] < a[1])
+        print(f"    Reservas duplicadas: {duplos}")
+
+        self.request("DELETE", f"alunos/{aluno_id}")
+        for instrutor_id in instrutor_ids:
+            self.request("DELETE", f"instrutores/{instrutor_id}")
+        return duplos == 0
+
+    def cenario_leituras(self, total=500):
+        """Mixed read traffic: dashboard, listings and search"""
+        endpoints = [
+            ("dashboard/stats", None),
+            ("dashboard/instrutores-horarios", None),
+            ("treinos", None),
+            ("alunos", None),
+            ("alunos/busca", {"q": "a"}),
+            ("bootstrap/dashboard", None),
+            ("bootstrap/agendas", None),
+        ]
+
+        def ler(i):
+            endpoint, params = endpoints[i % len(endpoints)]
+            response, latencia = self.request("GET", endpoint, params=params)
+            return response.status_code, latencia
+
+        resultados, duracao = self.run_concurrently(ler, total)
+        self.report("Leituras concorrentes", resultados, duracao)
+        return all(codigo == 200 for codigo, _ in resultados)
+
+    def cenario_checkins(self, total=500, por_lote=50):
+        """Check-in ingestion: batches from many turnstiles at once"""
+        aluno, _ = self.request("POST", "alunos", json={"nome": "Benchmark Checkin", "idade": 30})
+        aluno_id = aluno.json()['id_aluno']
+
+        def registrar(_):
+            response, latencia = self.request("POST", "checkins/batch", json={
+                "checkins": [{"aluno_id_aluno": aluno_id, "origem": "benchmark"}] * por_lote
+            })
+            return response.status_code, latencia
+
+        resultados, duracao = self.run_concurrently(registrar, total)
+        self.report(f"Check-ins em lotes de {por_lote}", resultados, duracao)
+        aceitos = sum(por_lote for codigo, _ in resultados if codigo == 202)
+        print(f"    Check-ins aceitos: {aceitos} ({aceitos / duracao:.0f}/s)")
+
+        self.request("DELETE", f"alunos/{aluno_id}")
+        # 503 is the expected backpressure signal, not a failure
+        return all(codigo in (202, 503) for codigo, _ in resultados)
+
+    def cenario_retentativas(self, total=500, tentativas=4):
+        """Flaky clients: every create is sent several times at once with the same Idempotency-Key"""
+        aluno, _ = self.request("POST", "alunos", json={"nome": "Benchmark Retentativa", "idade": 30})
+        aluno_id = aluno.json()['id_aluno']
+        chaves = [uuid.uuid4().hex for _ in range(max(1, total // tentativas))]
+
+        def criar(i):
+            chave = chaves[i % len(chaves)]
+            response, latencia = self.request("POST", "treinos", headers={"Idempotency-Key": chave}, json={
+                "tipo_treino": "Livre",
+                "nome_treino": f"Benchmark {i % len(chaves)}",
+                "aluno_id_aluno": aluno_id,
+            })
+            return response.status_code, latencia
+
+        resultados, duracao = self.run_concurrently(criar, total)
+        self.report(f"Criações repetidas {tentativas}x com Idempotency-Key", resultados, duracao)
+        treinos, _ = self.request("GET", "treinos")
+        criados = sum(1 for treino in treinos.json() if treino.get('aluno_id_aluno') == aluno_id)
+        print(f"    Treinos criados: {criados} para {len(chaves)} chaves")
+
+        self.request("DELETE", f"alunos/{aluno_id}")
+        return criados == len(chaves) and all(codigo == 200 for codigo, _ in resultados)
+
+
+CENARIOS = {
+    "reservas": GymTrackBenchmark.cenario_reservas,
+    "leituras": GymTrackBenchmark.cenario_leituras,
+    "checkins": GymTrackBenchmark.cenario_checkins,
+    "retentativas": GymTrackBenchmark.cenario_retentativas,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GymTrack API benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--total", type=int, default=500)
+    parser.add_argument("--cenario", choices=sorted(CENARIOS), action="append")
+    args = parser.parse_args()
+
+    benchmark = GymTrackBenchmark(args.base_url, args.workers)
+    benchmark.login()
+    print(f"🚀 Benchmark em {args.base_url} ({benchmark.motor()}) com {args.workers} workers")
+
+    ok = True
+    for nome in args.cenario or sorted(CENARIOS):
+        ok = CENARIOS[nome](benchmark, total=args.total) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import requests
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class GymTrackAPITester:
@@ -357,6 +358,57 @@ class GymTrackAPITester:
                 200
             )
 
+    def test_reserva_concorrente(self, tentativas=20):
+        """Concurrent bookings of the same instructor slot: exactly one may win"""
+        print("\n🔒 Testing Concurrent Slot Reservation...")
+        
+        sufixo = datetime.now().strftime('%H%M%S%f')
+        aluno = self.run_test(
+            "Create Aluno for Reservation",
+            "POST",
+            "alunos",
+            200,
+            data={"nome": "Reserva Test", "idade": 30, "email": f"reserva.{sufixo}@test.com"}
+        )
+        instrutor = self.run_test(
+            "Create Instrutor for Reservation",
+            "POST",
+            "instrutores",
+            200,
+            data={"nome": "Reserva Instrutor", "idade": 30, "email": f"reserva.instrutor.{sufixo}@test.com"}
+        )
+        if not aluno or not instrutor:
+            return
+        
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+        
+        def reservar(i):
+            # Overlapping but distinct intervals around 10:00-11:00
+            inicio, fim = ("10:00", "11:00") if i % 2 == 0 else ("10:30", "11:30")
+            response = requests.post(f"{self.api_url}/treinos", headers=headers, timeout=30, json={
+                "tipo_treino": "Personalizado",
+                "nome_treino": f"Reserva {i}",
+                "aluno_id_aluno": aluno['id_aluno'],
+                "data": "2030-01-15",
+                "hora_inicio": inicio,
+                "hora_fim": fim,
+                "instrutor_id_instrutor": instrutor['id_instrutor']
+            })
+            return response.status_code
+        
+        with ThreadPoolExecutor(max_workers=tentativas) as executor:
+            status = list(executor.map(reservar, range(tentativas)))
+        
+        sucesso = status.count(200)
+        self.log_test(
+            "Concurrent Reservation (exactly one booking)",
+            sucesso == 1 and status.count(400) == tentativas - 1,
+            f"200: {sucesso}, 400: {status.count(400)}, outros: {tentativas - sucesso - status.count(400)}"
+        )
+        
+        self.run_test("Delete Reservation Aluno", "DELETE", f"alunos/{aluno['id_aluno']}", 200)
+        self.run_test("Delete Reservation Instrutor", "DELETE", f"instrutores/{instrutor['id_instrutor']}", 200)
+
     def cleanup_test_data(self, instrutor_id, agenda_id):
         """Clean up test data"""
         print("\n🧹 Cleaning up test data...")
@@ -395,6 +447,7 @@ class GymTrackAPITester:
         instrutor_id = self.test_instrutores_crud()
         agenda_id = self.test_agendas_crud(instrutor_id)
         self.test_treinos_crud(aluno_id, agenda_id)
+        self.test_reserva_concorrente()
         
         # Cleanup
         self.cleanup_test_data(instrutor_id, agenda_id)
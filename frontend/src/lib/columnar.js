@@ -0,0 +1,22 @@
+// Decodes the `format=columnar` payload returned by the list endpoints
+// back into the usual array of row objects.
+export function fromColumnar(payload) {
+  if (!payload || payload.format !== 'columnar') {
+    return payload;
+  }
+  const { count, fields, columns, dictionaries } = payload;
+  const decoded = fields.map((field) => {
+    const column = columns[field];
+    const dictionary = dictionaries[field];
+    return dictionary ? column.map((i) => (i === null ? null : dictionary[i])) : column;
+  });
+  const rows = new Array(count);
+  for (let r = 0; r < count; r++) {
+    const row = {};
+    for (let f = 0; f < fields.length; f++) {
+      row[fields[f]] = decoded[f][r];
+    }
+    rows[r] = row;
+  }
+  return rows;
+}
@@ -0,0 +1,22 @@
+import axios from 'axios';
+
+// The API returns an X-Consistencia token after every write; sending the
+// latest one on reads makes replica reads wait until they include our writes.
+let latestToken = null;
+
+export function installConsistency() {
+  axios.interceptors.response.use((response) => {
+    const token = response.headers?.['x-consistencia'];
+    if (token) {
+      latestToken = token;
+    }
+    return response;
+  });
+
+  axios.interceptors.request.use((config) => {
+    if (latestToken && (config.method || 'get').toLowerCase() === 'get') {
+      config.headers = { ...config.headers, 'X-Consistencia': latestToken };
+    }
+    return config;
+  });
+}
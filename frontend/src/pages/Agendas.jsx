@@ -36,14 +36,12 @@ export default function Agendas() {
   const fetchData = async () => {
     try {
       const token = localStorage.getItem('token');
-      const [agendasRes, treinosRes, instrutoresRes] = await Promise.all([
-        axios.get(`${API}/agendas-fixas`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/treinos`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/instrutores`, { headers: { Authorization: `Bearer ${token}` } })
-      ]);
-      setAgendasFixas(agendasRes.data);
-      setTreinosPersonalizados(treinosRes.data.filter(t => t.tipo_treino === 'Personalizado' && t.data));
-      setInstrutores(instrutoresRes.data);
+      const response = await axios.get(`${API}/bootstrap/agendas`, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setAgendasFixas(response.data.agendas_fixas);
+      setTreinosPersonalizados(response.data.treinos_personalizados);
+      setInstrutores(response.data.instrutores);
     } catch (error) {
       toast.error('Erro ao carregar dados');
     } finally {
@@ -6,6 +6,7 @@ import { Label } from '@/components/ui/label';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '@/components/ui/dialog';
 import { toast } from 'sonner';
 import { Plus, Pencil, Trash2, Search } from 'lucide-react';
+import { fromColumnar } from '@/lib/columnar';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -16,6 +17,9 @@ export default function Alunos() {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingAluno, setEditingAluno] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchResults, setSearchResults] = useState([]);
+  // Bumped after edits and deletes so an active search is run again
+  const [searchVersion, setSearchVersion] = useState(0);
   const [formData, setFormData] = useState({
     nome: '',
     endereco: '',
@@ -27,13 +31,41 @@ export default function Alunos() {
     fetchAlunos();
   }, []);
 
+  useEffect(() => {
+    const q = searchTerm.trim();
+    if (!q) {
+      setSearchResults([]);
+      return;
+    }
+    // A newer term (or a refresh) aborts this request, so a late response never overwrites it
+    const controller = new AbortController();
+    const timeout = setTimeout(async () => {
+      try {
+        const token = localStorage.getItem('token');
+        const response = await axios.get(`${API}/alunos/busca`, {
+          params: { q },
+          headers: { Authorization: `Bearer ${token}` },
+          signal: controller.signal
+        });
+        setSearchResults(response.data);
+      } catch (error) {
+        if (!axios.isCancel(error)) toast.error('Erro ao buscar alunos');
+      }
+    }, 250);
+    return () => {
+      clearTimeout(timeout);
+      controller.abort();
+    };
+  }, [searchTerm, searchVersion]);
+
   const fetchAlunos = async () => {
     try {
       const token = localStorage.getItem('token');
       const response = await axios.get(`${API}/alunos`, {
+        params: { format: 'columnar' },
         headers: { Authorization: `Bearer ${token}` }
       });
-      setAlunos(response.data);
+      setAlunos(fromColumnar(response.data));
     } catch (error) {
       toast.error('Erro ao carregar alunos');
     } finally {
@@ -60,6 +92,7 @@ export default function Alunos() {
       setDialogOpen(false);
       resetForm();
       fetchAlunos();
+      setSearchVersion((v) => v + 1);
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Erro ao salvar aluno');
     }
@@ -75,6 +108,7 @@ export default function Alunos() {
       });
       toast.success('Aluno deletado com sucesso!');
       fetchAlunos();
+      setSearchVersion((v) => v + 1);
     } catch (error) {
       toast.error('Erro ao deletar aluno');
     }
@@ -96,10 +130,7 @@ export default function Alunos() {
     setEditingAluno(null);
   };
 
-  const filteredAlunos = alunos.filter(aluno =>
-    aluno.nome.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    aluno.email?.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  const filteredAlunos = searchTerm.trim() ? searchResults : alunos;
 
   return (
     <div className="fade-in" data-testid="alunos-page">
@@ -20,16 +20,11 @@ export default function Dashboard() {
   const fetchDashboardData = async () => {
     try {
       const token = localStorage.getItem('token');
-      const [statsRes, instrutoresRes] = await Promise.all([
-        axios.get(`${API}/dashboard/stats`, {
-          headers: { Authorization: `Bearer ${token}` }
-        }),
-        axios.get(`${API}/dashboard/instrutores-horarios`, {
-          headers: { Authorization: `Bearer ${token}` }
-        })
-      ]);
-      setStats(statsRes.data);
-      setInstrutoresHorarios(instrutoresRes.data);
+      const response = await axios.get(`${API}/bootstrap/dashboard`, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setStats(response.data.stats);
+      setInstrutoresHorarios(response.data.instrutores_horarios);
     } catch (error) {
       toast.error('Erro ao carregar dados do dashboard');
     } finally {
@@ -16,6 +16,9 @@ export default function Instrutores() {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingInstrutor, setEditingInstrutor] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchResults, setSearchResults] = useState([]);
+  // Bumped after edits and deletes so an active search is run again
+  const [searchVersion, setSearchVersion] = useState(0);
   const [formData, setFormData] = useState({
     nome: '',
     idade: '',
@@ -27,6 +30,33 @@ export default function Instrutores() {
     fetchInstrutores();
   }, []);
 
+  useEffect(() => {
+    const q = searchTerm.trim();
+    if (!q) {
+      setSearchResults([]);
+      return;
+    }
+    // A newer term (or a refresh) aborts this request, so a late response never overwrites it
+    const controller = new AbortController();
+    const timeout = setTimeout(async () => {
+      try {
+        const token = localStorage.getItem('token');
+        const response = await axios.get(`${API}/instrutores/busca`, {
+          params: { q },
+          headers: { Authorization: `Bearer ${token}` },
+          signal: controller.signal
+        });
+        setSearchResults(response.data);
+      } catch (error) {
+        if (!axios.isCancel(error)) toast.error('Erro ao buscar instrutores');
+      }
+    }, 250);
+    return () => {
+      clearTimeout(timeout);
+      controller.abort();
+    };
+  }, [searchTerm, searchVersion]);
+
   const fetchInstrutores = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -60,6 +90,7 @@ export default function Instrutores() {
       setDialogOpen(false);
       resetForm();
       fetchInstrutores();
+      setSearchVersion((v) => v + 1);
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Erro ao salvar instrutor');
     }
@@ -75,6 +106,7 @@ export default function Instrutores() {
       });
       toast.success('Instrutor deletado com sucesso!');
       fetchInstrutores();
+      setSearchVersion((v) => v + 1);
     } catch (error) {
       toast.error('Erro ao deletar instrutor');
     }
@@ -96,10 +128,7 @@ export default function Instrutores() {
     setEditingInstrutor(null);
   };
 
-  const filteredInstrutores = instrutores.filter(instrutor =>
-    instrutor.nome.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    instrutor.email?.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  const filteredInstrutores = searchTerm.trim() ? searchResults : instrutores;
 
   return (
     <div className="fade-in" data-testid="instrutores-page">
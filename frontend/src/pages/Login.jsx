@@ -8,6 +8,7 @@ import { Dumbbell, Lock, Mail } from 'lucide-react';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const TENANT = process.env.REACT_APP_TENANT;
 
 export default function Login({ onLogin }) {
   const [email, setEmail] = useState('');
@@ -22,7 +23,7 @@ export default function Login({ onLogin }) {
       const response = await axios.post(`${API}/auth/login`, {
         email,
         senha
-      });
+      }, TENANT ? { headers: { 'X-Tenant': TENANT } } : undefined);
 
       toast.success('Login realizado com sucesso!');
       onLogin(response.data.token, response.data.admin);
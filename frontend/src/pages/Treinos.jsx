@@ -8,6 +8,7 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { toast } from 'sonner';
 import { Plus, Pencil, Trash2, Search } from 'lucide-react';
+import { fromColumnar } from '@/lib/columnar';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -47,11 +48,11 @@ export default function Treinos() {
     try {
       const token = localStorage.getItem('token');
       const [treinosRes, alunosRes] = await Promise.all([
-        axios.get(`${API}/treinos`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/alunos`, { headers: { Authorization: `Bearer ${token}` } })
+        axios.get(`${API}/treinos`, { params: { format: 'columnar' }, headers: { Authorization: `Bearer ${token}` } }),
+        axios.get(`${API}/alunos`, { params: { format: 'columnar' }, headers: { Authorization: `Bearer ${token}` } })
       ]);
-      setTreinos(treinosRes.data);
-      setAlunos(alunosRes.data);
+      setTreinos(fromColumnar(treinosRes.data));
+      setAlunos(fromColumnar(alunosRes.data));
     } catch (error) {
       toast.error('Erro ao carregar dados');
     } finally {
@@ -0,0 +1,86 @@
+"""Shared fixtures: the API on the embedded SQLite engine, one database per
+module, and a throwaway ``mongod`` (skipped when it is not installed)."""
+import sys
+import importlib
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from .test_leitura_replicas import MONGOD, esperar, porta_livre
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("STORAGE_ENGINE", "sqlite")
+        mp.setenv("SQLITE_PASTA", str(tmp_path_factory.mktemp("sqlite")))
+        mp.setenv("DB_NAME", "GymTrack_Teste")
+        sys.path.insert(0, str(ROOT / "backend"))
+        # Tenants initialised by a server from another module are not initialised here
+        tenancy = importlib.import_module("tenancy")
+        mp.setattr(tenancy, "tenants_prontos", set())
+        mp.setattr(tenancy, "_locks", {})
+        # Another test module may already have imported the server with other settings
+        if "server" in sys.modules:
+            server = importlib.reload(sys.modules["server"])
+        else:
+            server = importlib.import_module("server")
+        from fastapi.testclient import TestClient
+
+        with TestClient(server.app) as cliente:
+            resposta = cliente.post("/api/auth/login", json={"email": "admin@gymtrack.com", "senha": "admin123"})
+            cliente.headers["Authorization"] = f"Bearer {resposta.json()['token']}"
+            yield server, cliente
+
+
+def criar_aluno(cliente, nome="Aluno Teste", **dados):
+    resposta = cliente.post("/api/alunos", json={"nome": nome, "idade": 20, **dados})
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def criar_instrutor(cliente, nome="Instrutor Teste"):
+    resposta = cliente.post("/api/instrutores", json={"nome": nome, "idade": 30})
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def criar_agenda(cliente, instrutor):
+    resposta = cliente.post("/api/agendas-fixas", json={
+        "instrutor_id_instrutor": instrutor["id_instrutor"], "dias_semana": "Seg-Sex",
+        "hora_inicio": "06:00", "hora_fim": "12:00",
+    })
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def personalizado(aluno, instrutor, data="2030-01-10", inicio="08:00", fim="09:00"):
+    return {
+        "tipo_treino": "Personalizado", "nome_treino": "Força", "aluno_id_aluno": aluno["id_aluno"],
+        "instrutor_id_instrutor": instrutor["id_instrutor"], "data": data, "hora_inicio": inicio, "hora_fim": fim,
+    }
+
+
+@pytest.fixture(scope="module")
+def mongo(tmp_path_factory):
+    if MONGOD is None:
+        pytest.skip("mongod não encontrado no PATH")
+    from pymongo import MongoClient
+
+    porta, pasta = porta_livre(), tmp_path_factory.mktemp("mongod")
+    processo = subprocess.Popen(
+        [MONGOD, "--port", str(porta), "--bind_ip", "127.0.0.1",
+         "--dbpath", str(pasta), "--logpath", str(pasta / "mongod.log")],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f"mongodb://127.0.0.1:{porta}/?directConnection=true"
+        with MongoClient(url) as direto:
+            esperar(lambda: direto.admin.command("ping"))
+        yield url
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
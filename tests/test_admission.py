@@ -0,0 +1,129 @@
+"""Admission control and load shedding of the expensive endpoints; runs without a mongod.
+
+    pytest tests/test_admission.py
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import admission  # noqa: E402
+
+
+class RequestFalsa:
+    def __init__(self, headers=None, desconectada=False):
+        self.headers = headers or {}
+        self.desconectada = desconectada
+
+    async def is_disconnected(self):
+        return self.desconectada
+
+
+def test_fila_admite_em_ordem_quando_libera():
+    async def cenario():
+        limiter = admission.AdmissionLimiter("teste", 1, 2, 1.0)
+        await limiter.acquire()
+        primeiro = asyncio.ensure_future(limiter.acquire())
+        segundo = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        esperando = limiter.waiting
+        limiter.release()
+        await primeiro
+        assert not segundo.done()
+        limiter.release()
+        await segundo
+        return esperando, limiter.stats()
+
+    esperando, stats = asyncio.run(cenario())
+    assert esperando == 2
+    assert (stats["active"], stats["waiting"], stats["admitted"]) == (1, 0, 3)
+
+
+def test_fila_cheia_responde_503_com_retry_after():
+    async def cenario():
+        limiter = admission.AdmissionLimiter("teste", 1, 1, 2.0)
+        await limiter.acquire()
+        na_fila = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(HTTPException) as erro:
+                await limiter.acquire()
+        finally:
+            na_fila.cancel()
+        return erro.value, limiter.stats()
+
+    erro, stats = asyncio.run(cenario())
+    assert erro.status_code == 503 and erro.headers["Retry-After"] == "2"
+    assert stats["rejected_queue_full"] == 1
+
+
+def test_espera_na_fila_expira():
+    async def cenario():
+        limiter = admission.AdmissionLimiter("teste", 1, 4, 0.05)
+        await limiter.acquire()
+        with pytest.raises(HTTPException) as erro:
+            await limiter.acquire()
+        return erro.value, limiter.stats()
+
+    erro, stats = asyncio.run(cenario())
+    assert erro.status_code == 503
+    assert (stats["rejected_timeout"], stats["waiting"], stats["active"]) == (1, 0, 1)
+
+
+def test_prazo_vencido_e_rejeitado_sem_ocupar_vaga():
+    async def cenario():
+        limiter = admission.AdmissionLimiter("teste", 1, 4, 1.0)
+        with pytest.raises(HTTPException) as erro:
+            await limiter.acquire(deadline=time.monotonic() - 1)
+        # The deadline also bounds the wait in the queue
+        await limiter.acquire()
+        inicio = time.monotonic()
+        with pytest.raises(HTTPException):
+            await limiter.acquire(deadline=inicio + 0.05)
+        return erro.value, time.monotonic() - inicio, limiter.stats()
+
+    erro, espera, stats = asyncio.run(cenario())
+    assert erro.status_code == 503 and espera < 0.5
+    assert (stats["dropped_expired"], stats["rejected_timeout"], stats["active"]) == (1, 1, 1)
+
+
+def test_cliente_desconectado_na_fila_e_descartado(monkeypatch):
+    limiter = admission.AdmissionLimiter("teste", 1, 4, 1.0)
+    monkeypatch.setitem(admission.limiters, "teste", limiter)
+
+    async def cenario():
+        dependencia = admission.admission("teste")(RequestFalsa(desconectada=True))
+        with pytest.raises(HTTPException) as erro:
+            await dependencia.__anext__()
+        # The slot is given back even though the request never ran
+        atendida = admission.admission("teste")(RequestFalsa({admission.TIMEOUT_HEADER: "1000"}))
+        await atendida.__anext__()
+        await atendida.aclose()
+        return erro.value, limiter.stats()
+
+    erro, stats = asyncio.run(cenario())
+    assert erro.status_code == 503
+    assert (stats["dropped_expired"], stats["active"], stats["admitted"]) == (1, 0, 2)
+
+
+def test_espera_cancelada_nao_perde_a_vaga():
+    async def cenario():
+        limiter = admission.AdmissionLimiter("teste", 1, 4, 1.0)
+        await limiter.acquire()
+        desistente = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        desistente.cancel()
+        await asyncio.sleep(0)
+        limiter.release()
+        await limiter.acquire()
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(cenario())
+    assert (stats["active"], stats["waiting"]) == (0, 0)
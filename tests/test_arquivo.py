@@ -0,0 +1,121 @@
+"""Monthly archive partitions and the archiving lease, against a ``mongod``
+started from the PATH (or ``MONGOD_BIN``); skipped when it is not installed.
+
+    pytest tests/test_arquivo.py
+"""
+import sys
+import uuid
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import arquivo  # noqa: E402
+import jobs  # noqa: E402
+
+HOJE = date(2030, 6, 1)
+
+
+def treino(data, concluido=True, aluno="a1"):
+    return {"tipo_treino": "Simples", "nome_treino": data, "aluno_id_aluno": aluno, "data": data,
+            "concluido": concluido}
+
+
+def com_banco(mongo, cenario):
+    """Run ``cenario(db)`` on a fresh database, dropped afterwards."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def executar():
+        client = AsyncIOMotorClient(mongo)
+        db = client[f"GymTrack_Teste_{uuid.uuid4().hex[:8]}"]
+        try:
+            return await cenario(db)
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    return asyncio.run(executar())
+
+
+def test_arquivar_move_para_particoes_mensais(mongo):
+    async def cenario(db):
+        await db.treinos.insert_many([
+            treino("2030-01-10"), treino("2030-01-20", aluno="a2"), treino("2030-02-05"),
+            treino("2030-01-15", concluido=False), treino("2030-05-20"),
+        ])
+        arquivado = await db.treinos.find_one({"data": "2030-02-05"})
+        await db.reservas.insert_one({"_id": "i:2030-02-05", "intervalos": [
+            {"treino_id": str(arquivado["_id"]), "inicio": 480, "fim": 540},
+        ]})
+        movidos = await arquivo.arquivar(db, 30, lote=2, hoje=HOJE)
+        de_novo = await arquivo.arquivar(db, 30, lote=2, hoje=HOJE)
+        return {
+            "movidos": (movidos, de_novo),
+            "quentes": sorted(t["data"] for t in await db.treinos.find().to_list(10)),
+            "particoes": await arquivo.particoes(db),
+            "fevereiro_em_diante": await arquivo.particoes(db, "2030-02-01", "2030-12-31"),
+            "total": await arquivo.total_arquivado(db),
+            "buscados": sorted(t["data"] for t in await arquivo.buscar(db, {"aluno_id_aluno": "a1"}, None, None, 10)),
+            "reserva": await db.reservas.find_one({"_id": "i:2030-02-05"}),
+        }
+
+    r = com_banco(mongo, cenario)
+    assert r["movidos"] == (3, 0)
+    assert r["quentes"] == ["2030-01-15", "2030-05-20"]
+    assert (r["particoes"], r["fevereiro_em_diante"], r["total"]) == (["2030_01", "2030_02"], ["2030_02"], 3)
+    assert r["buscados"] == ["2030-01-10", "2030-02-05"]
+    assert r["reserva"]["intervalos"] == []
+
+
+def test_copia_de_execucao_interrompida_nao_conta_duas_vezes(mongo):
+    async def cenario(db):
+        doc = treino("2030-03-03")
+        await db.treinos.insert_one(doc)
+        # A previous run copied an older version of the treino and died before deleting it
+        particao = arquivo.colecao_particao(db, "2030_03")
+        await particao.insert_one({**doc, "nome_treino": "versão antiga"})
+        await db[arquivo.CATALOGO].insert_one({"_id": "2030_03", "total": 1, "colecao": particao.name})
+        movidos = await arquivo.arquivar(db, 30, hoje=HOJE)
+        return movidos, await particao.find().to_list(10), await arquivo.total_arquivado(db)
+
+    movidos, copias, total = com_banco(mongo, cenario)
+    assert (movidos, total) == (1, 1)
+    assert [c["nome_treino"] for c in copias] == ["2030-03-03"]
+
+
+def test_lease_de_outro_worker_impede_arquivamento(mongo):
+    async def cenario(db):
+        await db.treinos.insert_one(treino("2030-01-10"))
+        agora = datetime.now(timezone.utc)
+        await db[arquivo.LEASE].insert_one(
+            {"_id": "arquivamento", "worker": "outro", "ate": agora + timedelta(hours=1)}
+        )
+        bloqueado = await arquivo.arquivar(db, 30, hoje=HOJE)
+        # The other worker died: its lease runs out and this one takes over
+        await db[arquivo.LEASE].update_one({"_id": "arquivamento"}, {"$set": {"ate": agora - timedelta(seconds=1)}})
+        assumido = await arquivo.arquivar(db, 30, hoje=HOJE)
+        return bloqueado, assumido, await db[arquivo.LEASE].find_one({"_id": "arquivamento"})
+
+    bloqueado, assumido, lease = com_banco(mongo, cenario)
+    assert (bloqueado, assumido) == (0, 1)
+    # Released when the run ends, so the next worker does not wait out the lease
+    assert lease["worker"] == jobs.WORKER_ID
+    assert lease["ate"].replace(tzinfo=timezone.utc) <= datetime.now(timezone.utc)
+
+
+def test_deletar_mantem_o_catalogo(mongo):
+    async def cenario(db):
+        await db.treinos.insert_many([
+            treino("2030-01-10"), treino("2030-02-10"), treino("2030-02-11", aluno="a2"),
+        ])
+        await arquivo.arquivar(db, 30, hoje=HOJE)
+        alunos = await arquivo.distintos(db, "aluno_id_aluno", {})
+        removidos = await arquivo.deletar(db, {"aluno_id_aluno": "a1"})
+        catalogo = {p["_id"]: p["total"] async for p in db[arquivo.CATALOGO].find()}
+        return alunos, removidos, catalogo
+
+    alunos, removidos, catalogo = com_banco(mongo, cenario)
+    assert alunos == {"a1", "a2"} and removidos == 2
+    assert catalogo == {"2030_01": 0, "2030_02": 1}
@@ -0,0 +1,76 @@
+"""The check-in buffer against an in-memory writer; runs without a mongod.
+
+    pytest tests/test_checkins.py
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import checkins  # noqa: E402
+
+
+class BancoFalso:
+    name = "GymTrack_Teste"
+
+
+class Gravador:
+    """Records written check-ins, after a pause, failing the first ``falhas`` calls."""
+
+    def __init__(self, pausa=0.0, falhas=0):
+        self.pausa = pausa
+        self.falhas = falhas
+        self.gravados = []
+
+    async def __call__(self, db, documentos):
+        await asyncio.sleep(self.pausa)
+        if self.falhas:
+            self.falhas -= 1
+            raise ConnectionError("banco indisponível")
+        self.gravados.extend(documentos)
+        return len(documentos), 0
+
+
+def test_fechar_nao_perde_lote_em_gravacao():
+    async def cenario():
+        gravador = Gravador(pausa=0.2)
+        buffer = checkins.CheckinBuffer(lote=10, intervalo=0.01, gravar=gravador)
+        await buffer.adicionar(BancoFalso(), [{"n": i} for i in range(5)])
+        periodico = asyncio.create_task(buffer.executar_periodicamente())
+        await asyncio.sleep(0.05)
+        # Shutdown while the periodic flush is writing the batch
+        periodico.cancel()
+        await buffer.fechar()
+        return gravador, buffer
+
+    gravador, buffer = asyncio.run(cenario())
+    assert len(gravador.gravados) == 5
+    assert buffer.stats()["pendentes"] == 0
+
+
+def test_lote_com_falha_volta_ao_buffer():
+    async def cenario():
+        gravador = Gravador(falhas=2)
+        buffer = checkins.CheckinBuffer(lote=10, gravar=gravador, tentativas=3)
+        await buffer.adicionar(BancoFalso(), [{"n": i} for i in range(5)])
+        for _ in range(3):
+            await buffer.flush()
+        return gravador, buffer
+
+    gravador, buffer = asyncio.run(cenario())
+    assert [doc["n"] for doc in gravador.gravados] == list(range(5))
+    assert buffer.stats()["retentativas"] == 10 and buffer.stats()["falhas"] == 0
+
+
+def test_lote_desiste_apos_as_tentativas():
+    async def cenario():
+        buffer = checkins.CheckinBuffer(lote=10, gravar=Gravador(falhas=5), tentativas=2)
+        await buffer.adicionar(BancoFalso(), [{"n": i} for i in range(5)])
+        for _ in range(3):
+            await buffer.flush()
+        return buffer
+
+    stats = asyncio.run(cenario()).stats()
+    assert stats["falhas"] == 5 and stats["pendentes"] == 0
@@ -0,0 +1,78 @@
+"""Coalescing of identical concurrent reads; runs without a mongod.
+
+    pytest tests/test_coalesce.py
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+from coalesce import SingleFlight  # noqa: E402
+
+from .conftest import criar_aluno  # noqa: E402
+
+
+class Contador:
+    """A read that takes ``pausa`` seconds and returns how many times it ran."""
+
+    def __init__(self, pausa=0.05):
+        self.pausa = pausa
+        self.execucoes = 0
+
+    async def __call__(self):
+        self.execucoes += 1
+        propria = self.execucoes
+        await asyncio.sleep(self.pausa)
+        return propria
+
+
+def test_leituras_concorrentes_compartilham_uma_execucao():
+    async def cenario():
+        voo, ler = SingleFlight(), Contador()
+        resultados = await asyncio.gather(*(voo.run("k", ler) for _ in range(5)), voo.run("outra", ler))
+        return voo, resultados
+
+    voo, resultados = asyncio.run(cenario())
+    assert resultados == [1, 1, 1, 1, 1, 2]
+    assert (voo.stats()["executions"], voo.stats()["coalesced"]) == (2, 4)
+
+
+def test_invalidacao_separa_leituras_posteriores():
+    async def cenario():
+        voo, ler = SingleFlight(ttl=60), Contador()
+        anterior = asyncio.ensure_future(voo.run("k", ler))
+        await asyncio.sleep(0)
+        # A write lands while the first read is in flight
+        voo.invalidate()
+        posterior = await voo.run("k", ler)
+        return await anterior, posterior, await voo.run("k", ler), voo
+
+    anterior, posterior, repetida, voo = asyncio.run(cenario())
+    assert (anterior, posterior) == (1, 2)
+    # Only the post-write result is kept for the TTL
+    assert repetida == 2 and voo.stats()["ttl_hits"] == 1
+
+
+def test_chamador_cancelado_nao_cancela_a_leitura_compartilhada():
+    async def cenario():
+        voo, ler = SingleFlight(), Contador()
+        desistente = asyncio.ensure_future(voo.run("k", ler))
+        await asyncio.sleep(0)
+        outro = asyncio.ensure_future(voo.run("k", ler))
+        await asyncio.sleep(0)
+        desistente.cancel()
+        return await outro, ler.execucoes
+
+    assert asyncio.run(cenario()) == (1, 1)
+
+
+def test_checkins_nao_invalidam_leituras_coalescidas(api):
+    server, cliente = api
+    aluno = criar_aluno(cliente, "Invalidação")
+    geracao = server.leituras.generation
+    cliente.post("/api/checkins", json={"aluno_id_aluno": aluno["id_aluno"]})
+    assert server.leituras.generation == geracao
+    cliente.put(f"/api/alunos/{aluno['id_aluno']}", json={"nome": "Invalidação 2", "idade": 21})
+    assert server.leituras.generation > geracao
@@ -0,0 +1,20 @@
+"""The columnar list format against the row format, on the SQLite API; runs without a mongod.
+
+    pytest tests/test_columnar.py
+"""
+from .conftest import criar_aluno
+
+
+def test_formato_colunar_igual_ao_de_linhas(api):
+    server, cliente = api
+    aluno = criar_aluno(cliente, "Colunar")
+    cliente.post("/api/checkins", json={"aluno_id_aluno": aluno["id_aluno"], "momento": "2030-07-01T18:00:00Z"})
+    cliente.portal.call(server.buffer_checkins.flush)
+
+    linhas = cliente.get("/api/alunos").json()
+    colunar = cliente.get("/api/alunos", params={"format": "columnar"}).json()
+    reconstruidas = [
+        {campo: colunar["columns"][campo][i] for campo in colunar["fields"]} for i in range(colunar["count"])
+    ]
+    assert reconstruidas == linhas
+    assert any(linha.get("ultimo_checkin") == "2030-07-01T18:00:00Z" for linha in reconstruidas)
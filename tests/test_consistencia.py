@@ -0,0 +1,105 @@
+"""Causal reads with X-Consistencia, against fake sessions and the SQLite API; runs without a mongod.
+
+    pytest tests/test_consistencia.py
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+from bson import Timestamp
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import replicas  # noqa: E402
+
+
+class SessaoFalsa:
+    def __init__(self):
+        self.operation_time = None
+        self.em_uso = False
+        self.encerrada = False
+
+    def advance_operation_time(self, ts):
+        self.operation_time = ts
+
+    def end_session(self):
+        self.encerrada = True
+
+
+class ClienteFalso:
+    def __init__(self):
+        self.delegate = self
+        self.sessoes = []
+
+    def start_session(self, causal_consistency=None):
+        assert causal_consistency
+        self.sessoes.append(SessaoFalsa())
+        return self.sessoes[-1]
+
+
+class ColecaoFalsa:
+    async def find_one(self, filtro, session=None):
+        # pymongo forbids two operations on one session at a time
+        assert not session.delegate.em_uso
+        session.delegate.em_uso = True
+        await asyncio.sleep(0.01)
+        session.delegate.em_uso = False
+        return {"operation_time": session.delegate.operation_time}
+
+
+def test_leituras_concorrentes_usam_sessoes_proprias():
+    cliente, colecao = ClienteFalso(), replicas.ColecaoLeitura(ColecaoFalsa())
+    resultados = []
+
+    async def app(scope, receive, send):
+        resultados.extend(await asyncio.gather(*(colecao.find_one({}) for _ in range(5))))
+
+    middleware = replicas.ConsistenciaMiddleware(app, cliente, habilitado=True)
+    scope = {"type": "http", "method": "GET", "headers": [(b"x-consistencia", b"1700000000.7")]}
+    asyncio.run(middleware(scope, None, None))
+
+    assert len(cliente.sessoes) == 5
+    assert all(r["operation_time"] == Timestamp(1700000000, 7) for r in resultados)
+    assert all(s.encerrada for s in cliente.sessoes)
+    assert replicas.sessao_atual.get() is None
+
+
+def test_leitura_sem_token_nao_abre_sessao():
+    cliente = ClienteFalso()
+
+    async def app(scope, receive, send):
+        assert replicas.sessao_atual.get() is None
+
+    middleware = replicas.ConsistenciaMiddleware(app, cliente, habilitado=True)
+    for valor in (b"", b"invalido"):
+        asyncio.run(middleware({"type": "http", "method": "GET", "headers": [(b"x-consistencia", valor)]}, None, None))
+    assert cliente.sessoes == []
+
+
+def test_leitura_causal_nao_entra_em_voo_compartilhado(api):
+    server, cliente = api
+    from starlette.requests import Request
+
+    async def cenario():
+        execucoes = 0
+
+        async def calcular():
+            nonlocal execucoes
+            execucoes += 1
+            propria = execucoes
+            await asyncio.sleep(0.05)
+            return propria
+
+        request = Request({"type": "http", "method": "GET", "path": "/api/treinos", "query_string": b"", "headers": []})
+        sem_token = [asyncio.ensure_future(server.ler_coalescido(request, calcular)) for _ in range(3)]
+        token = server.replicas.sessao_atual.set(object())
+        try:
+            resultados = await asyncio.gather(*sem_token, server.ler_coalescido(request, calcular))
+        finally:
+            server.replicas.sessao_atual.reset(token)
+        return execucoes, resultados
+
+    execucoes, resultados = cliente.portal.call(cenario)
+    assert execucoes == 2
+    assert len(set(resultados[:3])) == 1 and resultados[3] != resultados[0]
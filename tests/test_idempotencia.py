@@ -0,0 +1,150 @@
+"""Idempotency-Key handling against the SQLite storage and API; runs without a mongod.
+
+    pytest tests/test_idempotencia.py
+"""
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import idempotencia  # noqa: E402
+from repositorio_sqlite import RepositorioSQLite  # noqa: E402
+from tenancy import TenantRouter  # noqa: E402
+
+from .conftest import criar_aluno, criar_instrutor, personalizado  # noqa: E402
+
+
+class AppLento:
+    """ASGI app that counts its executions and answers after a pause."""
+
+    def __init__(self, status=201, pausa=0.2):
+        self.status = status
+        self.pausa = pausa
+        self.execucoes = 0
+
+    async def __call__(self, scope, receive, send):
+        self.execucoes += 1
+        await asyncio.sleep(self.pausa)
+        corpo = f'{{"execucao": {self.execucoes}}}'.encode()
+        await send({"type": "http.response.start", "status": self.status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": corpo})
+
+
+async def chamar(respostas, app, chave="k", corpo=b"{}"):
+    enviados = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        enviados.append(message)
+
+    impressao = idempotencia.impressao("POST", "/api/treinos", b"", corpo)
+    await respostas.processar({"type": "http"}, receive, send, chave, impressao, app)
+    inicio = next(m for m in enviados if m["type"] == "http.response.start")
+    corpo = b"".join(m.get("body", b"") for m in enviados if m["type"] == "http.response.body")
+    return inicio["status"], dict(inicio["headers"]), corpo
+
+
+@pytest.fixture
+def armazenamento(tmp_path):
+    async def preparar():
+        repo = RepositorioSQLite(tmp_path, TenantRouter(None, "Idempotencia"))
+        await repo.inicializar()
+        return repo
+
+    repo = asyncio.run(preparar())
+    yield repo.idempotencia
+    asyncio.run(repo.fechar())
+
+
+def test_requisicoes_concorrentes_executam_uma_vez(armazenamento):
+    async def cenario():
+        respostas, app = idempotencia.RespostasIdempotentes(armazenamento), AppLento()
+        resultados = await asyncio.gather(*(chamar(respostas, app) for _ in range(5)))
+        return app, respostas, resultados
+
+    app, respostas, resultados = asyncio.run(cenario())
+    assert app.execucoes == 1
+    assert {corpo for _, _, corpo in resultados} == {b'{"execucao": 1}'}
+    assert sum(1 for _, headers, _ in resultados if headers.get(b"idempotent-replayed") == b"true") == 4
+    assert respostas.stats()["esperas"] >= 4
+
+
+def test_outro_worker_espera_e_repete(armazenamento):
+    async def cenario():
+        # Two processes sharing the storage, each with its own cache
+        primeiro = idempotencia.RespostasIdempotentes(armazenamento)
+        segundo = idempotencia.RespostasIdempotentes(armazenamento)
+        app = AppLento()
+        resultados = await asyncio.gather(chamar(primeiro, app), chamar(segundo, app))
+        return app, resultados
+
+    app, resultados = asyncio.run(cenario())
+    assert app.execucoes == 1
+    assert resultados[0][2] == resultados[1][2]
+
+
+def test_erro_do_servidor_nao_e_armazenado(armazenamento):
+    async def cenario():
+        respostas = idempotencia.RespostasIdempotentes(armazenamento)
+        falha, sucesso = AppLento(status=500, pausa=0), AppLento(pausa=0)
+        primeira = await chamar(respostas, falha)
+        segunda = await chamar(respostas, sucesso)
+        divergente = await chamar(respostas, sucesso, corpo=b'{"outro": 1}')
+        return primeira, segunda, divergente, sucesso
+
+    primeira, segunda, divergente, sucesso = asyncio.run(cenario())
+    assert (primeira[0], segunda[0], divergente[0]) == (500, 201, 422)
+    assert sucesso.execucoes == 1
+
+
+def test_reserva_abandonada_e_retomada(armazenamento):
+    async def cenario():
+        # A worker that died mid-request leaves its reservation behind
+        await armazenamento.reservar("k", idempotencia.impressao("POST", "/api/treinos", b"", b"{}"),
+                                     timedelta(seconds=0.3), timedelta(hours=1))
+        app = AppLento(pausa=0)
+        resultado = await chamar(idempotencia.RespostasIdempotentes(armazenamento), app)
+        return app, resultado
+
+    app, resultado = asyncio.run(cenario())
+    assert app.execucoes == 1 and resultado[0] == 201
+
+
+def test_idempotency_key_repete_a_resposta(api):
+    _, cliente = api
+    cabecalho = {"Idempotency-Key": "criar-aluno-1"}
+    primeira = cliente.post("/api/alunos", json={"nome": "Repetido", "idade": 20}, headers=cabecalho)
+    repetida = cliente.post("/api/alunos", json={"nome": "Repetido", "idade": 20}, headers=cabecalho)
+    assert repetida.status_code == 200 and repetida.json() == primeira.json()
+    assert repetida.headers["Idempotent-Replayed"] == "true" and "Idempotent-Replayed" not in primeira.headers
+    assert [a["nome"] for a in cliente.get("/api/alunos").json()].count("Repetido") == 1
+
+    outra = cliente.post("/api/alunos", json={"nome": "Outro", "idade": 20}, headers=cabecalho)
+    assert outra.status_code == 422
+    sem_token = cliente.post("/api/alunos", json={"nome": "Repetido", "idade": 20},
+                             headers={**cabecalho, "Authorization": "Bearer invalido"})
+    assert sem_token.status_code == 401
+
+
+def test_idempotency_key_concorrente_executa_uma_vez(api):
+    _, cliente = api
+    aluno, instrutor = criar_aluno(cliente), criar_instrutor(cliente)
+    treino = personalizado(aluno, instrutor, data="2030-08-01")
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        respostas = list(pool.map(
+            lambda _: cliente.post("/api/treinos", json=treino, headers={"Idempotency-Key": "treino-concorrente"}),
+            range(5)
+        ))
+    # Without the key every retry but the first would be a slot conflict
+    assert [r.status_code for r in respostas] == [200] * 5
+    assert len({r.json()["id_treino"] for r in respostas}) == 1
+    assert cliente.get("/api/metrics/idempotencia").json()["execucoes"] >= 1
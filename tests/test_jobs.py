@@ -0,0 +1,166 @@
+"""The job runner against an in-memory ``jobs`` collection; runs without a mongod.
+
+    pytest tests/test_jobs.py
+"""
+import sys
+import asyncio
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import jobs  # noqa: E402
+
+OPERADORES = {
+    "$lt": lambda valor, limite: valor is not None and valor < limite,
+    "$gte": lambda valor, limite: valor is not None and valor >= limite,
+}
+
+
+def casa(doc: dict, filtro: dict) -> bool:
+    for campo, esperado in filtro.items():
+        if campo == "$or":
+            if not any(casa(doc, alternativa) for alternativa in esperado):
+                return False
+        elif isinstance(esperado, dict):
+            if not all(OPERADORES[op](doc.get(campo), limite) for op, limite in esperado.items()):
+                return False
+        elif doc.get(campo) != esperado:
+            return False
+    return True
+
+
+class ColecaoFalsa:
+    """The handful of Motor calls jobs.py makes, over a list of dicts."""
+
+    def __init__(self):
+        self.docs = []
+
+    @staticmethod
+    def _aplicar(doc: dict, update: dict):
+        doc.update(update.get("$set", {}))
+        for campo in update.get("$unset", {}):
+            doc.pop(campo, None)
+        for campo, valor in update.get("$inc", {}).items():
+            doc[campo] = doc.get(campo, 0) + valor
+
+    async def insert_one(self, doc):
+        doc["_id"] = ObjectId()
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def find_one(self, filtro):
+        return next((dict(doc) for doc in self.docs if casa(doc, filtro)), None)
+
+    async def find_one_and_update(self, filtro, update, sort, return_document):
+        candidatos = sorted((doc for doc in self.docs if casa(doc, filtro)), key=lambda doc: doc[sort[0][0]])
+        if not candidatos:
+            return None
+        self._aplicar(candidatos[0], update)
+        return dict(candidatos[0])
+
+    async def update_one(self, filtro, update):
+        doc = next((doc for doc in self.docs if casa(doc, filtro)), None)
+        if doc is not None:
+            self._aplicar(doc, update)
+        return SimpleNamespace(matched_count=int(doc is not None))
+
+    async def update_many(self, filtro, update):
+        encontrados = [doc for doc in self.docs if casa(doc, filtro)]
+        for doc in encontrados:
+            self._aplicar(doc, update)
+        return SimpleNamespace(matched_count=len(encontrados))
+
+
+class BancoFalso(dict):
+    def __missing__(self, nome):
+        colecao = self[nome] = ColecaoFalsa()
+        return colecao
+
+
+def expirar_leases(db):
+    for doc in db[jobs.COLECAO].docs:
+        if "lease_ate" in doc:
+            doc["lease_ate"] = jobs.agora() - timedelta(seconds=1)
+
+
+def runner_com_lotes(processados: list, **opcoes) -> jobs.JobRunner:
+    runner = jobs.JobRunner(lote=2, pausa=0, **opcoes)
+
+    @runner.handler("contar")
+    async def contar(ctx):
+        proximo = ctx.estado.get("proximo", 0)
+        while proximo < ctx.params["total"]:
+            lote = list(range(proximo, min(proximo + ctx.lote, ctx.params["total"])))
+            processados.extend(lote)
+            proximo += len(lote)
+            await ctx.checkpoint(len(lote), proximo=proximo)
+        return {"total": ctx.processados}
+
+    return runner
+
+
+def test_lease_valido_nao_e_reivindicado_de_novo():
+    async def cenario():
+        db, runner = BancoFalso(), runner_com_lotes([])
+        await runner.enfileirar(db, "contar", {"total": 4})
+        return await runner.reivindicar(db), await runner.reivindicar(db)
+
+    primeiro, segundo = asyncio.run(cenario())
+    assert primeiro["status"] == "executando" and segundo is None
+
+
+def test_job_abandonado_continua_do_checkpoint():
+    async def cenario():
+        db, processados = BancoFalso(), []
+        runner = runner_com_lotes(processados)
+        id_job = await runner.enfileirar(db, "contar", {"total": 6})
+        # A worker claims it, checkpoints the first batch and dies
+        job = await runner.reivindicar(db)
+        await jobs.JobContext(runner, db, job).checkpoint(2, proximo=2)
+        expirar_leases(db)
+        await runner.executar_pendentes(lambda: [db])
+        return processados, await runner.obter(db, id_job)
+
+    processados, job = asyncio.run(cenario())
+    assert processados == [2, 3, 4, 5]
+    assert (job["status"], job["processados"], job["tentativas"]) == ("concluido", 6, 1)
+    assert job["resultado"] == {"total": 6}
+
+
+def test_job_que_derruba_o_worker_esgota_as_tentativas():
+    async def cenario():
+        db, runner = BancoFalso(), runner_com_lotes([], max_tentativas=2)
+        id_job = await runner.enfileirar(db, "contar", {"total": 4})
+        reivindicados = 0
+        for _ in range(5):
+            if await runner.reivindicar(db) is None:
+                break
+            reivindicados += 1
+            expirar_leases(db)
+        return reivindicados, await runner.obter(db, id_job)
+
+    reivindicados, job = asyncio.run(cenario())
+    assert reivindicados == 2
+    assert (job["status"], job["tentativas"]) == ("falhou", 2)
+
+
+def test_falha_do_handler_repete_ate_o_limite():
+    async def cenario():
+        db, runner = BancoFalso(), jobs.JobRunner(pausa=0, max_tentativas=2)
+
+        @runner.handler("quebrar")
+        async def quebrar(ctx):
+            raise RuntimeError("falhou de novo")
+
+        id_job = await runner.enfileirar(db, "quebrar", {})
+        executados = await runner.executar_pendentes(lambda: [db])
+        return executados, runner, await runner.obter(db, id_job)
+
+    executados, runner, job = asyncio.run(cenario())
+    assert executados == 2 and runner.stats()["falhas"] == 2
+    assert (job["status"], job["tentativas"], job["erro"]) == ("falhou", 2, "falhou de novo")
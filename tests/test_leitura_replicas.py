@@ -0,0 +1,168 @@
+"""Read routing against a local three-member replica set.
+
+The replica set is started from ``mongod`` on the PATH (or ``MONGOD_BIN``)
+in a temporary directory; the tests are skipped when it is not installed.
+
+    pytest tests/test_leitura_replicas.py -s
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import socket
+import asyncio
+import importlib
+import subprocess
+from pathlib import Path
+
+import pytest
+from pymongo import MongoClient
+
+ROOT = Path(__file__).resolve().parent.parent
+MONGOD = os.environ.get("MONGOD_BIN") or shutil.which("mongod")
+
+pytestmark = pytest.mark.skipif(MONGOD is None, reason="mongod não encontrado no PATH")
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def esperar(condicao, timeout=60, intervalo=0.5):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            if condicao():
+                return
+        except Exception:
+            pass
+        time.sleep(intervalo)
+    raise TimeoutError("Replica set não ficou pronto a tempo")
+
+
+@pytest.fixture(scope="module")
+def replica_set(tmp_path_factory):
+    portas = [porta_livre() for _ in range(3)]
+    processos = []
+    for porta in portas:
+        pasta = tmp_path_factory.mktemp(f"rs-{porta}")
+        processos.append(subprocess.Popen(
+            [MONGOD, "--replSet", "rs0", "--port", str(porta), "--bind_ip", "127.0.0.1",
+             "--dbpath", str(pasta), "--logpath", str(pasta / "mongod.log")],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+
+    try:
+        diretos = [MongoClient(f"mongodb://127.0.0.1:{p}/?directConnection=true") for p in portas]
+        esperar(lambda: all(c.admin.command("ping") for c in diretos))
+        diretos[0].admin.command("replSetInitiate", {
+            "_id": "rs0",
+            "members": [
+                # The first member is preferred as primary so the others stay secondaries
+                {"_id": i, "host": f"127.0.0.1:{p}", "priority": 2 if i == 0 else 1}
+                for i, p in enumerate(portas)
+            ],
+        })
+        esperar(lambda: diretos[0].admin.command("hello")["isWritablePrimary"])
+        esperar(lambda: all(c.admin.command("hello").get("secondary") for c in diretos[1:]))
+
+        yield {
+            "url": "mongodb://" + ",".join(f"127.0.0.1:{p}" for p in portas) + "/?replicaSet=rs0",
+            "secundarios": diretos[1:],
+        }
+    finally:
+        for processo in processos:
+            processo.terminate()
+        for processo in processos:
+            processo.wait(timeout=30)
+
+
+@pytest.fixture(scope="module")
+def api(replica_set):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("STORAGE_ENGINE", "mongo")
+        mp.setenv("MONGO_URL", replica_set["url"])
+        mp.setenv("DB_NAME", f"GymTrack_Teste_{uuid.uuid4().hex[:8]}")
+        mp.setenv("LEITURA_SECUNDARIA", "true")
+        mp.setenv("ARQUIVO_HORIZONTE_DIAS", "0")
+        sys.path.insert(0, str(ROOT / "backend"))
+        # Tenants initialised by a server from another module are not initialised here
+        tenancy = importlib.import_module("tenancy")
+        mp.setattr(tenancy, "tenants_prontos", set())
+        mp.setattr(tenancy, "_locks", {})
+        # Another test module may already have imported the server on SQLite
+        if "server" in sys.modules:
+            server = importlib.reload(sys.modules["server"])
+        else:
+            server = importlib.import_module("server")
+        from fastapi.testclient import TestClient
+
+        with TestClient(server.app) as cliente:
+            resposta = cliente.post("/api/auth/login", json={"email": "admin@gymtrack.com", "senha": "admin123"})
+            cliente.headers["Authorization"] = f"Bearer {resposta.json()['token']}"
+            yield server, cliente
+
+
+def leituras_nos_secundarios(secundarios) -> int:
+    return sum(c.admin.command("serverStatus")["opcounters"]["query"] for c in secundarios)
+
+
+def test_mutacao_devolve_token_de_consistencia(api):
+    _, cliente = api
+    resposta = cliente.post("/api/alunos", json={"nome": "Token Teste", "idade": 30})
+    assert resposta.status_code == 200
+    assert "x-consistencia" in resposta.headers
+
+
+def test_le_as_proprias_escritas_nos_secundarios(api):
+    _, cliente = api
+    for i in range(20):
+        criado = cliente.post("/api/alunos", json={"nome": f"Causal {i}", "idade": 20})
+        token = criado.headers["x-consistencia"]
+        alunos = cliente.get("/api/alunos", headers={"X-Consistencia": token}).json()
+        assert criado.json()["id_aluno"] in {a["id_aluno"] for a in alunos}
+
+
+def test_resposta_de_create_treino_vem_do_primario(api):
+    _, cliente = api
+    aluno = cliente.post("/api/alunos", json={"nome": "Treino Causal", "idade": 25}).json()
+    criado = cliente.post("/api/treinos", json={
+        "tipo_treino": "Simples", "nome_treino": "Leitura após escrita", "aluno_id_aluno": aluno["id_aluno"]
+    })
+    assert criado.status_code == 200
+    assert criado.json()["aluno_nome"] == "Treino Causal"
+    treinos = cliente.get("/api/treinos", headers={"X-Consistencia": criado.headers["x-consistencia"]}).json()
+    assert criado.json()["id_treino"] in {t["id_treino"] for t in treinos}
+
+
+def test_leituras_vao_para_os_secundarios(api, replica_set):
+    _, cliente = api
+    antes = leituras_nos_secundarios(replica_set["secundarios"])
+    for _ in range(20):
+        assert cliente.get("/api/alunos").status_code == 200
+    assert leituras_nos_secundarios(replica_set["secundarios"]) - antes >= 20
+
+
+def test_escala_de_leitura(api):
+    """Throughput of concurrent list reads, secondaries vs primary only."""
+    server, cliente = api
+    from pymongo.read_preferences import Primary
+
+    async def rodada(total=300):
+        inicio = time.perf_counter()
+        await asyncio.gather(*(server.listar_treinos() for _ in range(total)))
+        return total / (time.perf_counter() - inicio)
+
+    secundarios = cliente.portal.call(rodada)
+    original = server.repo.db_leitura
+    server.repo.db_leitura = server.replicas.BancoLeitura(server.tenants, Primary())
+    try:
+        primario = cliente.portal.call(rodada)
+    finally:
+        server.repo.db_leitura = original
+
+    print(f"\nLeituras/s com secundários: {secundarios:.0f}; só primário: {primario:.0f}")
+    assert secundarios > 0 and primario > 0
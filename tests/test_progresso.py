@@ -0,0 +1,60 @@
+"""Per-aluno progress summaries, kept incrementally and rebuilt, on the SQLite API; runs without a mongod.
+
+    pytest tests/test_progresso.py
+"""
+from .conftest import criar_aluno, criar_instrutor, personalizado
+
+
+def progresso_do(cliente, aluno):
+    return next(a for a in cliente.get("/api/alunos").json() if a["id_aluno"] == aluno["id_aluno"])
+
+
+def test_progresso_acompanha_treinos(api):
+    _, cliente = api
+    aluno, instrutor = criar_aluno(cliente, "Progresso"), criar_instrutor(cliente)
+    ids = [
+        cliente.post(
+            "/api/treinos", json={**personalizado(aluno, instrutor, data=data), "nivel": nivel}
+        ).json()["id_treino"]
+        for data, nivel in (("2030-06-03", "Iniciante"), ("2030-06-10", "Intermediário"))
+    ]
+    for id_treino in ids:
+        assert cliente.patch(f"/api/treinos/{id_treino}/toggle-concluido").json()["concluido"] is True
+    resumo = progresso_do(cliente, aluno)
+    assert (resumo["treinos_total"], resumo["treinos_concluidos"]) == (2, 2)
+    assert (resumo["ultimo_treino"], resumo["nivel"]) == ("2030-06-10", "Intermediário")
+
+    # Removing the latest session falls back to the previous one
+    assert cliente.delete(f"/api/treinos/{ids[1]}").status_code == 200
+    resumo = progresso_do(cliente, aluno)
+    assert (resumo["treinos_total"], resumo["treinos_concluidos"]) == (1, 1)
+    assert (resumo["ultimo_treino"], resumo["nivel"]) == ("2030-06-03", "Iniciante")
+
+    cliente.patch(f"/api/treinos/{ids[0]}/toggle-concluido")
+    resumo = progresso_do(cliente, aluno)
+    assert (resumo["treinos_concluidos"], resumo["ultimo_treino"], resumo["nivel"]) == (0, None, None)
+
+
+def test_alunos_ordenados_e_filtrados_por_progresso(api):
+    _, cliente = api
+    instrutor = criar_instrutor(cliente)
+    ativo, parado = criar_aluno(cliente, "Ativo"), criar_aluno(cliente, "Parado")
+    for h in (6, 7, 8):
+        treino = cliente.post(
+            "/api/treinos", json=personalizado(ativo, instrutor, data="2030-07-01", inicio=f"0{h}:00", fim=f"0{h}:30")
+        ).json()
+        cliente.patch(f"/api/treinos/{treino['id_treino']}/toggle-concluido")
+
+    ordenados = [a["id_aluno"] for a in cliente.get("/api/alunos", params={"ordenar": "-treinos_concluidos"}).json()]
+    assert ordenados[0] == ativo["id_aluno"]
+    filtrados = {a["id_aluno"] for a in cliente.get("/api/alunos", params={"concluidos_min": 3}).json()}
+    assert ativo["id_aluno"] in filtrados and parado["id_aluno"] not in filtrados
+    assert cliente.get("/api/alunos", params={"ordenar": "idade"}).status_code == 400
+
+
+def test_reconstrucao_igual_ao_incremental(api):
+    server, cliente = api
+    antes = {a["id_aluno"]: a for a in cliente.get("/api/alunos").json()}
+    total = cliente.portal.call(server.repo.alunos.reconstruir_progresso, 2, 3)
+    assert total == len(antes)
+    assert {a["id_aluno"]: a for a in cliente.get("/api/alunos").json()} == antes
@@ -0,0 +1,71 @@
+"""Reference cache and invalidation channel against fake collections; runs without a mongod.
+
+    pytest tests/test_refcache.py
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+from bson import ObjectId
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import refcache  # noqa: E402
+
+
+class ColecaoLenta:
+    def __init__(self, docs, pausa=0.05):
+        self.docs = docs
+        self.pausa = pausa
+        self.falhar = False
+
+    async def find(self, filtro, projecao=None):
+        # Read before the pause, as a query that saw the old state
+        docs = [dict(d) for d in self.docs if d["_id"] in filtro["_id"]["$in"]]
+        await asyncio.sleep(self.pausa)
+        for doc in docs:
+            yield doc
+
+    async def insert_one(self, doc):
+        if self.falhar:
+            raise ConnectionError("canal indisponível")
+
+
+class BancoFalso:
+    name = "GymTrack_Teste"
+
+    def __init__(self, colecao):
+        self.colecao = colecao
+
+    def __getitem__(self, nome):
+        return self.colecao
+
+
+def test_preenchimento_anterior_a_invalidacao_nao_e_guardado():
+    oid = ObjectId()
+    colecao = ColecaoLenta([{"_id": oid, "nome": "Antigo"}])
+    db, cache = BancoFalso(colecao), refcache.ReferenceCache("alunos")
+
+    async def cenario():
+        leitura = asyncio.ensure_future(cache.get(db, str(oid)))
+        await asyncio.sleep(0.01)
+        # A write lands while the read-through query is running
+        colecao.docs = [{"_id": oid, "nome": "Novo"}]
+        cache.invalidate(db.name, str(oid))
+        antigo = await leitura
+        return antigo, await cache.get(db, str(oid))
+
+    antigo, novo = asyncio.run(cenario())
+    assert antigo["nome"] == "Antigo" and novo["nome"] == "Novo"
+    assert cache.stats()["size"] == 1
+
+
+def test_falha_no_canal_nao_propaga():
+    oid = ObjectId()
+    colecao = ColecaoLenta([], pausa=0)
+    colecao.falhar = True
+    cache = refcache.ReferenceCache("alunos")
+    canal = refcache.InvalidationChannel({"alunos": cache})
+    asyncio.run(canal.invalidar(BancoFalso(colecao), "alunos", str(oid)))
+    assert canal.falhas == 1 and cache.stats()["invalidations"] == 1
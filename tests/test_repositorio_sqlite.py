@@ -0,0 +1,154 @@
+"""The API on the embedded SQLite engine; runs without a mongod.
+
+    pytest tests/test_repositorio_sqlite.py
+"""
+from .conftest import criar_agenda, criar_aluno, criar_instrutor, personalizado
+
+
+def test_crud_de_alunos(api):
+    _, cliente = api
+    aluno = criar_aluno(cliente, "Crud Aluno", email="crud@gym.com")
+    assert cliente.post("/api/alunos", json={"nome": "Outro", "idade": 20, "email": "crud@gym.com"}).status_code == 400
+
+    atualizado = cliente.put(f"/api/alunos/{aluno['id_aluno']}", json={"idade": 33})
+    assert atualizado.json()["idade"] == 33
+    assert aluno["id_aluno"] in {a["id_aluno"] for a in cliente.get("/api/alunos").json()}
+
+    assert cliente.delete(f"/api/alunos/{aluno['id_aluno']}").status_code == 200
+    assert cliente.delete(f"/api/alunos/{aluno['id_aluno']}").status_code == 404
+
+
+def test_busca_ignora_acentos_e_ordena_por_relevancia(api):
+    _, cliente = api
+    criar_aluno(cliente, "José Álvaro")
+    criar_aluno(cliente, "Maria José")
+    nomes = [a["nome"] for a in cliente.get("/api/alunos/busca", params={"q": "jose"}).json()]
+    assert nomes[:2] == ["José Álvaro", "Maria José"]
+
+
+def test_conflito_de_horario_do_instrutor(api):
+    _, cliente = api
+    aluno, instrutor = criar_aluno(cliente), criar_instrutor(cliente)
+    primeiro = cliente.post("/api/treinos", json=personalizado(aluno, instrutor))
+    assert primeiro.status_code == 200
+    assert primeiro.json()["instrutor_nome"] == "Instrutor Teste"
+
+    sobreposto = cliente.post("/api/treinos", json=personalizado(aluno, instrutor, inicio="08:30", fim="09:30"))
+    assert sobreposto.status_code == 400
+    seguinte = cliente.post("/api/treinos", json=personalizado(aluno, instrutor, inicio="09:00", fim="10:00"))
+    assert seguinte.status_code == 200
+
+    movido = cliente.put(f"/api/treinos/{seguinte.json()['id_treino']}", json={"hora_inicio": "08:45"})
+    assert movido.status_code == 400
+
+
+def test_instrutores_disponiveis(api):
+    _, cliente = api
+    aluno = criar_aluno(cliente)
+    livre, ocupado = criar_instrutor(cliente, "Livre"), criar_instrutor(cliente, "Ocupado")
+    for instrutor in (livre, ocupado):
+        criar_agenda(cliente, instrutor)
+    cliente.post("/api/treinos", json=personalizado(aluno, ocupado, data="2030-02-01"))
+
+    disponiveis = cliente.get("/api/instrutores-disponiveis", params={
+        "data": "2030-02-01", "hora_inicio": "08:00", "hora_fim": "09:00"
+    }).json()
+    ids = {i["id_instrutor"] for i in disponiveis}
+    assert livre["id_instrutor"] in ids and ocupado["id_instrutor"] not in ids
+
+
+def test_bulk_de_treinos(api):
+    _, cliente = api
+    aluno, origem, destino = criar_aluno(cliente), criar_instrutor(cliente), criar_instrutor(cliente)
+    ids = [
+        cliente.post(
+            "/api/treinos", json=personalizado(aluno, origem, data="2030-03-01", inicio=f"0{h}:00", fim=f"0{h}:30")
+        ).json()["id_treino"]
+        for h in (6, 7)
+    ]
+    cliente.post("/api/treinos", json=personalizado(aluno, destino, data="2030-03-01", inicio="07:00", fim="08:00"))
+
+    concluidos = cliente.post(
+        "/api/treinos/bulk", json={"acao": "concluir", "ids": ids + ["invalido"], "concluido": True}
+    ).json()
+    assert (concluidos["sucesso"], concluidos["falhas"]) == (2, 1)
+
+    reatribuidos = cliente.post("/api/treinos/bulk", json={
+        "acao": "reatribuir", "ids": ids, "instrutor_id_instrutor": destino["id_instrutor"]
+    }).json()
+    assert [i["status"] for i in reatribuidos["itens"]] == ["ok", "conflito"]
+
+    removidos = cliente.post("/api/treinos/bulk", json={"acao": "deletar", "ids": ids}).json()
+    assert removidos["sucesso"] == 2
+
+
+def test_bulk_deletar_por_filtro_avisa_truncamento(api, monkeypatch):
+    server, cliente = api
+    aluno = criar_aluno(cliente, "Filtro")
+    for nome in ("a", "b", "c"):
+        cliente.post("/api/treinos", json={
+            "tipo_treino": "Simples", "nome_treino": nome, "aluno_id_aluno": aluno["id_aluno"]
+        })
+    monkeypatch.setattr(server, "BULK_LIMITE", 2)
+
+    pedido = {"acao": "deletar", "filtro": {"aluno_id_aluno": aluno["id_aluno"]}}
+    primeira = cliente.post("/api/treinos/bulk", json=pedido).json()
+    segunda = cliente.post("/api/treinos/bulk", json=pedido).json()
+    assert (primeira["sucesso"], primeira["truncado"]) == (2, True)
+    assert (segunda["sucesso"], segunda["truncado"]) == (1, False)
+
+
+def test_exclusao_de_instrutor_remove_dependentes(api):
+    _, cliente = api
+    aluno, instrutor = criar_aluno(cliente), criar_instrutor(cliente)
+    agenda = criar_agenda(cliente, instrutor)
+    treino = cliente.post("/api/treinos", json=personalizado(aluno, instrutor, data="2030-04-01")).json()
+
+    resposta = cliente.delete(f"/api/instrutores/{instrutor['id_instrutor']}").json()
+    assert resposta["id_job"] is None
+    assert treino["id_treino"] not in {t["id_treino"] for t in cliente.get("/api/treinos").json()}
+    assert agenda["id_agenda"] not in {a["id_agenda"] for a in cliente.get("/api/agendas-fixas").json()}
+
+
+def test_checkins_e_frequencia(api):
+    server, cliente = api
+    aluno = criar_aluno(cliente)
+    resposta = cliente.post("/api/checkins/batch", json={"checkins": [
+        {"aluno_id_aluno": aluno["id_aluno"], "momento": "2030-05-01T07:00:00Z"},
+        {"aluno_id_aluno": aluno["id_aluno"], "momento": "2030-05-01T18:00:00Z"},
+        {"aluno_id_aluno": "0" * 24, "momento": "2030-05-01T18:00:00Z"},
+    ]}).json()
+    assert resposta["aceitos"] == 2 and len(resposta["rejeitados"]) == 1
+
+    cliente.portal.call(server.buffer_checkins.flush)
+    frequencia = cliente.get("/api/checkins/frequencia", params={"data_inicio": "2030-05-01"}).json()
+    assert frequencia == [{"data": "2030-05-01", "checkins": 2}]
+    alunos = {a["id_aluno"]: a for a in cliente.get("/api/alunos").json()}
+    assert alunos[aluno["id_aluno"]]["ultimo_checkin"].startswith("2030-05-01T18:00:00")
+
+
+def test_exercicios_concluidos_nao_contam_como_chegada(api):
+    server, cliente = api
+    aluno, outro = criar_aluno(cliente), criar_aluno(cliente, "Outro")
+    treino = cliente.post("/api/treinos", json={
+        "tipo_treino": "Simples", "nome_treino": "Pernas", "aluno_id_aluno": aluno["id_aluno"]
+    }).json()
+    exercicio = {"tipo": "exercicio", "treino_id": treino["id_treino"], "exercicio": "Agachamento",
+                 "momento": "2030-06-01T08:00:00Z"}
+    resposta = cliente.post("/api/checkins/batch", json={"checkins": [
+        {"aluno_id_aluno": aluno["id_aluno"], **exercicio},
+        {"aluno_id_aluno": outro["id_aluno"], **exercicio},
+        {"aluno_id_aluno": aluno["id_aluno"], "tipo": "exercicio"},
+        {"aluno_id_aluno": aluno["id_aluno"], "tipo": "saida"},
+    ]}).json()
+    assert resposta["aceitos"] == 1 and [r["indice"] for r in resposta["rejeitados"]] == [1, 2, 3]
+
+    cliente.portal.call(server.buffer_checkins.flush)
+    assert cliente.get("/api/checkins/frequencia", params={"data_inicio": "2030-06-01"}).json() == []
+    alunos = {a["id_aluno"]: a for a in cliente.get("/api/alunos").json()}
+    assert alunos[aluno["id_aluno"]].get("ultimo_checkin") is None
+
+
+def test_jobs_exigem_mongo(api):
+    _, cliente = api
+    assert cliente.get("/api/jobs").status_code == 501
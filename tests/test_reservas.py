@@ -0,0 +1,92 @@
+"""Concurrent bookings of one instrutor slot: exactly one wins.
+
+The SQLite engine serializes them with BEGIN IMMEDIATE; on Mongo they go
+through reservas.reservar against a ``mongod`` started from the PATH (or
+``MONGOD_BIN``), skipped when it is not installed.
+
+    pytest tests/test_reservas.py
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import reservas  # noqa: E402
+from repositorio import ConflitoHorario  # noqa: E402
+from repositorio_sqlite import RepositorioSQLite  # noqa: E402
+from tenancy import TenantRouter  # noqa: E402
+
+CONCORRENTES = 20
+
+
+def treino(inicio="08:00", fim="09:00", instrutor="instrutor", data="2030-01-10"):
+    return {
+        "tipo_treino": "Personalizado", "nome_treino": "Força", "aluno_id_aluno": "aluno",
+        "instrutor_id_instrutor": instrutor, "data": data, "hora_inicio": inicio, "hora_fim": fim,
+    }
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    repo = RepositorioSQLite(tmp_path, TenantRouter(None, "Reservas"), threads=8)
+    asyncio.run(repo.inicializar())
+    yield repo
+    asyncio.run(repo.fechar())
+
+
+def test_sqlite_uma_reserva_vence(sqlite):
+    async def cenario():
+        async def tentar(i):
+            try:
+                return await sqlite.treinos.criar({**treino(inicio="08:00", fim=f"09:{i:02d}"), "nome_treino": str(i)})
+            except ConflitoHorario:
+                return None
+
+        resultados = await asyncio.gather(*(tentar(i) for i in range(CONCORRENTES)))
+        vencedores = [r for r in resultados if r is not None]
+        assert len(vencedores) == 1
+
+        # Moving the booking on the same day frees its old interval
+        vencedor = vencedores[0]
+        movido = await sqlite.treinos.atualizar(
+            vencedor["id_treino"], {"hora_inicio": "10:00", "hora_fim": "11:00"}, vencedor
+        )
+        assert movido["hora_inicio"] == "10:00"
+        outro = await sqlite.treinos.criar(treino())
+        with pytest.raises(ConflitoHorario):
+            await sqlite.treinos.atualizar(outro["id_treino"], {"hora_inicio": "10:30", "hora_fim": "11:30"}, outro)
+
+    asyncio.run(cenario())
+
+
+def test_mongo_uma_reserva_vence(mongo):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def cenario():
+        client = AsyncIOMotorClient(mongo)
+        colecao = client["GymTrack_Teste_Reservas"].reservas
+        try:
+            await colecao.drop()
+            # A fresh slot document: the losers of the upsert race take the DuplicateKeyError path
+            resultados = await asyncio.gather(*(
+                reservas.reservar(colecao, "instrutor", "2030-01-10", 480, 540 + i, f"t{i}")
+                for i in range(CONCORRENTES)
+            ))
+            assert resultados.count(True) == 1
+            vencedor = f"t{resultados.index(True)}"
+
+            # Moving the booking on the same day updates its interval in place
+            assert await reservas.reservar(colecao, "instrutor", "2030-01-10", 600, 660, vencedor)
+            doc = await colecao.find_one({"_id": reservas.chave_slot("instrutor", "2030-01-10")})
+            assert doc["intervalos"] == [{"treino_id": vencedor, "inicio": 600, "fim": 660}]
+            assert await reservas.reservar(colecao, "instrutor", "2030-01-10", 480, 540, "outro")
+            assert not await reservas.reservar(colecao, "instrutor", "2030-01-10", 630, 690, "outro")
+        finally:
+            await colecao.drop()
+            client.close()
+
+    asyncio.run(cenario())
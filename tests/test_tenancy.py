@@ -0,0 +1,113 @@
+"""Tenant resolution in TenantMiddleware; runs without a mongod.
+
+    pytest tests/test_tenancy.py
+"""
+import sys
+import asyncio
+from pathlib import Path
+
+import jwt
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+import tenancy  # noqa: E402
+
+SEGREDO, ALGORITMO = "segredo-de-teste-com-32-bytes-ok", "HS256"
+
+
+class AppTenant:
+    """ASGI app answering with the tenant it ran under."""
+
+    def __init__(self):
+        self.tenants = []
+
+    async def __call__(self, scope, receive, send):
+        self.tenants.append(tenancy.tenant_atual.get())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": tenancy.tenant_atual.get().encode()})
+
+
+class Inicializacao:
+    def __init__(self):
+        self.tenants = []
+
+    async def __call__(self):
+        await asyncio.sleep(0.01)
+        self.tenants.append(tenancy.tenant_atual.get())
+
+
+@pytest.fixture
+def middleware(monkeypatch):
+    monkeypatch.setattr(tenancy, "tenants_prontos", set())
+    monkeypatch.setattr(tenancy, "_locks", {})
+    monkeypatch.setattr(tenancy, "metricas_tenants", {})
+    app, inicializar = AppTenant(), Inicializacao()
+    router = tenancy.TenantRouter(None, "GymTrack_Teste", ["centro", "Invalido!"])
+    return tenancy.TenantMiddleware(app, router, SEGREDO, ALGORITMO, inicializar), app, inicializar
+
+
+def bearer(**claims) -> str:
+    return "Bearer " + jwt.encode({"admin_id": "a", **claims}, SEGREDO, algorithm=ALGORITMO)
+
+
+async def chamar(middleware, **headers):
+    enviados = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        enviados.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/api/alunos",
+             "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]}
+    await middleware(scope, receive, send)
+    status = next(m["status"] for m in enviados if m["type"] == "http.response.start")
+    return status, b"".join(m.get("body", b"") for m in enviados if m["type"] == "http.response.body")
+
+
+def test_tenant_do_token_do_header_ou_padrao(middleware):
+    mw, _, _ = middleware
+
+    async def cenario():
+        return [
+            await chamar(mw),
+            await chamar(mw, x_tenant="centro"),
+            await chamar(mw, authorization=bearer(tenant="centro")),
+            await chamar(mw, authorization=bearer()),
+            # An invalid token does not decide the tenant; verify_token rejects it later
+            await chamar(mw, authorization="Bearer invalido", x_tenant="centro"),
+        ]
+
+    assert asyncio.run(cenario()) == [
+        (200, b"default"), (200, b"centro"), (200, b"centro"), (200, b"default"), (200, b"centro"),
+    ]
+
+
+def test_header_que_contradiz_o_token_e_proibido(middleware):
+    mw, app, inicializar = middleware
+    status, corpo = asyncio.run(chamar(mw, authorization=bearer(tenant="centro"), x_tenant="default"))
+    assert status == 403 and "Tenant não corresponde" in corpo.decode()
+    assert app.tenants == [] and inicializar.tenants == []
+
+
+@pytest.mark.parametrize("tenant", ["outra", "../admin", "Invalido!"])
+def test_tenant_desconhecido_ou_malformado_e_invalido(middleware, tenant):
+    mw, app, inicializar = middleware
+    status, corpo = asyncio.run(chamar(mw, x_tenant=tenant))
+    assert status == 400 and "Tenant inválido" in corpo.decode()
+    assert app.tenants == [] and inicializar.tenants == []
+
+
+def test_inicializacao_uma_vez_por_tenant(middleware):
+    mw, app, inicializar = middleware
+
+    async def cenario():
+        await asyncio.gather(*(chamar(mw, x_tenant="centro") for _ in range(5)), chamar(mw), chamar(mw))
+
+    asyncio.run(cenario())
+    assert sorted(inicializar.tenants) == ["centro", "default"]
+    assert len(app.tenants) == 7
+    assert tenancy.metricas_tenants["centro"].stats()["requisicoes"] == 5